@@ -0,0 +1,69 @@
+# benchmarks/bench_estimators.py
+"""
+Compare the regressor backends of train_model on the water dataset:
+fit time, predict throughput, serialized model size and R²/RMSE.
+
+Run from the project root:
+    python -m benchmarks.bench_estimators
+    python -m benchmarks.bench_estimators --data "dataset/*.csv" --estimators random_forest
+"""
+
+import argparse
+import io
+import time
+
+import joblib
+from sklearn.model_selection import train_test_split
+
+import features
+import model_registry
+from spark_app import (
+    ESTIMATORS,
+    SPLIT_SEED,
+    TARGET_COL,
+    TEST_SIZE,
+    featurize_cached,
+    make_estimator,
+)
+
+DATA_PATH = "dataset/Water_Consumption_And_Cost__2013_-_Feb_2023_.csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data", default=DATA_PATH, help="CSV path or glob")
+    parser.add_argument("--estimators", nargs="+", default=list(ESTIMATORS))
+    args = parser.parse_args()
+
+    df = featurize_cached(args.data)
+    feature_cols = features.feature_columns(df)
+    X_train, X_test, y_train, y_test = train_test_split(
+        df[feature_cols], df[TARGET_COL], test_size=TEST_SIZE, random_state=SPLIT_SEED
+    )
+    print(f"{len(df):,} rows, {len(feature_cols)} features\n")
+
+    print(f"{'estimator':<24} {'fit (s)':>9} {'predict rows/s':>15} {'size (MB)':>10} {'R²':>8} {'RMSE':>10}")
+    for name in args.estimators:
+        model = make_estimator(name)
+
+        start = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        y_pred = model.predict(X_test)
+        predict_s = time.perf_counter() - start
+
+        buf = io.BytesIO()
+        joblib.dump(model, buf)
+        size_mb = buf.getbuffer().nbytes / 1024 ** 2
+
+        metrics = model_registry.regression_metrics(y_test, y_pred)
+        print(
+            f"{name:<24} {fit_s:>9.2f} {len(X_test) / predict_s:>15,.0f} "
+            f"{size_mb:>10.1f} {metrics['r2']:>8.4f} {metrics['rmse']:>10.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/bench_timestamp_parse.py
+"""
+Compare the old per-row Date_Time parser with the vectorized one.
+
+Run from the project root:
+    python -m benchmarks.bench_timestamp_parse --sizes 100000 1000000 10000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from spark_app import _parse_timestamp_series
+
+
+def _legacy_parse_timestamp_series(series: pd.Series) -> pd.Series:
+    """
+    Previous implementation (one pd.to_datetime call per row), kept here
+    only as the baseline for this benchmark.
+    """
+    series = series.astype(str)
+    series = series.replace(["NaN", "nan", "None", ""], pd.NA)
+
+    def parse_one(x: str):
+        if pd.isna(x):
+            return pd.NaT
+
+        formats = [
+            "%Y-%m-%d %H:%M:%S",
+            "%m/%d/%Y %H:%M",
+            "%d/%m/%Y %H:%M",
+            "%Y/%m/%d %H:%M",
+            "%m/%d/%Y",
+        ]
+        for fmt in formats:
+            try:
+                return pd.to_datetime(x, format=fmt)
+            except Exception:
+                continue
+        return pd.NaT
+
+    return series.apply(parse_one)
+
+
+def make_dates(n: int, seed: int = 42) -> pd.Series:
+    """
+    Mostly %m/%d/%Y (like the water extract) with a mix of the other
+    formats (day-first ones included, ambiguous up to the 12th), nulls and
+    garbage.
+    """
+    rng = np.random.default_rng(seed)
+    base = pd.Timestamp("2013-01-01")
+    stamps = base + pd.to_timedelta(rng.integers(0, 3650 * 24 * 60, n), unit="min")
+
+    kind = rng.choice(7, size=n, p=[0.76, 0.05, 0.04, 0.04, 0.04, 0.04, 0.03])
+    out = np.empty(n, dtype=object)
+    fmts = ["%m/%d/%Y", "%Y-%m-%d %H:%M:%S", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M", "%Y/%m/%d %H:%M"]
+    for k, fmt in enumerate(fmts):
+        mask = kind == k
+        out[mask] = stamps[mask].strftime(fmt)
+    out[kind == 5] = None
+    out[kind == 6] = "not a date"
+    return pd.Series(out)
+
+
+def check_day_month_order(n: int = 1_000) -> None:
+    """
+    An ambiguous "03/04/2020 10:00" must parse as 4 March (the canonical
+    order) even when the same source only held day-first dates before.
+    """
+    day_first = pd.Series(["25/12/2019 08:00"] * n)
+    ambiguous = pd.Series(["03/04/2020 10:00", "25/12/2019 08:00"] * (n // 2))
+    _parse_timestamp_series(day_first, source="bench-day-month")
+    cached = _parse_timestamp_series(ambiguous, source="bench-day-month")
+    fresh = _parse_timestamp_series(ambiguous)
+    assert cached.equals(fresh)
+    assert cached.iloc[0] == pd.Timestamp("2020-03-04 10:00")
+
+
+def _time(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument(
+        "--legacy-max-rows",
+        type=int,
+        default=1_000_000,
+        help="Skip the per-row baseline above this size (it takes hours at 10M).",
+    )
+    args = parser.parse_args()
+
+    check_day_month_order()
+
+    print(f"{'rows':>12} {'legacy (s)':>12} {'vectorized (s)':>16} {'cached (s)':>12} {'speedup':>9}")
+    for n in args.sizes:
+        dates = make_dates(n)
+
+        vec_s, vec = _time(_parse_timestamp_series, dates, source=f"bench-{n}")
+        cached_s, cached = _time(_parse_timestamp_series, dates, source=f"bench-{n}")
+        assert vec.equals(cached)
+
+        if n <= args.legacy_max_rows:
+            legacy_s, legacy = _time(_legacy_parse_timestamp_series, dates)
+            # Same NaT positions and same parsed values
+            assert legacy.isna().equals(vec.isna())
+            assert (pd.to_datetime(legacy[legacy.notna()]) == vec[vec.notna()]).all()
+            speedup = f"{legacy_s / vec_s:.1f}x"
+            legacy_txt = f"{legacy_s:.2f}"
+        else:
+            speedup = legacy_txt = "-"
+
+        print(f"{n:>12,} {legacy_txt:>12} {vec_s:>16.2f} {cached_s:>12.2f} {speedup:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/import_budget.py
+"""
+Import-time budget check: each entry module is imported in a fresh
+interpreter, timed, and checked not to pull in the heavy dependencies that
+are meant to load lazily (pyspark, scikit-learn, fpdf, pyplot). Exits
+non-zero if a module is over budget or imports one of them.
+
+Run from the project root:
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 500 --modules spark_app reports
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+# Modules whose import should stay fast (the dashboard and the CLIs)
+MODULES = ["spark_app", "reports", "charting", "forest_inference", "prediction_service", "streamlit_app"]
+# Dependencies only the code paths that use them may import
+LAZY_DEPS = ["pyspark", "sklearn", "fpdf", "matplotlib.pyplot"]
+# Frameworks imported before timing: their cost is not ours to budget
+PRELOAD = ["streamlit"]
+IMPORT_BUDGET_MS = 1000.0
+
+_CHILD = """
+import importlib, json, sys, time
+for name in {preload!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+preloaded = set(sys.modules)
+start = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - start
+new = set(sys.modules) - preloaded
+loaded = sorted({{dep for dep in {lazy!r} for m in new if m == dep or m.startswith(dep + ".")}})
+print(json.dumps({{"ms": elapsed * 1000, "lazy_loaded": loaded}}))
+"""
+
+
+def measure(module: str, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Median import time of `module` over `repeat` fresh interpreters, and
+    the LAZY_DEPS it loaded.
+    """
+    code = _CHILD.format(preload=PRELOAD, module=module, lazy=LAZY_DEPS)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+        if proc.returncode != 0:
+            return {"module": module, "error": proc.stderr.strip().splitlines()[-1]}
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        "module": module,
+        "ms": statistics.median(r["ms"] for r in runs),
+        "lazy_loaded": runs[-1]["lazy_loaded"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    print(f"{'module':<22} {'import (ms)':>12}  lazily loaded deps imported")
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        if "error" in result:
+            # A missing optional dependency (e.g. streamlit) is not a budget failure
+            print(f"{module:<22} {'skipped':>12}  {result['error']}")
+            continue
+        print(f"{module:<22} {result['ms']:>12.0f}  {', '.join(result['lazy_loaded']) or '-'}")
+        if result["ms"] > args.budget_ms:
+            failures.append(f"{module} took {result['ms']:.0f} ms (budget {args.budget_ms:.0f} ms)")
+        if result["lazy_loaded"]:
+            failures.append(f"{module} imports {', '.join(result['lazy_loaded'])} at import time")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/load_predict_service.py
+"""
+Load generator for prediction_service.py: many concurrent keep-alive
+clients POST records to /predict; client-side p50/p99 latency and
+throughput are printed next to the service's own /metrics.
+
+Start the service first, then from the project root:
+    python -m benchmarks.load_predict_service
+    python -m benchmarks.load_predict_service --concurrency 64 --requests 5000 --records 1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+import features
+
+
+async def _http(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1")
+        + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def _client(host, port, n_requests, make_payload, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            status, _ = await _http(reader, writer, "POST", "/predict", make_payload())
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, health = await _http(reader, writer, "GET", "/health")
+    feature_cols = health["feature_cols"]
+    # Categories (sent by value instead of their code column) and segment
+    # keys take strings from the model's vocabulary; everything else numbers
+    values = health.get("category_values", {})
+    text_cols = list(health.get("category_cols", [])) + [
+        c for c in health.get("key_cols", []) if c not in health.get("category_cols", [])
+    ]
+    coded = {features.code_column(c) for c in health.get("category_cols", [])}
+    number_cols = [c for c in feature_cols if c not in text_cols and c not in coded]
+
+    rng = random.Random(args.seed)
+
+    def make_record():
+        record = {c: rng.uniform(0, 100) for c in number_cols}
+        record.update({c: rng.choice(values.get(c) or ["UNKNOWN"]) for c in text_cols})
+        return record
+
+    def make_payload():
+        return {"records": [make_record() for _ in range(args.records)]}
+
+    latencies, errors = [], []
+    per_client = [args.requests // args.concurrency] * args.concurrency
+    for i in range(args.requests % args.concurrency):
+        per_client[i] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(args.host, args.port, n, make_payload, latencies, errors)
+        for n in per_client if n
+    ))
+    elapsed = time.perf_counter() - start
+
+    _, metrics = await _http(reader, writer, "GET", "/metrics")
+    writer.close()
+
+    lat = np.asarray(latencies) if latencies else np.zeros(1)
+    print(f"model: {health['model']} ({len(feature_cols)} features)")
+    print(
+        f"{len(latencies)} ok / {len(errors)} failed requests in {elapsed:.2f}s "
+        f"({args.concurrency} clients, {args.records} record(s) each)"
+    )
+    print(
+        f"client: p50 {np.percentile(lat, 50):.2f} ms  p99 {np.percentile(lat, 99):.2f} ms  "
+        f"{len(latencies) / elapsed:,.0f} req/s  {len(latencies) * args.records / elapsed:,.0f} records/s"
+    )
+    print(f"service /metrics: {json.dumps(metrics)}")
+    if errors and not latencies:
+        raise SystemExit(f"Every request failed (statuses: {sorted(set(errors))})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--records", type=int, default=1, help="Records per request")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# benchmarks/run_suite.py
+"""
+Reproducible benchmark of the pipeline on seeded synthetic water bills
+(see benchmarks/synthetic_data.py): every stage timed on its own, then the
+whole pipeline end to end, on a local Spark master. Results (wall/CPU time,
+peak RSS, rows per stage) are written as JSON for comparing runs.
+
+Run from the project root (no network needed):
+    python -m benchmarks.run_suite --sizes 10000 100000 1000000
+    python -m benchmarks.run_suite --sizes 100000 --repeat 3 --compare benchmarks/results/base.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+import features
+import profiling
+from benchmarks.synthetic_data import write_water_csv
+from charting import render_png
+from spark_app import (
+    CACHE_DIR,
+    DEFAULT_ESTIMATOR,
+    ESTIMATORS,
+    RENAME_MAP,
+    _parse_timestamp_series,
+    get_spark,
+    predict_with_model,
+    preprocess_with_spark,
+    run_full_pipeline_from_df,
+    train_model,
+)
+import water_schema
+
+DATA_DIR = os.path.join("benchmarks", "data")
+RESULTS_DIR = os.path.join("benchmarks", "results")
+CHART_KINDS = ["time_series", "scatter", "error_hist"]
+
+
+def _environment(args) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    versions = {}
+    for name in ["pandas", "numpy", "sklearn", "pyspark", "pyarrow", "matplotlib"]:
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "versions": versions,
+        "seed": args.seed,
+        "spark_master": args.master,
+        "estimator": args.estimator,
+        "repeat": args.repeat,
+    }
+
+
+def _measure(name: str, fn: Callable[[], Any], records: List[Dict[str, Any]], rows=None):
+    with profiling.run(name) as run_records:
+        result = fn()
+    run_records[0]["rows"] = rows(result) if callable(rows) else rows
+    records.extend(run_records)
+    return result
+
+
+def bench_size(path: str, args) -> List[Dict[str, Any]]:
+    """
+    One pass over every stage for the CSV at `path`; returns the stage
+    records (top-level stage plus any nested ones it reports).
+    """
+    records: List[Dict[str, Any]] = []
+
+    raw_dates = pd.read_csv(path, usecols=["Service End Date"], dtype=str)["Service End Date"]
+    _measure("timestamp_parse", lambda: _parse_timestamp_series(raw_dates), records, rows=len)
+    _measure("read_csv_typed", lambda: water_schema.read_water_csv(path), records, rows=len)
+
+    # Frame path as for an upload: plain pandas read, dates still strings
+    raw = _measure("read_csv_pandas", lambda: pd.read_csv(path), records, rows=len)
+    cleaned = _measure(
+        "preprocess_spark_frame",
+        lambda: preprocess_with_spark(raw.rename(columns=RENAME_MAP)),
+        records,
+        rows=len,
+    )
+    _measure("preprocess_spark_csv", lambda: preprocess_with_spark(path), records, rows=len)
+    featurized = _measure("features", lambda: features.add_features(cleaned), records, rows=len)
+    model, _ = _measure(
+        "train",
+        lambda: train_model(featurized, force_retrain=True, estimator=args.estimator),
+        records,
+        rows=len(featurized),
+    )
+    predicted = _measure("predict", lambda: predict_with_model(model, featurized), records, rows=len)
+    for kind in CHART_KINDS:
+        _measure(f"chart_{kind}", lambda: render_png(kind, predicted), records, rows=len(predicted))
+
+    # End to end: once with an empty cache, once served from it
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    _measure(
+        "end_to_end_cold",
+        lambda: run_full_pipeline_from_df(path, force_retrain=True, estimator=args.estimator),
+        records,
+        rows=lambda result: len(result[0]),
+    )
+    _measure(
+        "end_to_end_warm",
+        lambda: run_full_pipeline_from_df(path, estimator=args.estimator),
+        records,
+        rows=lambda result: len(result[0]),
+    )
+    return records
+
+
+def summarize(passes: List[List[Dict[str, Any]]]) -> Dict[str, Dict[str, float]]:
+    """
+    Median / min wall time, median CPU time and max peak RSS per top-level
+    stage over the repeated passes.
+    """
+    by_stage: Dict[str, List[Dict[str, Any]]] = {}
+    for records in passes:
+        for rec in records:
+            if rec["depth"] == 0:
+                by_stage.setdefault(rec["stage"], []).append(rec)
+    return {
+        name: {
+            "wall_s_median": statistics.median(r["wall_s"] for r in recs),
+            "wall_s_min": min(r["wall_s"] for r in recs),
+            "cpu_s_median": statistics.median(r["cpu_s"] for r in recs),
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in recs),
+            "rows": recs[0]["rows"],
+        }
+        for name, recs in by_stage.items()
+    }
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    base = {(r["rows"], stage): s for r in baseline["results"] for stage, s in r["summary"].items()}
+
+    print(f"\nvs {baseline_path} ({baseline['environment'].get('git_commit')})")
+    print(f"{'rows':>10} {'stage':<24} {'base (s)':>10} {'now (s)':>10} {'ratio':>7}")
+    for r in current["results"]:
+        for stage, s in r["summary"].items():
+            old = base.get((r["rows"], stage))
+            if old is None:
+                continue
+            ratio = s["wall_s_median"] / old["wall_s_median"] if old["wall_s_median"] else float("nan")
+            print(f"{r['rows']:>10,} {stage:<24} {old['wall_s_median']:>10.3f} {s['wall_s_median']:>10.3f} {ratio:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="Passes per size (median is reported)")
+    parser.add_argument("--master", default="local[*]", help="Spark master; local by default")
+    parser.add_argument("--estimator", default=DEFAULT_ESTIMATOR, choices=sorted(ESTIMATORS))
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Where generated CSVs are kept between runs")
+    parser.add_argument("--output", help=f"Results JSON (default: {RESULTS_DIR}/bench-<time>.json)")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data_dir)
+    output = os.path.abspath(
+        args.output or os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    )
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    environment = _environment(args)
+
+    # Cache, model registry etc. go to a scratch directory, not the project's
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="water-bench-")
+    os.chdir(work_dir)
+
+    results = []
+    try:
+        with profiling.run("spark_session") as session_records:
+            get_spark("Water_Bill_Benchmarks", master=args.master)
+        environment["spark_session_s"] = session_records[0]["wall_s"]
+
+        for n in args.sizes:
+            with profiling.run("generate") as gen_records:
+                path = write_water_csv(os.path.join(data_dir, f"water_{n}_s{args.seed}.csv"), n, seed=args.seed)
+            passes = [bench_size(path, args) for _ in range(args.repeat)]
+            summary = summarize(passes)
+            results.append({
+                "rows": n,
+                "csv_mb": os.path.getsize(path) / 1024 ** 2,
+                "generate_s": gen_records[0]["wall_s"],
+                "summary": summary,
+                "passes": passes,
+            })
+
+            print(f"\n{n:,} rows")
+            for stage, s in summary.items():
+                print(f"  {stage:<24} {s['wall_s_median']:>9.3f}s wall {s['cpu_s_median']:>9.3f}s cpu "
+                      f"{s['peak_rss_mb']:>9.0f} MB peak")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"environment": environment, "results": results}
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\nResults written to {output}")
+
+    if baseline:
+        compare(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# benchmarks/synthetic_data.py
+"""
+Seeded generator of CSVs shaped like Water_Consumption_And_Cost__2013_-_Feb_2023_.csv:
+same columns, monthly bills per development/meter, mixed Service End Date
+formats, nulls, garbage dates and duplicated rows.
+
+Run from the project root:
+    python -m benchmarks.synthetic_data --rows 1000000 --output /tmp/water_1m.csv
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Column order of the real extract
+COLUMNS = [
+    "Development Name", "Borough", "Account Name", "Location", "Meter AMR",
+    "Meter Scope", "TDS #", "EDP", "RC Code", "Funding Source", "AMP #",
+    "Vendor Name", "UMIS BILL ID", "Revenue Month", "Service Start Date",
+    "Service End Date", "# days", "Meter Number", "Estimated", "Current Charges",
+    "Rate Class", "Bill Analyzed", "Consumption (HCF)", "Water&Sewer Charges",
+    "Other Charges",
+]
+
+BOROUGHS = ["BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", "STATEN ISLAND", "FHA"]
+RATE_CLASSES = ["Basic Water and Sewer", "Multiple Dwelling Conservation Program", "Commercial"]
+FUNDING_SOURCES = ["FEDERAL", "SECTION 8", "MIXED FINANCE/LLC1", "CITY"]
+VENDORS = ["NEW YORK CITY WATER BOARD"]
+
+# Share of Service End Date values per format; the rest are null or garbage
+DATE_FORMATS = [("%m/%d/%Y", 0.90), ("%Y-%m-%d %H:%M:%S", 0.03), ("%m/%d/%Y %H:%M", 0.02), ("%Y/%m/%d %H:%M", 0.02)]
+BAD_DATE_FRAC = 0.01
+NULL_FRAC = 0.02
+DUP_FRAC = 0.01
+# Rows generated per chunk, so large files never sit in memory at once
+CHUNK_ROWS = 500_000
+# Average bills per meter, which sets how many accounts the lag features see
+BILLS_PER_METER = 60
+
+
+def _strftime(stamps: pd.DatetimeIndex, fmt: str) -> np.ndarray:
+    # Only a few thousand distinct days: format those once and gather
+    uniq, inverse = np.unique(stamps.to_numpy(), return_inverse=True)
+    return pd.DatetimeIndex(uniq).strftime(fmt).to_numpy(dtype=object)[inverse]
+
+
+def _format_dates(stamps: pd.DatetimeIndex, rng: np.random.Generator) -> np.ndarray:
+    n = len(stamps)
+    probs = [p for _, p in DATE_FORMATS]
+    kind = rng.choice(len(DATE_FORMATS) + 2, size=n, p=probs + [NULL_FRAC, BAD_DATE_FRAC])
+    out = np.empty(n, dtype=object)
+    for k, (fmt, _) in enumerate(DATE_FORMATS):
+        mask = kind == k
+        out[mask] = _strftime(stamps[mask], fmt)
+    out[kind == len(DATE_FORMATS)] = None
+    out[kind == len(DATE_FORMATS) + 1] = "N/A"
+    return out
+
+
+def _with_nulls(values: np.ndarray, rng: np.random.Generator, frac: float = NULL_FRAC) -> np.ndarray:
+    values = values.astype(object)
+    values[rng.random(len(values)) < frac] = None
+    return values
+
+
+def generate_water_frame(n_rows: int, seed: int = 42, chunk: int = 0) -> pd.DataFrame:
+    """
+    `n_rows` bills (duplicates included) as strings/numbers like the raw
+    CSV. The same (seed, chunk) always gives the same frame.
+    """
+    rng = np.random.default_rng([seed, chunk])
+    n_unique = max(1, int(round(n_rows / (1 + DUP_FRAC))))
+
+    # Accounts: meters grouped into developments; each meter bills monthly
+    n_meters = max(1, n_unique // BILLS_PER_METER)
+    n_devs = max(1, n_meters // 8)
+    meter = rng.integers(0, n_meters, n_unique)
+    dev = meter % n_devs
+    dev_borough = np.asarray(BOROUGHS)[np.random.default_rng(seed).integers(0, len(BOROUGHS), n_devs)]
+
+    month = rng.integers(0, 122, n_unique)  # Jan 2013 .. Feb 2023
+    offset_days = month * 30 + rng.integers(0, 28, n_unique)
+    end = pd.DatetimeIndex(pd.Timestamp("2013-01-01") + pd.to_timedelta(offset_days, unit="D"))
+    days = rng.integers(27, 35, n_unique)
+    start = end - pd.to_timedelta(days, unit="D")
+
+    consumption = np.round(rng.gamma(2.0, 40.0, n_unique), 0)
+    rate = np.where(rng.random(n_unique) < 0.9, 10.58, 12.20)
+    ws_charges = np.round(consumption * rate, 2)
+    other = np.round(np.where(rng.random(n_unique) < 0.1, rng.gamma(1.5, 20.0, n_unique), 0.0), 2)
+
+    df = pd.DataFrame({
+        "Development Name": np.char.add("DEVELOPMENT ", (chunk * n_devs + dev).astype(str)),
+        "Borough": dev_borough[dev],
+        "Account Name": np.char.add("ACCOUNT ", (chunk * n_devs + dev).astype(str)),
+        "Location": _with_nulls(np.char.add("BLD ", (meter % 12).astype(str)), rng),
+        "Meter AMR": rng.choice(["AMR", "NONE", "BMS"], n_unique, p=[0.85, 0.1, 0.05]),
+        "Meter Scope": _with_nulls(rng.choice(["BLD 01", "BLD 02", "COMMUNITY CENTER"], n_unique), rng),
+        "TDS #": 100 + dev,
+        "EDP": 200 + dev,
+        "RC Code": np.char.add("B0", (dev % 90).astype(str)),
+        "Funding Source": rng.choice(FUNDING_SOURCES, n_unique),
+        "AMP #": np.char.add("NY00", (dev % 500).astype(str)),
+        "Vendor Name": rng.choice(VENDORS, n_unique),
+        "UMIS BILL ID": chunk * 10 ** 9 + np.arange(n_unique),
+        "Revenue Month": _strftime(end, "%Y-%m"),
+        "Service Start Date": _with_nulls(_strftime(start, "%m/%d/%Y"), rng, NULL_FRAC / 4),
+        "Service End Date": _format_dates(end, rng),
+        "# days": days.astype(float),
+        "Meter Number": (chunk * n_meters + meter).astype(str),
+        "Estimated": rng.choice(["N", "Y"], n_unique, p=[0.93, 0.07]),
+        "Current Charges": _with_nulls(np.round(ws_charges + other, 2), rng),
+        "Rate Class": rng.choice(RATE_CLASSES, n_unique, p=[0.8, 0.15, 0.05]),
+        "Bill Analyzed": rng.choice(["Yes", "No"], n_unique),
+        "Consumption (HCF)": _with_nulls(consumption, rng),
+        "Water&Sewer Charges": ws_charges,
+        "Other Charges": other,
+    }, columns=COLUMNS)
+
+    # Exact duplicate rows, as re-sent bills appear in the real extract
+    dups = df.iloc[rng.integers(0, n_unique, n_rows - n_unique)]
+    df = pd.concat([df, dups], ignore_index=True)
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+
+def write_water_csv(path: str, n_rows: int, seed: int = 42) -> str:
+    """
+    Write `n_rows` synthetic bills to `path` in CHUNK_ROWS pieces.
+    Skipped if the file already exists (same path, rows and seed give the
+    same bytes).
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    for i, start in enumerate(range(0, n_rows, CHUNK_ROWS)):
+        chunk = generate_water_frame(min(CHUNK_ROWS, n_rows - start), seed=seed, chunk=i)
+        chunk.to_csv(tmp_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmarks/data/water_synthetic.csv")
+    args = parser.parse_args()
+    print(write_water_csv(args.output, args.rows, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
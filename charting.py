@@ -0,0 +1,215 @@
+# charting.py
+"""
+Dashboard / report charts. Data is reduced to a point budget first
+(LTTB, hexbin density, precomputed histogram bins), so render time depends
+on the budget rather than on the number of bills.
+
+Matplotlib only, no Streamlit: report workers import this module too.
+pyplot is imported by the plot functions, on the first chart drawn.
+"""
+
+import io
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import features
+
+
+# Default number of points drawn per series / scatter
+POINT_BUDGET = 2000
+# Hexagons across the x axis when the scatter becomes a density plot
+HEXBIN_GRIDSIZE = 60
+HIST_BINS = 40
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `n_out` points of the
+    x-sorted series (x, y) that keep its visual shape. The first and last
+    points are always kept; from each bucket in between the point forming
+    the largest triangle with the previously kept point and the mean of
+    the next bucket is picked.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket boundaries over the points between the first and the last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nxt_lo, nxt_hi = hi, edges[b + 2] if b + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+
+        area = np.abs(
+            (x[prev] - avg_x) * (y[lo:hi] - y[prev])
+            - (x[prev] - x[lo:hi]) * (avg_y - y[prev])
+        )
+        prev = lo if np.isnan(area).all() else lo + int(np.nanargmax(area))
+        out[b + 1] = prev
+    return out
+
+
+def downsample_series(
+    ts: pd.Series, values: pd.Series, max_points: int = POINT_BUDGET
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sort (ts, values) by time and reduce them to at most `max_points`
+    points with LTTB. Works on the arrays only; the frame is never copied.
+    """
+    order = np.argsort(ts.to_numpy(), kind="stable")
+    t = ts.to_numpy()[order]
+    v = values.to_numpy(dtype=np.float64, na_value=np.nan)[order]
+
+    keep = ~np.isnan(v) & ~pd.isna(t)
+    t, v = t[keep], v[keep]
+    idx = lttb_indices(t.astype("datetime64[ns]").astype(np.int64), v, max_points)
+    return t[idx], v[idx]
+
+
+def histogram_counts(values: pd.Series, bins: int = HIST_BINS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bin counts and edges, computed once with NumPy so the chart draws a
+    single step artist instead of re-binning inside Matplotlib.
+    """
+    v = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    v = v[np.isfinite(v)]
+    if not len(v):
+        return np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1)
+    return np.histogram(v, bins=bins)
+
+
+def plot_time_series(df, max_points=POINT_BUDGET):
+    import matplotlib.pyplot as plt
+
+    if features.TIMESTAMP_COL not in df.columns or features.TARGET_COL not in df.columns:
+        return None
+    ts = df[features.TIMESTAMP_COL]
+    if not pd.api.types.is_datetime64_any_dtype(ts):
+        ts = pd.to_datetime(ts)
+
+    fig, ax = plt.subplots(figsize=(8, 3))
+    # Each series reduced to the point budget with LTTB
+    x, y = downsample_series(ts, df[features.TARGET_COL], max_points)
+    ax.plot(x, y, label="Actual Bill", linewidth=1.2)
+    if features.PREDICTION_COL in df.columns:
+        x, y = downsample_series(ts, df[features.PREDICTION_COL], max_points)
+        ax.plot(
+            x,
+            y,
+            linestyle="--",
+            label="Predicted Bill",
+            linewidth=1.1,
+        )
+    ax.set_title("Actual vs Predicted Bill Over Time")
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Amount")
+    ax.legend()
+    plt.xticks(rotation=25)
+    plt.tight_layout()
+    return fig
+
+
+def plot_cube_time_series(cube_rows):
+    """
+    Monthly mean actual vs predicted bill from analytics cube rows
+    (one dimension value), with the 10-90% error band around the prediction.
+    """
+    import matplotlib.pyplot as plt
+
+    if cube_rows.empty:
+        return None
+    monthly = cube_rows.sort_values("Month")
+    actual = monthly["Actual_Total"] / monthly["Bills"]
+    predicted = monthly["Predicted_Total"] / monthly["Bills"]
+
+    fig, ax = plt.subplots(figsize=(8, 3))
+    ax.plot(monthly["Month"], actual, label="Actual Bill (mean)", linewidth=1.2)
+    ax.plot(monthly["Month"], predicted, linestyle="--", label="Predicted Bill (mean)", linewidth=1.1)
+    if "Error_P10" in monthly.columns and "Error_P90" in monthly.columns:
+        ax.fill_between(
+            monthly["Month"],
+            actual + monthly["Error_P10"],
+            actual + monthly["Error_P90"],
+            alpha=0.2,
+            label="Prediction error P10–P90",
+        )
+    ax.set_title("Actual vs Predicted Bill Over Time")
+    ax.set_xlabel("Month")
+    ax.set_ylabel("Amount")
+    ax.legend()
+    plt.xticks(rotation=25)
+    plt.tight_layout()
+    return fig
+
+
+def plot_actual_vs_pred_scatter(df, max_points=POINT_BUDGET):
+    import matplotlib.pyplot as plt
+
+    if features.PREDICTION_COL not in df.columns or features.TARGET_COL not in df.columns:
+        return None
+    fig, ax = plt.subplots(figsize=(4.5, 3.2))
+    if len(df) <= max_points:
+        ax.scatter(df[features.TARGET_COL], df[features.PREDICTION_COL], alpha=0.4)
+    else:
+        # Density instead of one marker per bill
+        hb = ax.hexbin(
+            df[features.TARGET_COL].to_numpy(dtype="float64", na_value=float("nan")),
+            df[features.PREDICTION_COL].to_numpy(dtype="float64"),
+            gridsize=HEXBIN_GRIDSIZE,
+            bins="log",
+            mincnt=1,
+        )
+        fig.colorbar(hb, ax=ax, label="Bills")
+    ax.set_title("Actual vs Predicted (Scatter)")
+    ax.set_xlabel("Actual Bill")
+    ax.set_ylabel("Predicted Bill")
+    plt.tight_layout()
+    return fig
+
+
+def plot_error_hist(df):
+    import matplotlib.pyplot as plt
+
+    if features.PREDICTION_COL not in df.columns or features.TARGET_COL not in df.columns:
+        return None
+    errors = df[features.PREDICTION_COL] - df[features.TARGET_COL]
+    counts, edges = histogram_counts(errors, bins=HIST_BINS)
+    fig, ax = plt.subplots(figsize=(4.5, 3.2))
+    ax.stairs(counts, edges, fill=True)
+    ax.set_title("Prediction Error Distribution")
+    ax.set_xlabel("Error (Predicted - Actual)")
+    ax.set_ylabel("Frequency")
+    plt.tight_layout()
+    return fig
+
+
+def render_png(kind: str, df: pd.DataFrame, max_points: int = POINT_BUDGET) -> Optional[bytes]:
+    """
+    Render one chart kind ('time_series', 'cube_time_series', 'scatter',
+    'error_hist') to PNG bytes; None when `df` lacks the needed columns.
+    """
+    import matplotlib.pyplot as plt
+
+    plotters = {
+        "time_series": lambda data: plot_time_series(data, max_points),
+        "cube_time_series": plot_cube_time_series,
+        "scatter": lambda data: plot_actual_vs_pred_scatter(data, max_points),
+        "error_hist": plot_error_hist,
+    }
+    fig = plotters[kind](df)
+    if fig is None:
+        return None
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
@@ -1,46 +1,317 @@
+import argparse
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
 import pandas as pd
 
-# Load dataset
-# Load dataset
-df = pd.read_csv("dataset/Water_Consumption_And_Cost__2013_-_Feb_2023_.csv")
+import data_lake
+from water_schema import (
+    CATEGORY_COLS,
+    CLEANED_NUMERIC_DTYPES,
+    CURRENCY_COLS,
+    NUMERIC_COLS,
+    TEXT_COLS,
+    memory_mb,
+    read_water_csv,
+)
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+INPUT_PATH = "dataset/Water_Consumption_And_Cost__2013_-_Feb_2023_.csv"
+OUTPUT_PATH = "dataset/water_bill_data_clean.csv"
 
 # Rename columns to match the expected schema
-df = df.rename(columns={
+RENAME_MAP = {
     "Service End Date": "Date_Time",
     "Current Charges": "Water_Bill_Amount"
-})
+}
+
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def _target_col(columns) -> str:
+    # Note: The dataset might still have 'Charging_Load_kW' if not manually updated.
+    # We check for both potential names.
+    if "Charging_Load_kW" in columns:
+        return "Charging_Load_kW"
+    return "Water_Bill_Amount"
+
+
+def clean_in_memory(
+    input_path: str,
+    output_path: str,
+    lake: bool = False,
+    partition_by: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Original behaviour: load the whole CSV, clean it and save it.
+    With `lake`, `output_path` is a data_lake table partitioned by
+    year/month (+ `partition_by`) instead of a single file.
+    """
+    # Load dataset (categories, downcast numerics and dates from water_schema)
+    df = read_water_csv(input_path)
+    df = df.rename(columns=RENAME_MAP)
+
+    # 1️⃣ Drop duplicates
+    df = df.drop_duplicates()
+
+    # 2️⃣ Drop empty or all-NaN columns
+    df = df.dropna(axis=1, how="all")
+
+    # 3️⃣ Convert Date_Time column to datetime
+    df["Date_Time"] = pd.to_datetime(df["Date_Time"], errors="coerce")
+
+    # 4️⃣ Remove rows where Date_Time couldn’t be parsed
+    df = df.dropna(subset=["Date_Time"])
+
+    # 5️⃣ Convert numeric fields safely (dates and text columns are left alone)
+    df = _coerce_columns(df.reset_index(drop=True))
+
+    # 6️⃣ Drop rows with missing target values (or replace with mean)
+    target_col = _target_col(df.columns)
+    if target_col in df.columns:
+        df[target_col] = df[target_col].fillna(df[target_col].mean())
+
+    _write(df, output_path, lake=lake, partition_by=partition_by)
+    return df
+
+
+def _write(
+    df: pd.DataFrame,
+    output_path: str,
+    lake: bool = False,
+    partition_by: Optional[List[str]] = None,
+) -> None:
+    if lake:
+        data_lake.write_partitioned(df, output_path, partition_by=partition_by)
+    elif output_path.endswith(".parquet"):
+        df.to_parquet(output_path, index=False)
+    else:
+        df.to_csv(output_path, index=False)
+
+
+class _SeenRows:
+    """
+    Hashes of the rows already written, as a sorted uint64 array: 8 bytes
+    per unique row (twice that briefly while a chunk is merged in).
+    """
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=bool)
+        pos = np.searchsorted(self.hashes, hashes).clip(max=len(self.hashes) - 1)
+        return self.hashes[pos] == hashes
+
+    def add(self, hashes: np.ndarray) -> None:
+        new = np.sort(hashes)
+        self.hashes = np.insert(self.hashes, np.searchsorted(self.hashes, new), new)
+
+
+def _row_hashes(chunk: pd.DataFrame) -> np.ndarray:
+    # Hash one canonical dtype per kind: the same row read as int8 in one
+    # chunk and float32 (it had NaNs) in another must hash the same
+    canonical = {}
+    for col in chunk.columns:
+        s = chunk[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            canonical[col] = s.astype("datetime64[ns]")
+        elif pd.api.types.is_numeric_dtype(s):
+            canonical[col] = s.astype("float64")
+        else:
+            canonical[col] = s.astype("string")
+    frame = pd.DataFrame(canonical, index=chunk.index)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy(dtype=np.uint64)
 
-# 1️⃣ Drop duplicates
-df = df.drop_duplicates()
 
-# 2️⃣ Drop empty or all-NaN columns
-df = df.dropna(axis=1, how="all")
+def _coerce_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Step 5 of both modes, giving them one output schema that keeps the
+    water_schema types: dates as datetime64[ns], categories as 'category'
+    (each chunk has its own categories; see _parquet_schema), identifiers
+    as strings, declared numerics as CLEANED_NUMERIC_DTYPES (money stays
+    float64) and every other column coerced to float64.
+    """
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            df[col] = s.astype("datetime64[ns]")
+        elif col in CATEGORY_COLS:
+            df[col] = s.astype("category")
+        elif col in TEXT_COLS:
+            df[col] = s.astype("string")
+        elif col in NUMERIC_COLS and col not in CURRENCY_COLS:
+            kind = NUMERIC_COLS[col]
+            values = pd.to_numeric(s, errors="coerce")
+            if kind == "integer":
+                # Fractional values are coerced to NA, like unparseable text
+                values = values.where(values % 1 == 0)
+            df[col] = values.astype(CLEANED_NUMERIC_DTYPES[kind])
+        elif pd.api.types.is_numeric_dtype(s):
+            df[col] = s.astype("float64")
+        else:
+            df[col] = pd.to_numeric(s, errors="coerce").astype("float64")
+    return df
 
-# 3️⃣ Convert Date_Time column to datetime
-df["Date_Time"] = pd.to_datetime(df["Date_Time"], errors="coerce")
 
-# 4️⃣ Remove rows where Date_Time couldn’t be parsed
-df = df.dropna(subset=["Date_Time"])
+def _parquet_schema(chunk: pd.DataFrame) -> "pa.Schema":
+    """
+    Parquet schema of the first chunk, with 32-bit dictionary indices for
+    the categories: later chunks may hold more categories than fit the
+    index width pyarrow picked for the first one.
+    """
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    fields = [
+        pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type)) if pa.types.is_dictionary(f.type) else f
+        for f in schema
+    ]
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def _clean_chunk(chunk: pd.DataFrame, seen: _SeenRows) -> pd.DataFrame:
+    """
+    Steps 1, 3, 4 and 5 of clean_in_memory for one chunk. `seen` holds the
+    row hashes of every earlier chunk so duplicates across chunks are dropped.
+    """
+    chunk = chunk.rename(columns=RENAME_MAP)
+
+    # 1️⃣ Drop duplicates (within the chunk and against earlier chunks)
+    hashes = _row_hashes(chunk)
+    keep = ~pd.Series(hashes).duplicated().to_numpy() & ~seen.contains(hashes)
+    seen.add(hashes[keep])
+    chunk = chunk[keep]
+
+    # 3️⃣ + 4️⃣ Parse Date_Time and drop unparseable rows
+    chunk["Date_Time"] = pd.to_datetime(chunk["Date_Time"], errors="coerce")
+    chunk = chunk.dropna(subset=["Date_Time"])
+
+    # 5️⃣ Convert numeric fields safely
+    return _coerce_columns(chunk)
+
+
+def clean_streaming(
+    input_path: str,
+    output_path: str,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    lake: bool = False,
+    partition_by: Optional[List[str]] = None,
+) -> int:
+    """
+    Same cleaning as clean_in_memory, but reading `chunksize` rows at a time
+    so memory is bounded by the chunk size, plus the duplicate hashes
+    (_SeenRows: 8 bytes per unique row), instead of the file size.
+
+    Pass 1 finds the all-NaN columns and the target mean;
+    pass 2 cleans again and appends each chunk to the output
+    (a data_lake table with `lake`, else Parquet if the path ends in
+    .parquet, CSV otherwise). The lake table is built aside and swapped in
+    once every chunk is written.
+    """
+    # ---------- PASS 1: column non-null counts + running target mean ----------
+    non_null = None
+    target_sum, target_count = 0.0, 0
+    seen = _SeenRows()
+
+    for chunk in read_water_csv(input_path, chunksize=chunksize):
+        counts = chunk.rename(columns=RENAME_MAP).notna().sum()
+        non_null = counts if non_null is None else non_null.add(counts, fill_value=0)
+
+        cleaned = _clean_chunk(chunk, seen)
+        target_col = _target_col(cleaned.columns)
+        if target_col in cleaned.columns:
+            target_sum += float(cleaned[target_col].sum())
+            target_count += int(cleaned[target_col].count())
+
+    if non_null is None:
+        raise ValueError(f"No rows in {input_path}")
+
+    # 2️⃣ Drop empty or all-NaN columns
+    empty_cols = [c for c, n in non_null.items() if n == 0 and c != "Date_Time"]
+    target_mean = target_sum / target_count if target_count else float("nan")
+
+    # ---------- PASS 2: clean, fill and write incrementally ----------
+    seen = _SeenRows()
+    rows = 0
+    parquet_writer = None
+    first = True
+
+    staging = data_lake.staging_path(output_path) if lake else None
+    to_parquet = not lake and output_path.endswith(".parquet")
+    if to_parquet:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
 
-# 5️⃣ Convert numeric fields safely
-numeric_cols = df.select_dtypes(include=["object"]).columns
-for col in numeric_cols:
     try:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    except:
-        pass
+        for chunk in read_water_csv(input_path, chunksize=chunksize):
+            cleaned = _clean_chunk(chunk, seen).drop(columns=empty_cols, errors="ignore")
+
+            # 6️⃣ Replace missing target values with the global mean
+            target_col = _target_col(cleaned.columns)
+            if target_col in cleaned.columns:
+                cleaned[target_col] = cleaned[target_col].fillna(target_mean)
+
+            if lake:
+                data_lake.write_partitioned(cleaned, staging, partition_by=partition_by, mode="append")
+            elif to_parquet:
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(output_path, _parquet_schema(cleaned))
+                table = pa.Table.from_pandas(cleaned, schema=parquet_writer.schema, preserve_index=False)
+                parquet_writer.write_table(table)
+            else:
+                cleaned.to_csv(output_path, mode="w" if first else "a", header=first, index=False)
+
+            rows += len(cleaned)
+            first = False
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+
+    if lake:
+        data_lake.publish(staging, output_path)
+    return rows
+
+
+def report_memory(input_path: str) -> None:
+    """
+    Print the in-memory size of the raw file read untyped vs with the schema.
+    """
+    untyped = memory_mb(pd.read_csv(input_path))
+    typed = memory_mb(read_water_csv(input_path))
+    print(f"Memory: {untyped:,.1f} MB untyped -> {typed:,.1f} MB typed ({untyped / typed:.1f}x smaller)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean the water consumption dataset.")
+    parser.add_argument("--input", default=INPUT_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH, help="Ends in .parquet for Parquet output, CSV otherwise")
+    parser.add_argument("--stream", action="store_true", help="Process the file in chunks with bounded memory")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--memory-report", action="store_true", help="Compare memory of untyped vs typed reads")
+    parser.add_argument("--lake", nargs="?", const=data_lake.CLEANED_DIR,
+                        help=f"Write a year/month partitioned Parquet table here instead (default {data_lake.CLEANED_DIR})")
+    parser.add_argument("--partition-by", nargs="+", default=[],
+                        help="(lake) also partition by these columns, e.g. Borough")
+    args = parser.parse_args()
+    output = args.lake or args.output
+    lake = args.lake is not None
 
-# 6️⃣ Drop rows with missing target values (or replace with mean)
-# Note: The dataset might still have 'Charging_Load_kW' if not manually updated.
-# We check for both potential names.
-target_col = "Water_Bill_Amount"
-if "Charging_Load_kW" in df.columns:
-    target_col = "Charging_Load_kW"
+    if args.memory_report:
+        report_memory(args.input)
 
-if target_col in df.columns:
-    df[target_col] = df[target_col].fillna(df[target_col].mean())
+    if args.stream:
+        rows = clean_streaming(
+            args.input, output, chunksize=args.chunksize, lake=lake, partition_by=args.partition_by
+        )
+        print(f"✅ Cleaned dataset saved (streaming)! Rows: {rows}")
+    else:
+        df = clean_in_memory(args.input, output, lake=lake, partition_by=args.partition_by)
+        print(f"✅ Cleaned dataset saved! Rows: {len(df)}, Columns: {len(df.columns)}")
 
-# Save cleaned dataset
-df.to_csv("dataset/water_bill_data_clean.csv", index=False)
 
-print(f"✅ Cleaned dataset saved! Rows: {len(df)}, Columns: {len(df.columns)}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# data_lake.py
+"""
+Parquet tables partitioned as year=YYYY/month=M[/<dimension>=<value>]/part-*.parquet
+for the cleaned and predicted bills.
+
+Rows are sorted by partition and Date_Time before writing, so the min/max
+statistics of every row group are tight; readers get partition pruning on
+year/month (and any partition dimension) and row-group skipping on
+Date_Time, and only read the columns they ask for.
+
+    data_lake.write_partitioned(predicted, data_lake.PREDICTED_DIR, partition_by=["Borough"])
+    data_lake.read_partitioned(
+        data_lake.PREDICTED_DIR,
+        columns=["Date_Time", "Water_Bill_Amount", "Predicted_Bill_Amount"],
+        start="2021-01-01",
+        filters={"Borough": ["BRONX"]},
+    )
+"""
+
+import os
+import shutil
+import uuid
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import features
+
+
+LAKE_DIR = "lake"
+CLEANED_DIR = os.path.join(LAKE_DIR, "cleaned")
+PREDICTED_DIR = os.path.join(LAKE_DIR, "predicted")
+PARTITION_COLS = ["year", "month"]
+# Rows per row group: the unit skipped by Date_Time statistics
+ROW_GROUP_ROWS = 128_000
+
+WRITE_MODES = ["overwrite", "partitions", "append"]
+
+
+def normalize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One dtype per kind, so every written batch has the same Parquet schema
+    (downcasting and categories otherwise differ from batch to batch).
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            out[col] = s.astype("datetime64[ns]")
+        elif pd.api.types.is_bool_dtype(s):
+            out[col] = s
+        elif pd.api.types.is_integer_dtype(s):
+            # Nullable ints (clean_water_data) keep their NAs; both are int64 in Parquet
+            nullable = isinstance(s.dtype, pd.api.extensions.ExtensionDtype)
+            out[col] = s.astype("Int64" if nullable else "int64")
+        elif pd.api.types.is_float_dtype(s):
+            out[col] = s.astype("float64")
+        else:
+            out[col] = s.astype("string")
+    return pd.DataFrame(out, index=df.index)
+
+
+def _partition_schema(table: pa.Table, partition_by: List[str]) -> pa.Schema:
+    # Partition columns keep the type normalize_dtypes gave them (int64, string, ...)
+    fields = [pa.field("year", pa.int32()), pa.field("month", pa.int32())]
+    return pa.schema(fields + [table.schema.field(col) for col in partition_by])
+
+
+def _to_table(df: pd.DataFrame, partition_by: List[str]) -> pa.Table:
+    ts = df[features.TIMESTAMP_COL]
+    df = normalize_dtypes(df).assign(
+        year=ts.dt.year.astype("int32"),
+        month=ts.dt.month.astype("int32"),
+    )
+    order = PARTITION_COLS + partition_by + [features.TIMESTAMP_COL]
+    df = df.sort_values(order, kind="stable", na_position="last")
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _write_dataset(table: pa.Table, path: str, partition_by: List[str], behavior: str) -> None:
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=ds.partitioning(_partition_schema(table, partition_by), flavor="hive"),
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior=behavior,
+        max_rows_per_group=ROW_GROUP_ROWS,
+        min_rows_per_group=min(ROW_GROUP_ROWS, max(1, table.num_rows)),
+    )
+
+
+def staging_path(path: str) -> str:
+    """
+    Sibling directory a table is built in before publish() swaps it in.
+    """
+    return f"{path.rstrip(os.sep)}.staging-{uuid.uuid4().hex[:8]}"
+
+
+def publish(staging: str, path: str) -> None:
+    """
+    Replace the table at `path` with the one built in `staging`.
+    """
+    # Nothing written to staging: publish an empty table
+    os.makedirs(staging, exist_ok=True)
+    if os.path.isdir(path):
+        old = f"{path.rstrip(os.sep)}.old-{uuid.uuid4().hex[:8]}"
+        os.replace(path, old)
+        os.replace(staging, path)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        os.replace(staging, path)
+
+
+def write_partitioned(
+    df: pd.DataFrame,
+    path: str,
+    partition_by: Optional[List[str]] = None,
+    mode: str = "overwrite",
+) -> int:
+    """
+    Write `df` (must have Date_Time) to the table at `path`, partitioned by
+    year/month of Date_Time and then by the `partition_by` columns:
+    - 'overwrite': the table is rebuilt aside and swapped in
+    - 'partitions': only the partitions present in `df` are replaced
+    - 'append': files are added next to the existing ones
+    Returns the number of rows written.
+    """
+    if mode not in WRITE_MODES:
+        raise ValueError(f"Unknown write mode '{mode}', expected one of {WRITE_MODES}")
+    if features.TIMESTAMP_COL not in df.columns:
+        raise ValueError(f"Cannot partition without a {features.TIMESTAMP_COL} column")
+    partition_by = list(partition_by or [])
+    missing = [c for c in partition_by if c not in df.columns]
+    if missing:
+        raise ValueError(f"Cannot partition by missing columns: {missing}")
+
+    df = df.dropna(subset=[features.TIMESTAMP_COL])
+    table = _to_table(df, partition_by)
+    if mode == "overwrite":
+        staging = staging_path(path)
+        _write_dataset(table, staging, partition_by, "error")
+        publish(staging, path)
+    else:
+        behavior = "delete_matching" if mode == "partitions" else "overwrite_or_ignore"
+        _write_dataset(table, path, partition_by, behavior)
+    return table.num_rows
+
+
+def _dataset(path: str) -> ds.Dataset:
+    return ds.dataset(path, format="parquet", partitioning=ds.HivePartitioning.discover())
+
+
+def _filter(
+    start: Optional[pd.Timestamp],
+    end: Optional[pd.Timestamp],
+    filters: Optional[Dict[str, Any]],
+) -> Optional[ds.Expression]:
+    exprs = []
+    year, month = ds.field("year"), ds.field("month")
+    ts = ds.field(features.TIMESTAMP_COL)
+    if start is not None:
+        start = pd.Timestamp(start)
+        # Partition pruning first, then row groups by their Date_Time statistics
+        exprs.append((year > start.year) | ((year == start.year) & (month >= start.month)))
+        exprs.append(ts >= start.to_pydatetime())
+    if end is not None:
+        end = pd.Timestamp(end)
+        exprs.append((year < end.year) | ((year == end.year) & (month <= end.month)))
+        exprs.append(ts <= end.to_pydatetime())
+    for col, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        exprs.append(ds.field(col).isin(list(values)))
+    if not exprs:
+        return None
+    out = exprs[0]
+    for expr in exprs[1:]:
+        out = out & expr
+    return out
+
+
+def read_partitioned(
+    path: str,
+    columns: Optional[List[str]] = None,
+    start: Optional[pd.Timestamp] = None,
+    end: Optional[pd.Timestamp] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """
+    Read the table at `path`: only `columns` (partition columns included if
+    named), only bills with Date_Time in [start, end], and only rows whose
+    column equals / is one of `filters` {column: value or list}.
+    Year/month and partition-dimension filters prune whole directories;
+    Date_Time and other column filters skip row groups by their statistics.
+    """
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=columns)
+
+    dataset = _dataset(path)
+    missing = [c for c in columns or [] if c not in dataset.schema.names]
+    if missing:
+        raise ValueError(f"Columns not in {path}: {missing}")
+    table = dataset.to_table(columns=columns, filter=_filter(start, end, filters))
+    df = table.to_pandas()
+    if columns is None:
+        df = df.drop(columns=PARTITION_COLS, errors="ignore")
+    return df
+
+
+def list_partitions(path: str) -> pd.DataFrame:
+    """
+    One row per partition directory of the table with its row count, read
+    from the Parquet footers only.
+    """
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=PARTITION_COLS + ["rows"])
+
+    rows: Dict[tuple, int] = {}
+    names: List[str] = []
+    for fragment in _dataset(path).get_fragments():
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        names = names or PARTITION_COLS + sorted(k for k in keys if k not in PARTITION_COLS)
+        key = tuple(keys[name] for name in names)
+        rows[key] = rows.get(key, 0) + fragment.metadata.num_rows
+    out = pd.DataFrame([list(k) + [n] for k, n in rows.items()], columns=names + ["rows"])
+    return out.sort_values(names).reset_index(drop=True) if names else out
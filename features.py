@@ -0,0 +1,187 @@
+# features.py
+
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+import water_schema
+from water_schema import TARGET_COL, TIMESTAMP_COL
+
+
+PREDICTION_COL = "Predicted_Bill_Amount"
+
+# Bump whenever add_features changes so cached feature frames are rebuilt
+FEATURES_VERSION = "1"
+
+# Columns identifying one billed account/meter (first ones present are used)
+ACCOUNT_KEYS = ["Development Name", "Meter Number"]
+SERVICE_START_COL = "Service Start Date"
+
+# Per-account history features are computed for these columns
+LAG_COLS = [TARGET_COL, "Consumption (HCF)"]
+ROLLING_WINDOW = 3
+# Value used where an account has no earlier bill
+MISSING_LAG = -1.0
+
+# Numeric, but unique per bill: only lets the forest memorise rows
+ID_COLS = ["UMIS BILL ID"]
+
+# Integer code column added for every category column
+CODE_SUFFIX = "_Code"
+
+
+def _add_calendar_features(df: pd.DataFrame) -> None:
+    ts = df[TIMESTAMP_COL]
+    df["Bill_Year"] = ts.dt.year.astype("int16")
+    df["Bill_Month"] = ts.dt.month.astype("int8")
+    df["Bill_Quarter"] = ts.dt.quarter.astype("int8")
+
+    if SERVICE_START_COL in df.columns and pd.api.types.is_datetime64_any_dtype(df[SERVICE_START_COL]):
+        days = (ts - df[SERVICE_START_COL]).dt.days
+        df["Billing_Period_Days"] = days.astype("float32")
+
+
+def _add_lag_features(df: pd.DataFrame) -> pd.DataFrame:
+    keys = [c for c in ACCOUNT_KEYS if c in df.columns]
+    lag_cols = [c for c in LAG_COLS if c in df.columns]
+    if not keys or not lag_cols:
+        return df
+
+    # Previous bills of the same account, oldest first
+    df = df.sort_values(keys + [TIMESTAMP_COL], kind="stable")
+    grouped = df.groupby(keys, observed=True, sort=False, dropna=False)
+
+    for col in lag_cols:
+        prev = grouped[col].shift(1)
+        name = col.split(" (")[0].replace(" ", "_")
+        df[f"{name}_Lag1"] = prev.fillna(MISSING_LAG).astype("float32")
+
+        # Mean of the previous ROLLING_WINDOW bills (current bill excluded)
+        rolling = (
+            prev.groupby([df[k] for k in keys], observed=True, sort=False, dropna=False)
+            .rolling(ROLLING_WINDOW, min_periods=1)
+            .mean()
+            .reset_index(level=list(range(len(keys))), drop=True)
+        )
+        df[f"{name}_Rolling{ROLLING_WINDOW}"] = rolling.reindex(df.index).fillna(MISSING_LAG).astype("float32")
+
+    return df.sort_index()
+
+
+def code_column(col: str) -> str:
+    return f"{col}{CODE_SUFFIX}"
+
+
+def _lookup_codes(s: pd.Series, vocab: List[Optional[str]]) -> np.ndarray:
+    # Map each distinct value once, then gather by the categorical codes;
+    # values missing from `vocab` (and nulls) get -1, like pandas' own codes
+    codes = {v: i for i, v in enumerate(vocab) if v is not None}
+    cat = s.astype("string").astype("category")
+    lookup = np.asarray([codes.get(v, -1) for v in cat.cat.categories], dtype=np.int16)
+    raw = cat.cat.codes.to_numpy()
+    return np.where(raw >= 0, lookup[raw.clip(min=0)] if len(lookup) else -1, -1).astype(np.int16)
+
+
+def _add_category_codes(
+    df: pd.DataFrame, category_vocab: Optional[Dict[str, List[Optional[str]]]] = None
+) -> None:
+    for col in water_schema.CATEGORY_COLS:
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if category_vocab is not None:
+            # Codes follow the persisted vocabulary so they stay stable across
+            # batches; unseen values are appended to it
+            vocab = category_vocab.setdefault(col, [])
+            known = set(vocab)
+            vocab.extend(v for v in pd.unique(s.dropna().astype(str)) if v not in known)
+            df[code_column(col)] = _lookup_codes(s, vocab)
+            continue
+        if not isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.astype("category")
+        # -1 for missing, like pandas' own codes
+        df[code_column(col)] = s.cat.codes.astype("int16")
+
+
+def extract_category_vocab(
+    frames: Union[pd.DataFrame, Iterable[pd.DataFrame]]
+) -> Dict[str, List[Optional[str]]]:
+    """
+    The value behind every code of the category code columns of a
+    featurized frame (or of a sequence of batches of one), as
+    {column: [value of code 0, value of code 1, ...]}; codes that never
+    occur are None. Stored with a model so the same value gets the same
+    code at predict time (see category_codes).
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    seen: Dict[str, Dict[int, str]] = {}
+    for df in frames:
+        for col in water_schema.CATEGORY_COLS:
+            if col not in df.columns or code_column(col) not in df.columns:
+                continue
+            codes = df[code_column(col)]
+            known = codes >= 0
+            firsts = df.loc[known, col].astype("string").groupby(codes[known], sort=False).first()
+            seen.setdefault(col, {}).update((int(code), value) for code, value in firsts.items())
+    return {
+        col: [values.get(code) for code in range(max(values) + 1)] if values else []
+        for col, values in seen.items()
+    }
+
+
+def category_codes(
+    df: pd.DataFrame, category_vocab: Dict[str, List[Optional[str]]]
+) -> Dict[str, np.ndarray]:
+    """
+    {code column: codes} for the category columns of `df` under a model's
+    `category_vocab`. Values the model never saw get -1; rows without a
+    value keep the code already in `df` (-1 if it has no code column).
+    """
+    out = {}
+    for col, vocab in category_vocab.items():
+        if col not in df.columns:
+            continue
+        codes = _lookup_codes(df[col], vocab)
+        present = df[col].notna().to_numpy()
+        if code_column(col) in df.columns:
+            existing = df[code_column(col)].fillna(-1).to_numpy(dtype=np.int16)
+        else:
+            existing = np.full(len(df), -1, dtype=np.int16)
+        out[code_column(col)] = np.where(present, codes, existing)
+    return out
+
+
+def add_features(
+    df: pd.DataFrame, category_vocab: Optional[Dict[str, List[str]]] = None
+) -> pd.DataFrame:
+    """
+    Vectorized feature stage run on the cleaned frame:
+    - calendar features from Date_Time (year, month, quarter) and the
+      billing-period length when the service start date is available
+    - previous bill and rolling mean of earlier bills per account
+    - integer codes for the category columns declared in water_schema
+      (taken from `category_vocab` when given, which is extended in place;
+      otherwise numbered by the frame's own sorted categories, see
+      extract_category_vocab for recording them with a model)
+    """
+    df = df.copy()
+    if TIMESTAMP_COL in df.columns and pd.api.types.is_datetime64_any_dtype(df[TIMESTAMP_COL]):
+        _add_calendar_features(df)
+        df = _add_lag_features(df)
+    _add_category_codes(df, category_vocab)
+    return df
+
+
+def feature_columns(df: pd.DataFrame) -> List[str]:
+    """
+    Numeric model inputs: everything numeric except the target, the
+    prediction column and per-bill identifiers.
+    """
+    excluded = {TARGET_COL, PREDICTION_COL, *ID_COLS}
+    return [
+        c for c in df.columns
+        if c not in excluded
+        and pd.api.types.is_numeric_dtype(df[c])
+    ]
@@ -0,0 +1,240 @@
+# forest_inference.py
+"""
+Array-based inference for the RandomForestRegressor trained by train_model.
+
+The trees are flattened into a few contiguous NumPy arrays (one node table
+for the whole forest) and a batch is scored by walking every tree at once:
+one vectorized step per tree level instead of one Python-level call per tree.
+
+    python forest_inference.py                 # compile MODEL_PATH
+    python forest_inference.py --check data.parquet
+"""
+
+import argparse
+import json
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+import features
+
+# Only compiling needs scikit-learn; loading and predicting do not
+if TYPE_CHECKING:
+    from sklearn.ensemble import RandomForestRegressor
+
+
+# Rows traversed together; bounds the (rows x trees) index matrices
+BATCH_ROWS = 10_000
+FORMAT_VERSION = 1
+
+
+class CompiledForest:
+    """
+    A fitted forest as flat node arrays. Children are global node indices
+    and leaves point to themselves, so every tree can be advanced the same
+    number of steps without masking.
+
+    Exposes feature_names_in_, category_vocab_ and predict() like the
+    sklearn model it was compiled from, so predict_with_model accepts either.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        threshold: np.ndarray,
+        value: np.ndarray,
+        missing_left: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        feature_names: List[str],
+        category_vocab: Optional[Dict[str, List[Optional[str]]]] = None,
+    ):
+        self.feature = feature
+        self.left = left
+        self.right = right
+        self.threshold = threshold
+        self.value = value
+        self.missing_left = missing_left
+        self.roots = roots
+        self.max_depth = max_depth
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.category_vocab_ = category_vocab or {}
+        self.n_estimators = len(roots)
+
+    @classmethod
+    def from_sklearn(cls, model: "RandomForestRegressor") -> "CompiledForest":
+        from sklearn.ensemble import RandomForestRegressor
+
+        if not isinstance(model, RandomForestRegressor):
+            raise TypeError(f"Only RandomForestRegressor can be compiled, got {type(model).__name__}")
+        if model.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be compiled.")
+
+        names = getattr(model, "feature_names_in_", None)
+        if names is None:
+            names = [f"x{i}" for i in range(model.n_features_in_)]
+
+        parts: Dict[str, List[np.ndarray]] = {k: [] for k in ("feature", "left", "right", "threshold", "value", "missing")}
+        roots, offset, max_depth = [], 0, 0
+        for est in model.estimators_:
+            state = est.tree_.__getstate__()
+            nodes, n = state["nodes"], state["node_count"]
+            own = np.arange(offset, offset + n, dtype=np.int64)
+            is_leaf = nodes["left_child"] == -1
+
+            parts["feature"].append(np.where(is_leaf, 0, nodes["feature"]))
+            parts["left"].append(np.where(is_leaf, own, nodes["left_child"] + offset))
+            parts["right"].append(np.where(is_leaf, own, nodes["right_child"] + offset))
+            parts["threshold"].append(np.where(is_leaf, np.inf, nodes["threshold"]))
+            parts["value"].append(state["values"][:, 0, 0])
+            parts["missing"].append(np.where(is_leaf, 1, nodes["missing_go_to_left"]))
+
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, state["max_depth"])
+
+        feature_dtype = np.int16 if len(names) <= np.iinfo(np.int16).max else np.int32
+        return cls(
+            feature=np.concatenate(parts["feature"]).astype(feature_dtype),
+            left=np.concatenate(parts["left"]).astype(np.int32),
+            right=np.concatenate(parts["right"]).astype(np.int32),
+            threshold=np.concatenate(parts["threshold"]).astype(np.float64),
+            value=np.concatenate(parts["value"]).astype(np.float64),
+            missing_left=np.concatenate(parts["missing"]).astype(bool),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            feature_names=list(names),
+            category_vocab=getattr(model, "category_vocab_", None),
+        )
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """
+        Leaf node index per (row, tree). X is float32 like sklearn's input,
+        compared against float64 thresholds exactly as the Cython code does.
+        """
+        rows = np.arange(len(X))[:, None]
+        idx = np.broadcast_to(self.roots, (len(X), self.n_estimators)).copy()
+        has_nan = bool(np.isnan(X).any())
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[idx]]
+            go_left = x <= self.threshold[idx]
+            if has_nan:
+                go_left = np.where(np.isnan(x), self.missing_left[idx], go_left)
+            idx = np.where(go_left, self.left[idx], self.right[idx])
+        return idx
+
+    def predict(self, X: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        """
+        Mean of the trees' leaf values. Tree outputs are summed one tree at
+        a time in estimator order and divided at the end, the same float
+        operations as RandomForestRegressor.predict.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X[list(self.feature_names_in_)].to_numpy(dtype=np.float32, na_value=np.nan)
+        else:
+            X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names_in_):
+            raise ValueError(f"Expected {len(self.feature_names_in_)} feature columns, got shape {X.shape}")
+
+        out = np.zeros(len(X), dtype=np.float64)
+        for start in range(0, len(X), BATCH_ROWS):
+            leaf_values = self.value[self._leaves(X[start:start + BATCH_ROWS])]
+            acc = out[start:start + len(leaf_values)]
+            for t in range(self.n_estimators):
+                acc += leaf_values[:, t]
+        out /= self.n_estimators
+        return out
+
+    def save(self, path: str) -> None:
+        """
+        Compressed .npz. Split thresholds and leaf values share one array
+        (a node is either one or the other) and the NaN directions are
+        bit-packed, so only what traversal needs is written.
+        """
+        is_leaf = self.left == np.arange(self.n_nodes)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            format_version=np.int32(FORMAT_VERSION),
+            feature=self.feature,
+            left=self.left,
+            right=self.right,
+            split_or_value=np.where(is_leaf, self.value, self.threshold),
+            missing_left=np.packbits(self.missing_left),
+            roots=self.roots,
+            max_depth=np.int32(self.max_depth),
+            feature_names=np.asarray(self.feature_names_in_, dtype=str),
+            category_vocab=np.asarray(json.dumps(self.category_vocab_)),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledForest":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format_version"]) != FORMAT_VERSION:
+                raise ValueError(f"Unsupported compiled forest format {int(data['format_version'])}")
+            left = data["left"]
+            is_leaf = left == np.arange(len(left))
+            split_or_value = data["split_or_value"]
+            return cls(
+                feature=data["feature"],
+                left=left,
+                right=data["right"],
+                threshold=np.where(is_leaf, np.inf, split_or_value),
+                value=np.where(is_leaf, split_or_value, 0.0),
+                missing_left=np.unpackbits(data["missing_left"], count=len(left)).astype(bool),
+                roots=data["roots"],
+                max_depth=int(data["max_depth"]),
+                feature_names=data["feature_names"].tolist(),
+                # Not in files compiled before it was recorded
+                category_vocab=json.loads(str(data["category_vocab"])) if "category_vocab" in data.files else None,
+            )
+
+
+def compile_forest(model: "RandomForestRegressor") -> CompiledForest:
+    return CompiledForest.from_sklearn(model)
+
+
+def compiled_path(model_path: str) -> str:
+    return f"{os.path.splitext(model_path)[0]}.forest.npz"
+
+
+def main():
+    import joblib
+    from spark_app import MODEL_PATH, predict_with_model
+
+    parser = argparse.ArgumentParser(description="Compile the trained forest to flat NumPy arrays.")
+    parser.add_argument("--model", default=MODEL_PATH, help="Persisted RandomForestRegressor (joblib)")
+    parser.add_argument("--output", default=None, help="Defaults to <model>.forest.npz")
+    parser.add_argument("--check", default=None, help="Featurized Parquet file to compare predictions on")
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    output = args.output or compiled_path(args.model)
+    compiled = compile_forest(model)
+    compiled.save(output)
+
+    print(f"{compiled.n_estimators} trees, {compiled.n_nodes:,} nodes, max depth {compiled.max_depth}")
+    print(f"joblib: {os.path.getsize(args.model) / 1024 ** 2:.2f} MB -> compiled: {os.path.getsize(output) / 1024 ** 2:.2f} MB ({output})")
+
+    if args.check:
+        df = pd.read_parquet(args.check)
+        # Sequential sklearn predict, the order the compiled forest sums in
+        model.set_params(n_jobs=1)
+        expected = predict_with_model(model, df)
+        got = predict_with_model(CompiledForest.load(output), df)
+        identical = np.array_equal(
+            expected[features.PREDICTION_COL].to_numpy(), got[features.PREDICTION_COL].to_numpy()
+        )
+        print(f"predictions on {len(df):,} rows bit-identical: {identical}")
+
+
+if __name__ == "__main__":
+    main()
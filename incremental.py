@@ -0,0 +1,274 @@
+# incremental.py
+
+import glob
+import json
+import os
+import shutil
+import uuid
+from typing import Any, Dict, Optional, Tuple, Union
+
+import pandas as pd
+import pyarrow.dataset as ds
+from sklearn.base import RegressorMixin
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+
+import data_lake
+import features
+import model_registry
+from clean_water_data import _row_hashes
+from spark_app import (
+    DEFAULT_ESTIMATOR,
+    MODEL_PATH,
+    SPLIT_SEED,
+    TARGET_COL,
+    TEST_SIZE,
+    TIMESTAMP_COL,
+    preprocess_with_spark,
+    train_model,
+    training_registry_key,
+)
+
+
+# Featurized rows, partitioned as year=YYYY/month=M/part-*.parquet
+STORE_DIR = os.path.join(data_lake.LAKE_DIR, "features")
+# Watermark, row count, category vocabulary, current model key and the
+# staged batch being committed
+STATE_PATH = os.path.join(STORE_DIR, "_state.json")
+# New rows are written here first ("_" keeps readers out) and moved into
+# the store once the state naming them is saved
+STAGING_PREFIX = "_staging-"
+PARTITION_COLS = data_lake.PARTITION_COLS
+
+# Months of stored history re-read so lag/rolling features of new rows
+# can see the previous bills of the same account
+HISTORY_MONTHS = 12
+# Trees added per refresh in warm_start mode
+EXTRA_TREES = 20
+
+UPDATE_MODES = ["warm_start", "retrain"]
+
+
+def load_state() -> Dict[str, Any]:
+    if not os.path.exists(STATE_PATH):
+        state = {"watermark": None, "rows": 0, "category_vocab": {}, "model_key": None}
+    else:
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    # Not in state files written before they were tracked
+    state.setdefault("watermark_keys", [])
+    state.setdefault("pending", None)
+    return state
+
+
+def save_state(state: Dict[str, Any]) -> None:
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp_path = f"{STATE_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, default=str)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def _row_keys(cleaned: pd.DataFrame) -> pd.Series:
+    """
+    Hex hash of every cleaned row (before features), to tell rows sharing
+    a Date_Time apart.
+    """
+    return pd.Series([format(h, "016x") for h in _row_hashes(cleaned)], index=cleaned.index)
+
+
+def _commit_pending(state: Dict[str, Any]) -> None:
+    """
+    Move the files of the staged batch named in the state into the store,
+    then clear it. Safe to repeat after a crash: files already moved are
+    gone from the staging directory. Staging directories the state doesn't
+    name were left by a run that crashed before its commit and are dropped.
+    """
+    if state["pending"]:
+        staging = os.path.join(STORE_DIR, state["pending"])
+        for root, _, files in os.walk(staging):
+            target = os.path.join(STORE_DIR, os.path.relpath(root, staging))
+            os.makedirs(target, exist_ok=True)
+            for name in files:
+                os.replace(os.path.join(root, name), os.path.join(target, name))
+        shutil.rmtree(staging, ignore_errors=True)
+        state["pending"] = None
+        save_state(state)
+    for leftover in glob.glob(os.path.join(STORE_DIR, f"{STAGING_PREFIX}*")):
+        shutil.rmtree(leftover, ignore_errors=True)
+
+
+def read_store(columns=None, since: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    """
+    Read the featurized store, optionally only some columns and only the
+    year/month partitions from `since` on (partition pruning).
+    """
+    if not os.path.isdir(STORE_DIR):
+        return pd.DataFrame(columns=columns)
+
+    dataset = ds.dataset(STORE_DIR, format="parquet", partitioning="hive")
+    flt = None
+    if since is not None:
+        since = pd.Timestamp(since)
+        year, month = ds.field("year"), ds.field("month")
+        flt = (year > since.year) | ((year == since.year) & (month >= since.month))
+
+    table = dataset.to_table(columns=columns, filter=flt)
+    return table.to_pandas().drop(columns=PARTITION_COLS, errors="ignore")
+
+
+def ingest(raw: Union[pd.DataFrame, str], source: Optional[str] = None) -> pd.DataFrame:
+    """
+    Clean and featurize only the rows from the stored watermark on, append
+    them to the partitioned store and advance the watermark.
+    Rows at exactly the watermark are new unless their row key is among
+    those already stored for it (late rows of the last ingested instant).
+    The rows are staged first; saving the state commits them.
+    Returns the new featurized rows (empty if nothing new arrived).
+    """
+    state = load_state()
+    _commit_pending(state)
+    watermark = pd.Timestamp(state["watermark"]) if state["watermark"] else None
+
+    cleaned = preprocess_with_spark(raw, source=source, since=watermark)
+    keys = _row_keys(cleaned)
+    if watermark is not None:
+        seen = (cleaned[TIMESTAMP_COL] == watermark) & keys.isin(state["watermark_keys"])
+        cleaned, keys = cleaned[~seen], keys[~seen]
+    if cleaned.empty:
+        return cleaned
+    latest = cleaned[TIMESTAMP_COL].max()
+    latest_keys = keys[cleaned[TIMESTAMP_COL] == latest].tolist()
+    if latest == watermark:
+        latest_keys = state["watermark_keys"] + latest_keys
+
+    # Recent history (only the columns lag features need) + new rows
+    combined = cleaned.assign(_is_new=True)
+    if watermark is not None:
+        history_cols = [
+            c for c in features.ACCOUNT_KEYS + [TIMESTAMP_COL] + features.LAG_COLS
+            if c in cleaned.columns
+        ]
+        history = read_store(
+            columns=history_cols,
+            since=watermark - pd.DateOffset(months=HISTORY_MONTHS),
+        )
+        if not history.empty:
+            combined = pd.concat([history.assign(_is_new=False), combined], ignore_index=True)
+
+    vocab = state["category_vocab"]
+    featurized = features.add_features(combined, category_vocab=vocab)
+    new_rows = featurized[featurized["_is_new"].astype(bool)].drop(columns="_is_new")
+    new_rows = data_lake.normalize_dtypes(new_rows.reset_index(drop=True))
+    staging = f"{STAGING_PREFIX}{uuid.uuid4().hex[:8]}"
+    data_lake.write_partitioned(new_rows, os.path.join(STORE_DIR, staging), mode="append")
+
+    state.update(
+        watermark=latest.isoformat(),
+        watermark_keys=sorted(set(latest_keys)),
+        rows=state["rows"] + len(new_rows),
+        category_vocab=vocab,
+        pending=staging,
+    )
+    # Commit point: the rows are stored once this state is
+    save_state(state)
+    _commit_pending(state)
+    return new_rows
+
+
+def _warm_start(
+    model: RandomForestRegressor, new_rows: pd.DataFrame, extra_trees: int
+) -> Dict[str, float]:
+    """
+    Grow `extra_trees` more trees fitted on the new rows only; metrics come
+    from a held-out part of the new rows.
+    """
+    feature_cols = list(model.feature_names_in_)
+    X, y = new_rows[feature_cols], new_rows[TARGET_COL]
+
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + extra_trees)
+    if len(new_rows) < 10:
+        model.fit(X, y)
+        return {}
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZE, random_state=SPLIT_SEED
+    )
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+
+    return model_registry.regression_metrics(y_test, y_pred)
+
+
+def update_model(
+    new_rows: pd.DataFrame,
+    mode: str = "warm_start",
+    extra_trees: int = EXTRA_TREES,
+) -> Tuple[RegressorMixin, Dict[str, float]]:
+    """
+    Bring the model up to date after ingest():
+    - 'warm_start': add trees fitted on the new rows to the current forest
+      (falls back to 'retrain' when there is no compatible model yet)
+    - 'retrain': fit from scratch on the whole featurized store, without
+      re-cleaning anything
+    """
+    if mode not in UPDATE_MODES:
+        raise ValueError(f"Unknown update mode '{mode}', expected one of {UPDATE_MODES}")
+
+    state = load_state()
+    entry = model_registry.load_model(state["model_key"]) if state["model_key"] else None
+
+    if mode == "warm_start" and entry is not None:
+        model, meta = entry
+        feature_cols = list(getattr(model, "feature_names_in_", []))
+        compatible = (
+            isinstance(model, RandomForestRegressor)
+            and feature_cols
+            and all(c in new_rows.columns for c in feature_cols)
+        )
+        if compatible:
+            metrics = _warm_start(model, new_rows, extra_trees) or meta["metrics"]
+            # The store is coded with the state's vocabulary, grown by ingest()
+            model.category_vocab_ = state["category_vocab"]
+            params = dict(meta["params"], n_estimators=model.n_estimators)
+            key = model_registry.registry_key(f"incremental-{state['watermark']}", params)
+            model_registry.save_model(
+                key,
+                model,
+                {
+                    "feature_cols": feature_cols,
+                    "data_fingerprint": f"incremental-{state['watermark']}",
+                    "params": params,
+                    "metrics": metrics,
+                    "category_vocab": model.category_vocab_,
+                    "n_rows": state["rows"],
+                },
+                latest_path=MODEL_PATH,
+            )
+
+            state["model_key"] = key
+            save_state(state)
+            return model, metrics
+
+    # Retrain from the cached features of the whole history
+    history = read_store()
+    model, metrics = train_model(history, estimator=DEFAULT_ESTIMATOR)
+    state["model_key"] = training_registry_key(history, estimator=DEFAULT_ESTIMATOR)
+    save_state(state)
+    return model, metrics
+
+
+def run_incremental(
+    raw: Union[pd.DataFrame, str],
+    source: Optional[str] = None,
+    mode: str = "warm_start",
+) -> Tuple[int, Optional[Dict[str, float]]]:
+    """
+    Monthly refresh: ingest the rows past the watermark and update the model.
+    Returns the number of new rows and the model metrics (None if nothing new).
+    """
+    new_rows = ingest(raw, source=source)
+    if new_rows.empty:
+        return 0, None
+    _, metrics = update_model(new_rows, mode=mode)
+    return len(new_rows), metrics
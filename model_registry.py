@@ -0,0 +1,165 @@
+# model_registry.py
+
+import glob
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import pandas as pd
+
+
+REGISTRY_DIR = os.path.join("model", "registry")
+# How many model versions to keep on disk
+MAX_VERSIONS = 5
+
+
+def data_fingerprint(df: pd.DataFrame, columns: List[str]) -> str:
+    """
+    Content hash of the given columns (names, order and values).
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([str(c) for c in columns]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df[columns], index=False).values.tobytes())
+    return h.hexdigest()[:24]
+
+
+def file_stats(path: str) -> List[str]:
+    """
+    "path|size|mtime" for every file under `path` (a file, a directory or
+    a glob), sorted: changes whenever any of the files is rewritten.
+    """
+    paths = []
+    for match in sorted(glob.glob(path)) or [path]:
+        if os.path.isdir(match):
+            for root, _, files in os.walk(match):
+                paths.extend(os.path.join(root, f) for f in files)
+        else:
+            paths.append(match)
+    stats = []
+    for p in sorted(paths):
+        stat = os.stat(p)
+        stats.append(f"{os.path.abspath(p)}|{stat.st_size}|{stat.st_mtime_ns}")
+    return stats
+
+
+def path_fingerprint(path: str, columns: List[str]) -> str:
+    """
+    data_fingerprint for data on disk, without reading it: the column names
+    plus file_stats, so rewriting a fixed path (e.g. lake/features) gives a
+    new fingerprint.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([str(c) for c in columns]).encode("utf-8"))
+    for line in file_stats(path):
+        h.update(line.encode("utf-8"))
+    return h.hexdigest()[:24]
+
+
+def regression_metrics(y_true: Any, y_pred: Any) -> Dict[str, float]:
+    """
+    r2 and rmse of held-out predictions, as stored in every entry's
+    metrics (r2 is NaN for fewer than two rows).
+    """
+    from sklearn.metrics import r2_score, mean_squared_error
+
+    # NOTE: no 'squared' kwarg here (for older sklearn compat)
+    return {
+        "r2": float(r2_score(y_true, y_pred)) if len(y_true) > 1 else float("nan"),
+        "rmse": float(mean_squared_error(y_true, y_pred) ** 0.5),
+    }
+
+
+def registry_key(fingerprint: str, params: Dict[str, Any]) -> str:
+    """
+    Registry entry id for one (training data, hyperparameters) pair.
+    """
+    payload = json.dumps({"data": fingerprint, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def _paths(key: str) -> Tuple[str, str]:
+    base = os.path.join(REGISTRY_DIR, key)
+    return f"{base}.joblib", f"{base}.json"
+
+
+def load_model(key: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    """
+    Return (model, metadata) for a registry entry, or None if it isn't there.
+    """
+    model_path, meta_path = _paths(key)
+    if not (os.path.exists(model_path) and os.path.exists(meta_path)):
+        return None
+
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    model = joblib.load(model_path)
+
+    # mark as recently used so eviction keeps it
+    os.utime(meta_path)
+    return model, meta
+
+
+def load_compatible(key: str, feature_cols: List[str]) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    """
+    load_model, but only if the entry was fitted on exactly `feature_cols`
+    (a feature change keeps the data fingerprint but not the model).
+    """
+    entry = load_model(key)
+    if entry is None or entry[1].get("feature_cols") != feature_cols:
+        return None
+    return entry
+
+
+def save_model(key: str, model: Any, meta: Dict[str, Any], latest_path: Optional[str] = None) -> None:
+    """
+    Store a model with its metadata (feature columns, fingerprint,
+    hyperparameters, metrics), then drop the oldest versions. With
+    `latest_path` the model is also written there (the documented
+    location of the latest model, spark_app.MODEL_PATH).
+    """
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    model_path, meta_path = _paths(key)
+
+    meta = dict(meta, key=key, created_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+    # Model first, metadata last: an entry only counts once its .json exists
+    joblib.dump(model, model_path)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, default=str)
+
+    if latest_path:
+        os.makedirs(os.path.dirname(latest_path) or ".", exist_ok=True)
+        joblib.dump(model, latest_path)
+
+    evict_old_versions()
+
+
+def list_models() -> List[Dict[str, Any]]:
+    """
+    Metadata of every stored model, most recently used first.
+    """
+    metas = glob.glob(os.path.join(REGISTRY_DIR, "*.json"))
+    metas.sort(key=os.path.getmtime, reverse=True)
+
+    out = []
+    for path in metas:
+        with open(path, "r", encoding="utf-8") as f:
+            out.append(json.load(f))
+    return out
+
+
+def evict_old_versions(max_versions: int = MAX_VERSIONS) -> None:
+    """
+    Keep only the `max_versions` most recently used models.
+    """
+    metas = glob.glob(os.path.join(REGISTRY_DIR, "*.json"))
+    metas.sort(key=os.path.getmtime, reverse=True)
+
+    for meta_path in metas[max_versions:]:
+        key = os.path.splitext(os.path.basename(meta_path))[0]
+        for path in _paths(key):
+            if os.path.exists(path):
+                os.remove(path)
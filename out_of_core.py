@@ -0,0 +1,276 @@
+# out_of_core.py
+
+import glob
+import os
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.base import RegressorMixin
+
+import features
+import model_registry
+import water_schema
+from profiling import peak_rss_during
+from spark_app import (
+    DEFAULT_ESTIMATOR,
+    ESTIMATORS,
+    MODEL_PATH,
+    SPLIT_SEED,
+    TARGET_COL,
+    TEST_SIZE,
+    _evict_lru,
+    make_estimator,
+)
+
+
+MEMMAP_DIR = os.path.join("cache", "memmap")
+# Rows converted / predicted per batch, so only one batch is ever in RAM
+BATCH_ROWS = 100_000
+# Target quantile bins used by the stratified sample
+SAMPLE_BINS = 10
+
+
+def _parquet_feature_cols(parquet_path: str) -> List[str]:
+    empty = pq.read_schema(parquet_path).empty_table().to_pandas()
+    return features.feature_columns(empty)
+
+
+def _parquet_category_vocab(parquet_path: str) -> Dict[str, List[Optional[str]]]:
+    # Only the category and code columns, one batch at a time
+    names = set(pq.read_schema(parquet_path).names)
+    cols = [c for c in water_schema.CATEGORY_COLS if c in names and features.code_column(c) in names]
+    if not cols:
+        return {}
+    batches = pq.ParquetFile(parquet_path).iter_batches(
+        batch_size=BATCH_ROWS, columns=cols + [features.code_column(c) for c in cols]
+    )
+    return features.extract_category_vocab(batch.to_pandas() for batch in batches)
+
+
+def parquet_to_memmap(
+    parquet_path: str, feature_cols: List[str], work_dir: str = MEMMAP_DIR
+) -> Tuple[np.memmap, np.memmap]:
+    """
+    Stream the feature columns + target of a Parquet file (e.g. a
+    featurize_cached entry) into float32 memory-mapped arrays, BATCH_ROWS
+    rows at a time. Reuses the arrays if they were already written; they
+    are built under temporary names and only renamed into place once
+    complete, so a crashed run never leaves arrays that look reusable.
+    `work_dir` is evicted like the Parquet cache (see _evict_memmaps).
+    """
+    pf = pq.ParquetFile(parquet_path)
+    n_rows, n_cols = pf.metadata.num_rows, len(feature_cols)
+
+    os.makedirs(work_dir, exist_ok=True)
+    base = os.path.join(work_dir, os.path.splitext(os.path.basename(parquet_path))[0])
+    x_path, y_path = f"{base}.X.f32", f"{base}.y.f32"
+
+    if os.path.exists(x_path) and os.path.exists(y_path):
+        if os.path.getsize(x_path) == n_rows * n_cols * 4 and os.path.getsize(y_path) == n_rows * 4:
+            for path in (x_path, y_path):
+                os.utime(path)  # mark as recently used
+            _evict_memmaps(work_dir, keep=base)
+            return _open_memmaps(x_path, y_path, n_rows, n_cols)
+
+    suffix = f".tmp-{uuid.uuid4().hex[:8]}"
+    x_tmp, y_tmp = x_path + suffix, y_path + suffix
+    try:
+        X = np.memmap(x_tmp, dtype=np.float32, mode="w+", shape=(n_rows, n_cols))
+        y = np.memmap(y_tmp, dtype=np.float32, mode="w+", shape=(n_rows,))
+
+        row = 0
+        for batch in pf.iter_batches(batch_size=BATCH_ROWS, columns=feature_cols + [TARGET_COL]):
+            pdf = batch.to_pandas()
+            end = row + len(pdf)
+            X[row:end] = pdf[feature_cols].to_numpy(dtype=np.float32, na_value=np.nan)
+            y[row:end] = pdf[TARGET_COL].to_numpy(dtype=np.float32, na_value=np.nan)
+            row = end
+
+        X.flush()
+        y.flush()
+        del X, y
+        # y first: x_path is what marks the pair as complete
+        os.replace(y_tmp, y_path)
+        os.replace(x_tmp, x_path)
+    finally:
+        for path in (x_tmp, y_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+    _evict_memmaps(work_dir, keep=base)
+    return _open_memmaps(x_path, y_path, n_rows, n_cols)
+
+
+def _memmap_entry(path: str) -> Optional[str]:
+    # <base>.X.f32 / <base>.y.f32 / <base>.<scheme><n>.blocks.npy -> <base>;
+    # None for anything else (e.g. arrays still being written)
+    name = os.path.basename(path)
+    for suffix in (".X.f32", ".y.f32"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    if name.endswith(".blocks.npy"):
+        return name[: -len(".blocks.npy")].rpartition(".")[0] or None
+    return None
+
+
+def _evict_memmaps(work_dir: str, keep: Optional[str] = None) -> None:
+    """
+    Same policy and caps as the Parquet cache (spark_app._evict_lru), with
+    one entry per source file: its X / y arrays plus the fold blocks
+    tuning wrote for it. `keep` is the base name of the entry in use.
+    """
+    entries: Dict[str, List[str]] = {}
+    for path in glob.glob(os.path.join(work_dir, "*")):
+        entry = _memmap_entry(path)
+        if entry is not None:
+            entries.setdefault(entry, []).append(path)
+    _evict_lru(entries, keep=keep)
+
+
+def _open_memmaps(x_path: str, y_path: str, n_rows: int, n_cols: int) -> Tuple[np.memmap, np.memmap]:
+    # Copy-on-write, not read-only: sklearn's forests write into X's buffer
+    # when it has NaNs; touched pages are private and never reach the file
+    return (
+        np.memmap(x_path, dtype=np.float32, mode="c", shape=(n_rows, n_cols)),
+        np.memmap(y_path, dtype=np.float32, mode="c", shape=(n_rows,)),
+    )
+
+
+def _stratified_sample(
+    y: np.ndarray, candidates: np.ndarray, size: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    `size` indices from `candidates`, spread over target quantile bins in
+    proportion to how many candidates each bin holds.
+    """
+    if size >= len(candidates):
+        return np.sort(candidates)
+
+    y_cand = np.asarray(y[candidates])
+    edges = np.nanquantile(y_cand, np.linspace(0, 1, SAMPLE_BINS + 1)[1:-1])
+    bins = np.digitize(y_cand, edges)
+
+    picked = []
+    for b in np.unique(bins):
+        members = candidates[bins == b]
+        take = max(1, int(round(size * len(members) / len(candidates))))
+        picked.append(rng.choice(members, size=min(take, len(members)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+def _predict_batched(
+    model: RegressorMixin, X: np.ndarray, idx: np.ndarray, feature_cols: List[str]
+) -> np.ndarray:
+    out = np.empty(len(idx), dtype=np.float64)
+    for start in range(0, len(idx), BATCH_ROWS):
+        block = idx[start:start + BATCH_ROWS]
+        out[start:start + len(block)] = model.predict(pd.DataFrame(X[block], columns=feature_cols))
+    return out
+
+
+def train_out_of_core(
+    parquet_path: str,
+    estimator: str = DEFAULT_ESTIMATOR,
+    sample_size: Optional[int] = None,
+    n_shards: int = 1,
+    force_retrain: bool = False,
+    work_dir: str = MEMMAP_DIR,
+) -> Tuple[RegressorMixin, Dict[str, float]]:
+    """
+    train_model for data larger than RAM, reading a featurized Parquet file:
+    - features are written once to a float32 memmap (see parquet_to_memmap)
+    - the train/test split is a split of row indices; with no sampling the
+      model is fitted on the whole memmap with zero weight on test rows,
+      so X is never copied
+    - `sample_size` fits on a stratified (by target quantile) sample instead
+    - `n_shards` > 1 (random_forest only) fits that many smaller forests on
+      bootstrap shards of the training rows and merges their trees
+    Metrics include the peak RSS in MB of the memmap and training stage
+    alone (profiling.peak_rss_during).
+    """
+    feature_cols = _parquet_feature_cols(parquet_path)
+    if not feature_cols:
+        raise ValueError("No numeric feature columns found to train on.")
+    if n_shards > 1 and estimator != "random_forest":
+        raise ValueError("Bootstrap shards are only supported for the random_forest estimator.")
+
+    params = dict(
+        ESTIMATORS[estimator][1],
+        estimator=estimator,
+        test_size=TEST_SIZE,
+        split_seed=SPLIT_SEED,
+        sample_size=sample_size,
+        n_shards=n_shards,
+    )
+    # File sizes / mtimes: a fixed path such as lake/features gets a new key once rewritten
+    fingerprint = model_registry.path_fingerprint(parquet_path, feature_cols + [TARGET_COL])
+    key = model_registry.registry_key(fingerprint, params)
+
+    entry = None if force_retrain else model_registry.load_compatible(key, feature_cols)
+    if entry is not None:
+        model, meta = entry
+        return model, meta["metrics"]
+
+    # Only the memmap + training stage: the featurization that produced
+    # parquet_path (in-memory or not) is not part of this measurement
+    with peak_rss_during() as rss:
+        X, y = parquet_to_memmap(parquet_path, feature_cols, work_dir=work_dir)
+        n_rows = len(y)
+
+        rng = np.random.default_rng(SPLIT_SEED)
+        order = rng.permutation(n_rows)
+        n_test = int(np.ceil(n_rows * TEST_SIZE))
+        test_idx, train_idx = np.sort(order[:n_test]), np.sort(order[n_test:])
+
+        # Sampled / sharded fits get DataFrames so the model records its feature
+        # names like train_model's does (predict_with_model selects columns by them)
+        if n_shards > 1:
+            shard_size = sample_size or len(train_idx) // n_shards
+            trees_per_shard = max(1, ESTIMATORS[estimator][1]["n_estimators"] // n_shards)
+            model = None
+            for shard in range(n_shards):
+                idx = np.sort(rng.choice(train_idx, size=shard_size, replace=True))
+                shard_model = make_estimator(estimator)
+                shard_model.set_params(n_estimators=trees_per_shard, random_state=SPLIT_SEED + shard)
+                shard_model.fit(pd.DataFrame(X[idx], columns=feature_cols), y[idx])
+                if model is None:
+                    model = shard_model
+                else:
+                    model.estimators_ += shard_model.estimators_
+            model.n_estimators = len(model.estimators_)
+        elif sample_size:
+            idx = _stratified_sample(y, train_idx, sample_size, rng)
+            model = make_estimator(estimator)
+            model.fit(pd.DataFrame(X[idx], columns=feature_cols), y[idx])
+        else:
+            weights = np.zeros(n_rows, dtype=np.float32)
+            weights[train_idx] = 1.0
+            model = make_estimator(estimator)
+            model.fit(X, y, sample_weight=weights)
+            # Fitted on the bare memmap (a DataFrame would copy it), so record
+            # the names sklearn would have stored
+            model.feature_names_in_ = np.asarray(feature_cols, dtype=object)
+
+        y_pred = _predict_batched(model, X, test_idx, feature_cols)
+        y_test = np.asarray(y[test_idx])
+
+    metrics = dict(model_registry.regression_metrics(y_test, y_pred), peak_rss_mb=rss["peak_rss_mb"])
+
+    model.category_vocab_ = _parquet_category_vocab(parquet_path)
+
+    model_registry.save_model(
+        key,
+        model,
+        {
+            "feature_cols": feature_cols,
+            "data_fingerprint": fingerprint,
+            "params": params,
+            "metrics": metrics,
+            "category_vocab": model.category_vocab_,
+            "n_rows": n_rows,
+        },
+        latest_path=MODEL_PATH,
+    )
+    return model, metrics
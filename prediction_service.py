@@ -0,0 +1,362 @@
+# prediction_service.py
+"""
+Local HTTP/JSON prediction service.
+
+    python prediction_service.py --port 8765
+
+    POST /predict   {"records": [{<feature>: <number>, ...}, ...]}  (or one record)
+                    -> {"predictions": [...]}
+                    a category may be sent as its value ("Borough": "BRONX")
+                    instead of its code column; it is coded like in training
+    GET  /health    -> model info, the expected feature columns and the
+                    category (and segment key) columns sent as strings
+    GET  /metrics   -> request counts, p50/p99 latency, throughput, batch sizes
+
+Concurrent requests are queued and coalesced into one vectorized
+predict_with_model call per micro-batch.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import features
+from forest_inference import CompiledForest
+from spark_app import MODEL_PATH, predict_with_model
+
+
+# Micro-batching: a batch is flushed when it is full or the oldest request
+# has waited this long
+MAX_BATCH = 256
+MAX_WAIT_MS = 5.0
+# Latency samples kept for the percentiles
+LATENCY_WINDOW = 10_000
+MAX_BODY_BYTES = 10 * 1024 ** 2
+
+
+class ValidationError(ValueError):
+    pass
+
+
+class ServiceStats:
+    """
+    Request / batch counters and a sliding window of request latencies.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.records = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_records = 0
+        # Batches that failed and were rescored one request at a time
+        self.fallback_batches = 0
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self.started
+        lat = np.asarray(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+        return {
+            "uptime_s": round(uptime, 3),
+            "requests": self.requests,
+            "records": self.records,
+            "errors": self.errors,
+            "batches": self.batches,
+            "fallback_batches": self.fallback_batches,
+            "mean_batch_size": round(self.batched_records / self.batches, 2) if self.batches else 0.0,
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p99_ms": round(float(np.percentile(lat, 99)), 3),
+            "requests_per_s": round(self.requests / uptime, 2) if uptime else 0.0,
+            "records_per_s": round(self.records / uptime, 2) if uptime else 0.0,
+        }
+
+
+class MicroBatcher:
+    """
+    Collects records from concurrent requests and scores them together.
+    """
+
+    def __init__(self, model, columns: List[str], stats: ServiceStats):
+        self.model = model
+        # Feature columns plus the raw category columns records may carry
+        self.columns = columns
+        self.stats = stats
+        self.queue: "asyncio.Queue[Tuple[List[Dict[str, Any]], asyncio.Future]]" = asyncio.Queue()
+
+    async def predict(self, records: List[Dict[str, Any]]) -> List[float]:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((records, future))
+        return await future
+
+    def _score(self, rows: List[Dict[str, Any]]) -> List[float]:
+        frame = pd.DataFrame.from_records(rows, columns=self.columns)
+        return predict_with_model(self.model, frame, inplace=True)[features.PREDICTION_COL].tolist()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            size = len(items[0][0])
+            deadline = loop.time() + MAX_WAIT_MS / 1000
+            while size < MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                size += len(item[0])
+
+            rows = [rec for records, _ in items for rec in records]
+            try:
+                preds = await loop.run_in_executor(None, self._score, rows)
+            except Exception:
+                # Score each request on its own, so one bad request fails only itself
+                self.stats.fallback_batches += 1
+                for records, future in items:
+                    try:
+                        result = await loop.run_in_executor(None, self._score, records)
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        self.stats.batches += 1
+                        self.stats.batched_records += len(records)
+                        if not future.done():
+                            future.set_result(result)
+                continue
+
+            self.stats.batches += 1
+            self.stats.batched_records += len(rows)
+            start = 0
+            for records, future in items:
+                if not future.done():
+                    future.set_result(preds[start:start + len(records)])
+                start += len(records)
+
+
+def validate_records(
+    payload: Any,
+    feature_cols: List[str],
+    key_cols: Optional[List[str]] = None,
+    category_cols: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Accept {"records": [...]}, a list of records or one record; every record
+    must carry a finite number (or null) for each training feature column. The
+    `key_cols` among them (a segmented model's routing column) may be strings.
+    A code column in `category_cols` ({code column: category column}) may
+    be replaced by a string (or null) in its category column.
+    """
+    key_cols = set(key_cols or [])
+    category_cols = category_cols or {}
+    if isinstance(payload, dict) and "records" in payload:
+        records = payload["records"]
+    elif isinstance(payload, list):
+        records = payload
+    else:
+        records = [payload]
+
+    if not isinstance(records, list) or not records:
+        raise ValidationError("Expected a non-empty list of records.")
+
+    for i, rec in enumerate(records):
+        if not isinstance(rec, dict):
+            raise ValidationError(f"Record {i} is not a JSON object.")
+        missing = [
+            c for c in feature_cols
+            if c not in rec and not (c in category_cols and category_cols[c] in rec)
+        ]
+        if missing:
+            raise ValidationError(f"Record {i} is missing feature columns: {missing}")
+        bad = [
+            c for c in feature_cols
+            if c not in key_cols
+            and rec.get(c) is not None
+            and (isinstance(rec[c], bool) or not isinstance(rec[c], (int, float)))
+        ]
+        if bad:
+            raise ValidationError(f"Record {i} has non-numeric values for: {bad}")
+        not_text = [
+            c for c in category_cols.values()
+            if rec.get(c) is not None and not isinstance(rec[c], str)
+        ]
+        if not_text:
+            raise ValidationError(f"Record {i} has non-string category values for: {not_text}")
+        # json.loads accepts NaN / Infinity, which the model can't score
+        non_finite = [
+            c for c in feature_cols
+            if c not in key_cols and isinstance(rec.get(c), float) and not math.isfinite(rec[c])
+        ]
+        if non_finite:
+            raise ValidationError(f"Record {i} has non-finite values for: {non_finite}")
+    return records
+
+
+class PredictionService:
+    def __init__(self, model, model_path: str):
+        self.model = model
+        self.model_path = model_path
+        names = getattr(model, "feature_names_in_", None)
+        if names is None:
+            raise ValueError("Model was not fitted on a DataFrame; feature columns unknown.")
+        self.feature_cols = list(names)
+        # Per-segment models (segment_models.SegmentedModel) route on a non-numeric column
+        segment_col = getattr(model, "segment_col", None)
+        self.key_cols = [segment_col] if segment_col else []
+        # Categories the model can code itself: {code column: category column}
+        vocab = getattr(model, "category_vocab_", None) or {}
+        self.category_values = {col: [v for v in values if v is not None] for col, values in vocab.items()}
+        self.category_cols = {
+            features.code_column(col): col for col in vocab
+            if features.code_column(col) in self.feature_cols
+        }
+        self.stats = ServiceStats()
+        self.batcher: Optional[MicroBatcher] = None
+
+    async def handle_request(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        if method == "GET" and path == "/health":
+            return 200, {
+                "status": "ok",
+                "model": type(self.model).__name__,
+                "model_path": self.model_path,
+                "feature_cols": self.feature_cols,
+                "category_cols": sorted(self.category_cols.values()),
+                "key_cols": self.key_cols,
+                "category_values": {
+                    col: self.category_values.get(col, [])
+                    for col in sorted(set(self.category_cols.values()) | set(self.key_cols))
+                },
+            }
+        if method == "GET" and path == "/metrics":
+            return 200, self.stats.snapshot()
+        if method != "POST" or path != "/predict":
+            return 404, {"error": f"No route for {method} {path}"}
+
+        start = time.perf_counter()
+        self.stats.requests += 1
+        try:
+            records = validate_records(
+                json.loads(body or b"null"), self.feature_cols, self.key_cols, self.category_cols
+            )
+        except (ValidationError, json.JSONDecodeError, UnicodeDecodeError) as e:
+            # UnicodeDecodeError: a body that isn't UTF-8
+            self.stats.errors += 1
+            return 400, {"error": str(e)}
+
+        try:
+            preds = await self.batcher.predict(records)
+        except Exception as e:
+            self.stats.errors += 1
+            return 500, {"error": str(e)}
+
+        self.stats.records += len(records)
+        self.stats.latencies_ms.append((time.perf_counter() - start) * 1000)
+        return 200, {"predictions": preds}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Minimal HTTP/1.1: request line, headers, Content-Length body;
+        keeps the connection open unless the client asks to close it.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    status, payload = 400, {"error": "Invalid Content-Length header."}
+                    # Where the body ends is unknown, so the stream can't carry another request
+                    keep_alive = False
+                elif length > MAX_BODY_BYTES:
+                    status, payload = 413, {"error": "Request body too large."}
+                    # The body is left unread, so the stream can't carry another request
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.handle_request(method, target.split("?")[0], body)
+
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                    + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        columns = self.feature_cols + [
+            c for c in sorted(self.category_cols.values()) if c not in self.feature_cols
+        ]
+        self.batcher = MicroBatcher(self.model, columns, self.stats)
+        batch_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving {type(self.model).__name__} ({len(self.feature_cols)} features) on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batch_task.cancel()
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local water bill prediction service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--model", default=MODEL_PATH,
+        help="Persisted model: joblib, or a .forest.npz from forest_inference.py",
+    )
+    args = parser.parse_args()
+
+    # Loaded once at startup
+    if args.model.endswith(".npz"):
+        model = CompiledForest.load(args.model)
+    else:
+        model = joblib.load(args.model)
+    service = PredictionService(model, args.model)
+    asyncio.run(service.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# process_pools.py
+"""
+Local process pools for the CPU-bound fan-outs (report charts, per-segment
+fits, CV folds).
+
+Workers are spawned, not forked: the parent may be a Streamlit server
+holding threads and a Spark JVM gateway, neither of which survives a fork.
+Spawned workers re-import their module, so tasks must be top-level
+functions with picklable arguments.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+
+def spawn_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    ProcessPoolExecutor whose workers are spawned (None: one per CPU).
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
@@ -0,0 +1,191 @@
+# profiling.py
+"""
+Lightweight per-stage instrumentation: wall time, CPU time, peak RSS and
+row counts for named stages, optionally appended to a JSON lines file and,
+per run, dumped as a cProfile .prof file.
+
+    with profiling.run("pipeline") as records:
+        with profiling.stage("fit") as rec:
+            model.fit(X, y)
+            rec["rows"] = len(X)
+
+Outputs are off by default; enable them with configure() or the
+WATER_PROFILE_LOG / WATER_PROFILE_DIR environment variables.
+"""
+
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+
+# JSON lines file every finished stage is appended to (None = off)
+PROFILE_LOG: Optional[str] = os.environ.get("WATER_PROFILE_LOG") or None
+# Directory receiving one cProfile dump per run() (None = off)
+PROFILE_DIR: Optional[str] = os.environ.get("WATER_PROFILE_DIR") or None
+
+# Stages are recorded into the innermost run() of the current thread
+_LOCAL = threading.local()
+_LOG_LOCK = threading.Lock()
+
+
+def configure(log_path: Optional[str] = None, profile_dir: Optional[str] = None) -> None:
+    global PROFILE_LOG, PROFILE_DIR
+    PROFILE_LOG = log_path
+    PROFILE_DIR = profile_dir
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb() -> Optional[float]:
+    """
+    Current resident set size in MB, or None where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+@contextmanager
+def peak_rss_during(interval_s: float = 0.05) -> Iterator[Dict[str, float]]:
+    """
+    Peak RSS reached inside the block only, sampled every `interval_s` by a
+    background thread: unlike peak_rss_mb(), memory freed by earlier stages
+    doesn't count. The yielded dict holds "peak_rss_mb" once the block exits.
+
+    Without /proc (macOS) it falls back to the process high-water mark.
+    """
+    result: Dict[str, float] = {}
+    if current_rss_mb() is None:
+        try:
+            yield result
+        finally:
+            result["peak_rss_mb"] = peak_rss_mb()
+        return
+
+    peak = [current_rss_mb() or 0.0]
+    done = threading.Event()
+
+    def sample() -> None:
+        while not done.wait(interval_s):
+            peak[0] = max(peak[0], current_rss_mb() or 0.0)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield result
+    finally:
+        done.set()
+        sampler.join()
+        result["peak_rss_mb"] = max(peak[0], current_rss_mb() or 0.0)
+
+
+def _write_jsonl(record: Dict[str, Any]) -> None:
+    if not PROFILE_LOG:
+        return
+    line = json.dumps(record, default=str)
+    with _LOG_LOCK:
+        os.makedirs(os.path.dirname(PROFILE_LOG) or ".", exist_ok=True)
+        with open(PROFILE_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def stage(name: str, timings: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Measure one stage. Yields its record; set record["rows"] inside the
+    block to report a row count. Nested stages get a "/"-joined name.
+
+    CPU time is the whole process' (Spark and BLAS threads included).
+    Peak RSS is the process high-water mark after the stage, and
+    rss_growth_mb how much this stage raised it.
+
+    With `timings`, the wall time is also stored there under `name`
+    (used for LAST_STAGE_TIMINGS).
+    """
+    stack = getattr(_LOCAL, "stack", None)
+    if stack is None:
+        stack = _LOCAL.stack = []
+    runs = getattr(_LOCAL, "runs", [])
+
+    stack.append(name)
+    rss_before = peak_rss_mb()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    record: Dict[str, Any] = {
+        "run_id": runs[-1]["run_id"] if runs else None,
+        "stage": "/".join(stack),
+        "depth": len(stack) - 1,
+        "start_s": wall_start - runs[-1]["t0"] if runs else 0.0,
+        "rows": None,
+    }
+    try:
+        yield record
+    finally:
+        wall = time.perf_counter() - wall_start
+        peak = peak_rss_mb()
+        record.update(
+            wall_s=wall,
+            cpu_s=time.process_time() - cpu_start,
+            peak_rss_mb=peak,
+            rss_growth_mb=peak - rss_before,
+            finished_at=datetime.now(timezone.utc).isoformat(),
+        )
+        stack.pop()
+        if timings is not None:
+            timings[name] = wall
+        if runs:
+            runs[-1]["records"].append(record)
+        _write_jsonl(record)
+
+
+@contextmanager
+def run(name: str) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Collect the records of every stage run in this thread inside the block
+    (the run itself is recorded as the outermost stage `name`), in start
+    order once the block exits. With PROFILE_DIR set the block is also run
+    under cProfile.
+    """
+    runs = getattr(_LOCAL, "runs", None)
+    if runs is None:
+        runs = _LOCAL.runs = []
+    current = {"run_id": uuid.uuid4().hex[:12], "records": [], "t0": time.perf_counter()}
+    runs.append(current)
+
+    profiler = cProfile.Profile() if PROFILE_DIR and len(runs) == 1 else None
+    try:
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another thread's run is already being profiled
+                profiler = None
+        with stage(name):
+            yield current["records"]
+    finally:
+        # Records are appended as stages finish; list them in start order
+        current["records"].sort(key=lambda r: r["start_s"])
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{stamp}-{current['run_id']}.prof"))
+        runs.pop()
@@ -0,0 +1,327 @@
+# reports.py
+"""
+PDF reports of the predictions: the whole dataset, or one report per
+segment (borough, month, ...) written in batch.
+
+Charts are rendered in a process pool and handed to FPDF as PNG bytes;
+rendered PNGs are cached on disk by chart kind + data fingerprint.
+
+    python reports.py --by Borough
+    python reports.py --by month --output-dir reports/monthly
+    python reports.py --from-lake --start 2022-01-01 --by Borough
+"""
+
+import argparse
+import atexit
+import glob
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import data_lake
+import features
+import model_registry
+from charting import POINT_BUDGET, render_png
+from process_pools import spawn_pool
+
+
+REPORT_DIR = "reports"
+FIGURE_CACHE_DIR = os.path.join("cache", "figures")
+FIGURE_CACHE_MAX_ENTRIES = 512
+
+REPORT_TITLE = "Water Bill Prediction Report"
+# (chart kind, page title), in report order
+REPORT_CHARTS = [
+    ("time_series", "Actual vs Predicted Bill Over Time"),
+    ("scatter", "Actual vs Predicted Scatter"),
+    ("error_hist", "Prediction Error Distribution"),
+]
+# Columns the report charts read; all a worker is sent
+CHART_COLS = [features.TIMESTAMP_COL, features.TARGET_COL, features.PREDICTION_COL]
+# Segment by calendar month of Date_Time instead of a column
+MONTH_SEGMENT = "month"
+
+# Lazily created, shared by every report in this process
+_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def get_report_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Return the shared chart-rendering pool (process_pools.spawn_pool),
+    created on first use and shut down at interpreter exit.
+    """
+    global _POOL
+    if _POOL is None:
+        _POOL = spawn_pool(max_workers)
+        atexit.register(shutdown_report_pool)
+    return _POOL
+
+
+def shutdown_report_pool() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(cancel_futures=True)
+        _POOL = None
+
+
+def _figure_path(kind: str, fingerprint: str, max_points: int) -> str:
+    key = hashlib.sha256(f"{kind}|{max_points}|{fingerprint}".encode("utf-8")).hexdigest()[:24]
+    return os.path.join(FIGURE_CACHE_DIR, f"{key}.png")
+
+
+def _evict_figures() -> None:
+    entries = glob.glob(os.path.join(FIGURE_CACHE_DIR, "*.png"))
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[FIGURE_CACHE_MAX_ENTRIES:]:
+        os.remove(path)
+
+
+def render_charts(
+    frames: List[pd.DataFrame],
+    kinds: List[str],
+    max_points: int = POINT_BUDGET,
+    max_workers: Optional[int] = None,
+) -> List[Dict[str, Optional[bytes]]]:
+    """
+    PNG bytes of every chart kind for every frame ({kind: png} per frame).
+    Cached figures are read from disk; all misses, across frames, are
+    rendered in parallel in the report pool.
+    """
+    results: List[Dict[str, Optional[bytes]]] = [{} for _ in frames]
+    pending = {}
+    pool = None
+    for i, df in enumerate(frames):
+        cols = [c for c in CHART_COLS if c in df.columns]
+        slim = df[cols]
+        fingerprint = model_registry.data_fingerprint(slim, cols)
+        for kind in kinds:
+            path = _figure_path(kind, fingerprint, max_points)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    results[i][kind] = f.read()
+                os.utime(path)  # mark as recently used
+                continue
+            pool = pool or get_report_pool(max_workers)
+            pending[pool.submit(render_png, kind, slim, max_points)] = (i, kind, path)
+
+    if pending:
+        os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+    for future, (i, kind, path) in pending.items():
+        png = future.result()
+        results[i][kind] = png
+        if png is not None:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+    if pending:
+        _evict_figures()
+    return results
+
+
+def segment_metrics(df: pd.DataFrame) -> Dict[str, float]:
+    """
+    R² / RMSE of the predictions over the rows of `df`.
+    """
+    err = (df[features.PREDICTION_COL] - df[features.TARGET_COL]).to_numpy(dtype=np.float64)
+    actual = df[features.TARGET_COL].to_numpy(dtype=np.float64)
+    ss_tot = float(((actual - actual.mean()) ** 2).sum())
+    return {
+        "r2": 1.0 - float((err ** 2).sum()) / ss_tot if ss_tot else float("nan"),
+        "rmse": float(np.sqrt((err ** 2).mean())),
+    }
+
+
+def build_pdf(
+    metrics: Dict[str, float],
+    charts: Dict[str, bytes],
+    rows: int,
+    columns: int,
+    title: str = REPORT_TITLE,
+) -> bytes:
+    """
+    The report PDF: metrics and dataset overview, then one page per chart
+    ({page title: PNG bytes}). Images are embedded from memory.
+    """
+    # Imported here: only report downloads need fpdf
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.cell(0, 10, title, new_x="LMARGIN", new_y="NEXT", align="C")
+
+    pdf.ln(4)
+    pdf.set_font("Helvetica", "", 11)
+    pdf.multi_cell(
+        0,
+        6,
+        "This report summarizes Spark preprocessing and RandomForest predictions "
+        "for Water Bill amounts based on the uploaded dataset.",
+    )
+
+    pdf.ln(4)
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(0, 8, "Model Performance", new_x="LMARGIN", new_y="NEXT")
+
+    pdf.set_font("Helvetica", "", 11)
+    pdf.cell(0, 6, f"R² Score: {metrics['r2']:.4f}", new_x="LMARGIN", new_y="NEXT")
+    pdf.cell(0, 6, f"RMSE: {metrics['rmse']:.4f}", new_x="LMARGIN", new_y="NEXT")
+
+    pdf.ln(4)
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(0, 8, "Dataset Overview", new_x="LMARGIN", new_y="NEXT")
+
+    pdf.set_font("Helvetica", "", 11)
+    pdf.cell(0, 6, f"Rows: {rows}", new_x="LMARGIN", new_y="NEXT")
+    pdf.cell(0, 6, f"Columns: {columns}", new_x="LMARGIN", new_y="NEXT")
+
+    for page_title, png in charts.items():
+        pdf.add_page()
+        pdf.set_font("Helvetica", "B", 13)
+        pdf.cell(0, 8, page_title, new_x="LMARGIN", new_y="NEXT")
+        pdf.image(io.BytesIO(png), x=10, y=28, w=190)
+
+    return bytes(pdf.output())
+
+
+def _titled(pngs: Dict[str, Optional[bytes]]) -> Dict[str, bytes]:
+    return {title: pngs[kind] for kind, title in REPORT_CHARTS if pngs.get(kind)}
+
+
+def generate_pdf_report(
+    df: pd.DataFrame,
+    metrics: Dict[str, float],
+    charts: Optional[Dict[str, bytes]] = None,
+    max_points: int = POINT_BUDGET,
+    max_workers: Optional[int] = None,
+) -> bytes:
+    """
+    Report for the whole frame. `charts` ({page title: PNG bytes}) are used
+    as given; otherwise the REPORT_CHARTS are rendered in parallel.
+    """
+    if charts is None:
+        rendered = render_charts([df], [k for k, _ in REPORT_CHARTS], max_points, max_workers)
+        charts = _titled(rendered[0])
+    return build_pdf(metrics, charts, rows=len(df), columns=len(df.columns))
+
+
+def iter_segments(df: pd.DataFrame, by: str) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """
+    (segment name, rows) per value of column `by`, or per calendar month of
+    Date_Time for MONTH_SEGMENT. Missing values form an "Unknown" segment.
+    """
+    if by == MONTH_SEGMENT:
+        keys = df[features.TIMESTAMP_COL].dt.to_period("M").astype(str)
+    elif by in df.columns:
+        keys = df[by].astype("string").fillna("Unknown")
+    else:
+        raise ValueError(f"Cannot segment by '{by}': no such column")
+    for name, rows in df.groupby(keys, sort=True, observed=True):
+        yield str(name), rows
+
+
+def _safe_filename(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_") or "segment"
+
+
+def generate_segment_reports(
+    df: pd.DataFrame,
+    by: str,
+    output_dir: str = REPORT_DIR,
+    max_points: int = POINT_BUDGET,
+    max_workers: Optional[int] = None,
+    min_rows: int = 2,
+) -> List[str]:
+    """
+    Write one PDF per segment of `df` (see iter_segments) into `output_dir`,
+    with that segment's own metrics and charts. The charts of all segments
+    are rendered in one parallel batch. Returns the written paths.
+    """
+    segments = [(name, rows) for name, rows in iter_segments(df, by) if len(rows) >= min_rows]
+    rendered = render_charts(
+        [rows for _, rows in segments],
+        [k for k, _ in REPORT_CHARTS],
+        max_points=max_points,
+        max_workers=max_workers,
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for (name, rows), pngs in zip(segments, rendered):
+        pdf = build_pdf(
+            segment_metrics(rows),
+            _titled(pngs),
+            rows=len(rows),
+            columns=len(rows.columns),
+            title=f"{REPORT_TITLE} - {by}: {name}",
+        )
+        path = os.path.join(output_dir, f"{_safe_filename(by)}-{_safe_filename(name)}.pdf")
+        with open(path, "wb") as f:
+            f.write(pdf)
+        paths.append(path)
+    return paths
+
+
+def read_lake_predictions(
+    lake_dir: str = data_lake.PREDICTED_DIR,
+    by: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Predicted rows from a data_lake table: only the chart columns (+ the
+    segment column) and only the year/month partitions in [start, end].
+    """
+    columns = list(CHART_COLS)
+    if by and by != MONTH_SEGMENT and by not in columns:
+        columns.append(by)
+    return data_lake.read_partitioned(lake_dir, columns=columns, start=start, end=end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write PDF reports of the water bill predictions.")
+    parser.add_argument("--data", default="dataset/Water_Consumption_And_Cost__2013_-_Feb_2023_.csv",
+                        help="CSV path or glob")
+    parser.add_argument("--by", help=f"Column to write one report per value of, or '{MONTH_SEGMENT}'")
+    parser.add_argument("--output-dir", default=REPORT_DIR)
+    parser.add_argument("--workers", type=int, help="Chart rendering processes")
+    parser.add_argument("--from-lake", nargs="?", const=data_lake.PREDICTED_DIR,
+                        help="Report on a predicted data_lake table instead of running the pipeline "
+                             f"(default {data_lake.PREDICTED_DIR})")
+    parser.add_argument("--start", help="(from-lake) first Date_Time to include, e.g. 2022-01-01")
+    parser.add_argument("--end", help="(from-lake) last Date_Time to include")
+    args = parser.parse_args()
+
+    if args.from_lake:
+        predicted = read_lake_predictions(args.from_lake, by=args.by, start=args.start, end=args.end)
+        if predicted.empty:
+            raise SystemExit(f"No predicted rows in {args.from_lake} for the requested range")
+        metrics = segment_metrics(predicted)
+    else:
+        from spark_app import run_full_pipeline_from_df
+
+        predicted, metrics = run_full_pipeline_from_df(args.data)
+    if args.by:
+        paths = generate_segment_reports(
+            predicted, args.by, output_dir=args.output_dir, max_workers=args.workers
+        )
+        print(f"Wrote {len(paths)} reports to {args.output_dir}")
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        path = os.path.join(args.output_dir, "water_bill_report.pdf")
+        with open(path, "wb") as f:
+            f.write(generate_pdf_report(predicted, metrics, max_workers=args.workers))
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
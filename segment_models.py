@@ -0,0 +1,281 @@
+# segment_models.py
+"""
+Per-segment models: the featurized rows are split by a segment column
+(e.g. Borough or Rate Class, see spark_app.CUBE_DIMENSIONS) and one smaller
+regressor is fitted per segment, the segments concurrently:
+- 'process': a spawned local process pool, one segment per task
+- 'spark': groupBy(segment).applyInPandas, one segment per Spark task
+
+Segments with fewer than SEGMENT_MIN_ROWS training rows, and values not seen
+in training, are predicted by a fallback model fitted on a sample of all
+rows. The models are kept together in one SegmentedModel, registered in
+model_registry like train_model's, which routes every row to its segment's
+model:
+
+    model, metrics = train_segment_models(featurized, "Borough")
+    predicted = spark_app.predict_with_model(model, featurized)
+"""
+
+import pickle
+import time
+from concurrent.futures import as_completed
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import features
+import model_registry
+import profiling
+from process_pools import spawn_pool
+from spark_app import (
+    DEFAULT_ESTIMATOR,
+    ESTIMATORS,
+    MODEL_PATH,
+    SPLIT_SEED,
+    TARGET_COL,
+    TEST_SIZE,
+    _spark_schema,
+    get_spark,
+    make_estimator,
+)
+
+if TYPE_CHECKING:
+    from sklearn.base import RegressorMixin
+
+
+SEGMENT_BACKENDS = ["process", "spark"]
+# Segments with fewer training rows than this are left to the fallback model
+SEGMENT_MIN_ROWS = 500
+# Training rows the fallback model is fitted on, sampled across all segments
+FALLBACK_SAMPLE_ROWS = 50_000
+# Overrides of the ESTIMATORS defaults: each model only sees its segment's rows
+SEGMENT_PARAMS = {
+    "random_forest": {"n_estimators": 100},
+    "hist_gradient_boosting": {},
+}
+# Segment of rows with no value in the segment column
+MISSING_SEGMENT = "Unknown"
+# Task name of the fallback model (not a segment value)
+FALLBACK_TASK = "__fallback__"
+# Column carrying the task name in the Spark backend
+_TASK_COL = "__segment_task__"
+
+
+def segment_keys(values: pd.Series) -> np.ndarray:
+    """
+    Segment of every row: the column value as a string, MISSING_SEGMENT for nulls.
+    """
+    return values.astype("string").fillna(MISSING_SEGMENT).to_numpy(dtype=object)
+
+
+class SegmentedModel:
+    """
+    One fitted regressor per value of `segment_col`, plus `fallback` for
+    every other value. feature_names_in_ is the feature columns followed by
+    `segment_col`, so predict_with_model, score_with_spark and the
+    prediction service hand it the routing column along with the features.
+    category_vocab_ is the category coding of the training rows, which
+    those callers apply before predict (see spark_app.model_inputs).
+    """
+
+    def __init__(
+        self,
+        segment_col: str,
+        feature_cols: List[str],
+        models: Dict[str, "RegressorMixin"],
+        fallback: "RegressorMixin",
+        estimator: str,
+    ):
+        self.segment_col = segment_col
+        self.feature_cols = list(feature_cols)
+        self.feature_names_in_ = np.asarray(self.feature_cols + [segment_col], dtype=object)
+        self.models = models
+        self.fallback = fallback
+        self.estimator = estimator
+        self.category_vocab_: Dict[str, List[Optional[str]]] = {}
+
+    def predict(self, X: pd.DataFrame) -> np.ndarray:
+        keys = segment_keys(X[self.segment_col])
+        X = X[self.feature_cols]
+        preds = np.empty(len(X), dtype=np.float64)
+        # One vectorized predict per segment present in X
+        for segment, idx in pd.Series(keys).groupby(keys, sort=False).indices.items():
+            preds[idx] = self.models.get(segment, self.fallback).predict(X.iloc[idx])
+        return preds
+
+
+def _fit_segment(
+    task: str, X: pd.DataFrame, y: pd.Series, estimator: str, params: Dict[str, Any]
+) -> Tuple[str, "RegressorMixin", float]:
+    model = make_estimator(estimator, params)
+    if "n_jobs" in model.get_params():
+        # Segments run side by side; one core each avoids oversubscription
+        model.set_params(n_jobs=1)
+    start = time.perf_counter()
+    model.fit(X, y)
+    return task, model, time.perf_counter() - start
+
+
+def _fit_with_pool(
+    tasks: List[Tuple[str, pd.DataFrame, pd.Series]],
+    estimator: str,
+    params: Dict[str, Any],
+    max_workers: Optional[int],
+) -> List[Tuple[str, "RegressorMixin", float]]:
+    with spawn_pool(max_workers) as pool:
+        futures = [pool.submit(_fit_segment, task, X, y, estimator, params) for task, X, y in tasks]
+        return [future.result() for future in as_completed(futures)]
+
+
+def _fit_with_spark(
+    tasks: List[Tuple[str, pd.DataFrame, pd.Series]],
+    feature_cols: List[str],
+    estimator: str,
+    params: Dict[str, Any],
+) -> List[Tuple[str, "RegressorMixin", float]]:
+    from pyspark.sql.types import BinaryType, DoubleType, StringType, StructField, StructType
+
+    spark = get_spark()
+    pdf = pd.concat(
+        [X.assign(**{TARGET_COL: y, _TASK_COL: task}) for task, X, y in tasks],
+        ignore_index=True,
+    )
+    sdf = spark.createDataFrame(pdf, schema=_spark_schema(pdf))
+    out_schema = StructType([
+        StructField("task", StringType(), nullable=False),
+        StructField("model", BinaryType(), nullable=False),
+        StructField("fit_s", DoubleType(), nullable=False),
+    ])
+
+    def fit_group(group: pd.DataFrame) -> pd.DataFrame:
+        task, model, fit_s = _fit_segment(
+            group[_TASK_COL].iloc[0], group[feature_cols], group[TARGET_COL], estimator, params
+        )
+        return pd.DataFrame({"task": [task], "model": [pickle.dumps(model)], "fit_s": [fit_s]})
+
+    # Only the fitted models come back to the driver
+    rows = sdf.groupBy(_TASK_COL).applyInPandas(fit_group, schema=out_schema).collect()
+    return [(row["task"], pickle.loads(row["model"]), row["fit_s"]) for row in rows]
+
+
+def train_segment_models(
+    df: Union[pd.DataFrame, str],
+    segment_col: str,
+    force_retrain: bool = False,
+    estimator: str = DEFAULT_ESTIMATOR,
+    params: Optional[Dict[str, Any]] = None,
+    backend: str = "process",
+    max_workers: Optional[int] = None,
+    min_rows: int = SEGMENT_MIN_ROWS,
+) -> Tuple[SegmentedModel, Dict[str, float]]:
+    """
+    train_model with one model per `segment_col` value. The rows are split
+    into train / test as in train_model, so r2 / rmse (over the whole test
+    split, each row scored by its segment's model) compare directly with
+    the global model's. `params` overrides SEGMENT_PARAMS on top of the
+    estimator defaults. `df` is a featurized frame or a Parquet path (read
+    into memory). The registry is checked first, as in train_model.
+    """
+    if backend not in SEGMENT_BACKENDS:
+        raise ValueError(f"Unknown segment backend '{backend}', expected one of {SEGMENT_BACKENDS}")
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown estimator '{estimator}', expected one of {sorted(ESTIMATORS)}")
+    if isinstance(df, str):
+        df = pd.read_parquet(df)
+    if TARGET_COL not in df.columns:
+        raise ValueError(f"Missing target column: {TARGET_COL}")
+    if segment_col not in df.columns:
+        raise ValueError(f"Cannot segment by missing column: {segment_col}")
+
+    feature_cols = [c for c in features.feature_columns(df) if c != segment_col]
+    if not feature_cols:
+        raise ValueError("No numeric feature columns found to train on.")
+
+    params = dict(SEGMENT_PARAMS[estimator], **(params or {}))
+    registry_params = dict(
+        ESTIMATORS[estimator][1],
+        **params,
+        estimator=estimator,
+        segment_by=segment_col,
+        segment_min_rows=min_rows,
+        fallback_rows=FALLBACK_SAMPLE_ROWS,
+        test_size=TEST_SIZE,
+        split_seed=SPLIT_SEED,
+    )
+    fingerprint = model_registry.data_fingerprint(df, feature_cols + [TARGET_COL, segment_col])
+    key = model_registry.registry_key(fingerprint, registry_params)
+
+    entry = None if force_retrain else model_registry.load_compatible(key, feature_cols)
+    if entry is not None:
+        model, meta = entry
+        return model, meta["metrics"]
+
+    from sklearn.model_selection import train_test_split
+
+    # Same split as train_model's
+    train_idx, test_idx = train_test_split(
+        np.arange(len(df)), test_size=TEST_SIZE, random_state=SPLIT_SEED
+    )
+    train = df.iloc[train_idx]
+    test = df.iloc[test_idx]
+    keys = segment_keys(train[segment_col])
+
+    sizes = pd.Series(keys).value_counts()
+    segments = sizes[sizes >= min_rows].index.tolist()
+    rng = np.random.default_rng(SPLIT_SEED)
+    fallback_rows = rng.choice(len(train), size=min(len(train), FALLBACK_SAMPLE_ROWS), replace=False)
+
+    # Largest segments first, so the pool isn't left waiting on one big fit
+    tasks = [(FALLBACK_TASK, train.iloc[np.sort(fallback_rows)])]
+    tasks += [(segment, train[keys == segment]) for segment in segments]
+    tasks = sorted(
+        [(task, rows[feature_cols], rows[TARGET_COL]) for task, rows in tasks],
+        key=lambda t: len(t[1]),
+        reverse=True,
+    )
+
+    with profiling.stage("fit") as rec:
+        if backend == "spark":
+            fitted = _fit_with_spark(tasks, feature_cols, estimator, params)
+        else:
+            fitted = _fit_with_pool(tasks, estimator, params, max_workers)
+        rec["rows"] = len(train)
+
+    models = {task: model for task, model, _ in fitted}
+    fit_seconds = {task: fit_s for task, _, fit_s in fitted}
+    fallback = models.pop(FALLBACK_TASK)
+    model = SegmentedModel(segment_col, feature_cols, models, fallback, estimator)
+    model.category_vocab_ = features.extract_category_vocab(df)
+
+    with profiling.stage("evaluate") as rec:
+        y_pred = model.predict(test)
+        rec["rows"] = len(test)
+
+    metrics = dict(model_registry.regression_metrics(test[TARGET_COL], y_pred), segments=len(models))
+    test_keys = segment_keys(test[segment_col])
+    per_segment = {}
+    for segment in list(models) + [FALLBACK_TASK]:
+        rows = ~np.isin(test_keys, list(models)) if segment == FALLBACK_TASK else test_keys == segment
+        per_segment[segment] = dict(
+            model_registry.regression_metrics(test[TARGET_COL][rows], y_pred[rows]) if rows.any() else {},
+            train_rows=int(len(fallback_rows) if segment == FALLBACK_TASK else sizes[segment]),
+            test_rows=int(rows.sum()),
+            fit_s=fit_seconds[segment],
+        )
+
+    model_registry.save_model(
+        key,
+        model,
+        {
+            "feature_cols": feature_cols,
+            "data_fingerprint": fingerprint,
+            "params": registry_params,
+            "metrics": metrics,
+            "category_vocab": model.category_vocab_,
+            "segments": per_segment,
+            "n_rows": len(df),
+        },
+        latest_path=MODEL_PATH,
+    )
+    return model, metrics
@@ -1,22 +1,62 @@
 # spark_app.py
 
+import atexit
+import glob
+import hashlib
+import importlib
+import json
 import os
-from typing import Tuple, Dict
+import shutil
+import threading
+from functools import reduce
+from typing import TYPE_CHECKING, Any, Callable, Tuple, Dict, List, Optional, Union
 
-import joblib
 import pandas as pd
-from pyspark.sql import SparkSession
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import r2_score, mean_squared_error
-from sklearn.model_selection import train_test_split
+
+import data_lake
+import features
+import model_registry
+import profiling
+import water_schema
+from water_schema import TARGET_COL, TIMESTAMP_COL
+
+# pyspark and scikit-learn take seconds to import, so they are imported
+# inside the functions that use them; importing this module stays cheap
+if TYPE_CHECKING:
+    from pyspark.sql import DataFrame as SparkDataFrame, SparkSession
+    from pyspark.sql.types import StructType
+    from sklearn.base import RegressorMixin
 
 
 MODEL_DIR = "model"
 MODEL_PATH = os.path.join(MODEL_DIR, "water_bill_model.joblib")
 
-TIMESTAMP_COL = "Date_Time"
-# We will map the input 'Charging_Load_kW' to this target column internally
-TARGET_COL = "Water_Bill_Amount"
+# Cleaned datasets are cached here as Parquet, keyed by input + cleaning config
+CACHE_DIR = "cache"
+CACHE_MAX_ENTRIES = 8
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Bump whenever the cleaning logic changes so old cache entries are ignored
+PIPELINE_VERSION = "2"
+# Rows per account bucket when featurizing out of core (featurize_with_spark);
+# one bucket at a time is held in driver memory
+FEATURE_BUCKET_ROWS = 500_000
+_BUCKET_COL = "feature_bucket"  # no leading "_": readers skip such paths
+_BUCKET_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+_BUCKET_TS_SPARK_FORMAT = "yyyy-MM-dd HH:mm:ss"
+
+# Raw CSV headers -> names used by the pipeline
+RENAME_MAP = {
+    "Service End Date": TIMESTAMP_COL,
+    "Current Charges": TARGET_COL,
+    "Charging_Load_kW": TARGET_COL,
+}
+
+# Numeric columns of the raw water extract (Spark type names); anything
+# else is read as string
+RAW_NUMERIC_COLS = {
+    col: "long" if kind == "integer" else "double"
+    for col, kind in water_schema.NUMERIC_COLS.items()
+}
 
 # Columns to drop (from the original dataset structure)
 CATEGORICAL_COLS = [
@@ -29,67 +69,285 @@ CATEGORICAL_COLS = [
     "Weekday",
 ]
 
+# Analytics cube: actual vs predicted per month, overall and per value of
+# each dimension. The CATEGORICAL_COLS above are not in the water extract,
+# so the dimensions come from its water_schema category columns.
+CUBE_DIMENSIONS = ["Borough", "Rate Class", "Funding Source", "Development Name"]
+CUBE_QUANTILES = [0.1, 0.5, 0.9]
+# Dimension / Value of the rows aggregated over everything
+CUBE_ALL = "All"
+# Bump whenever the cube columns change so cached cubes are rebuilt
+CUBE_VERSION = "1"
+
+
+# Lazily created, shared by every pipeline run in this process
+_SPARK: Optional["SparkSession"] = None
+_SPARK_LOCK = threading.Lock()
+
+# Seconds spent in each Spark stage of the last preprocess_with_spark call
+LAST_STAGE_TIMINGS: Dict[str, float] = {}
+
+# Size in MB of the last cleaned frame before / after applying water_schema
+LAST_MEMORY_MB: Dict[str, float] = {}
+
+
+def get_spark(app_name: str = "Water_Bill_Predictions", master: Optional[str] = None) -> "SparkSession":
+    """
+    Return the shared Spark session (used only for big-data style preprocessing).
+    Created on first use, reused afterwards and stopped at interpreter exit.
+    `master` (e.g. "local[4]") only applies when the session is created.
+    Thread-safe: a caller arriving during start-up (e.g. while
+    start_spark_warmup is running) waits for the same session.
+    """
+    global _SPARK
+    with _SPARK_LOCK:
+        if _SPARK is None:
+            from pyspark.sql import SparkSession
+
+            builder = SparkSession.builder
+            if master:
+                builder = builder.master(master)
+            _SPARK = (
+                builder
+                .appName(app_name)
+                .config("spark.sql.legacy.timeParserPolicy", "LEGACY")
+                # Columnar pandas <-> Spark transfer instead of row-by-row pickling
+                .config("spark.sql.execution.arrow.pyspark.enabled", "true")
+                .config("spark.sql.execution.arrow.pyspark.fallback.enabled", "true")
+                .getOrCreate()
+            )
+            atexit.register(stop_spark)
+        return _SPARK
+
+
+def start_spark_warmup() -> threading.Thread:
+    """
+    Import pyspark and start the shared session on a daemon thread, so the
+    JVM is (or is getting) ready by the time a pipeline run needs it.
+    Failures are left for that run to report.
+    """
+    def warm():
+        try:
+            get_spark()
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=warm, name="spark-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_spark() -> None:
+    """
+    Stop the shared Spark session if one was started.
+    """
+    global _SPARK
+    with _SPARK_LOCK:
+        if _SPARK is not None:
+            _SPARK.stop()
+            _SPARK = None
+
 
-def get_spark(app_name: str = "Water_Bill_Predictions") -> SparkSession:
+def _spark_schema(pdf: pd.DataFrame) -> "StructType":
     """
-    Create a Spark session (used only for big-data style preprocessing).
+    Build an explicit Spark schema from the pandas dtypes so createDataFrame
+    doesn't have to infer types row by row.
     """
-    return (
-        SparkSession.builder
-        .appName(app_name)
-        .config("spark.sql.legacy.timeParserPolicy", "LEGACY")
-        .getOrCreate()
+    from pyspark.sql.types import (
+        BooleanType,
+        DoubleType,
+        LongType,
+        StringType,
+        StructField,
+        StructType,
+        TimestampType,
     )
 
+    fields = []
+    for col, dtype in pdf.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            spark_type = BooleanType()
+        elif pd.api.types.is_integer_dtype(dtype):
+            spark_type = LongType()
+        elif pd.api.types.is_float_dtype(dtype):
+            spark_type = DoubleType()
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            spark_type = TimestampType()
+        else:
+            spark_type = StringType()
+        fields.append(StructField(str(col), spark_type, nullable=True))
+    return StructType(fields)
+
+
+# Formats seen in the raw extracts, tried in order (first match wins)
+TIMESTAMP_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%m/%d/%Y %H:%M",
+    "%d/%m/%Y %H:%M",
+    "%Y/%m/%d %H:%M",
+    "%m/%d/%Y",  # Added for Water Bill dataset
+]
+
+# Same formats in Spark (LEGACY parser) pattern syntax, same order
+SPARK_TIMESTAMP_FORMATS = [
+    "yyyy-MM-dd HH:mm:ss",
+    "MM/dd/yyyy HH:mm",
+    "dd/MM/yyyy HH:mm",
+    "yyyy/MM/dd HH:mm",
+    "MM/dd/yyyy",
+]
+
+# source file -> (fingerprint of the column, formats that matched it)
+_DETECTED_FORMATS: Dict[str, Tuple[str, List[str]]] = {}
+
 
-def _parse_timestamp_series(series: pd.Series) -> pd.Series:
+def _parse_timestamp_series(series: pd.Series, source: Optional[str] = None) -> pd.Series:
     """
     Clean + parse the Date_Time column using multiple formats in Pandas
     BEFORE sending to Spark, so Spark doesn't choke on NaN/garbage.
+
+    Each format is applied to the whole column at once, only over the rows
+    still unparsed, always in TIMESTAMP_FORMATS order (so an ambiguous
+    "03/04/2020 10:00" is read the same way every time). When `source` is
+    given and its column is unchanged since the last call, the formats that
+    matched nothing then are skipped.
     """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # Already parsed by water_schema.read_water_csv
+        return series
+
     series = series.astype(str)
     series = series.replace(["NaN", "nan", "None", ""], pd.NA)
 
-    def parse_one(x: str):
-        if pd.isna(x):
-            return pd.NaT
-
-        formats = [
-            "%Y-%m-%d %H:%M:%S",
-            "%m/%d/%Y %H:%M",
-            "%d/%m/%Y %H:%M",
-            "%Y/%m/%d %H:%M",
-            "%m/%d/%Y",  # Added for Water Bill dataset
-        ]
-        for fmt in formats:
-            try:
-                return pd.to_datetime(x, format=fmt)
-            except Exception:
-                continue
-        return pd.NaT
+    fingerprint = None
+    formats = TIMESTAMP_FORMATS
+    if source:
+        values = pd.util.hash_pandas_object(series, index=False).to_numpy()
+        fingerprint = hashlib.sha1(values.tobytes()).hexdigest()
+        cached = _DETECTED_FORMATS.get(source)
+        if cached is not None and cached[0] == fingerprint:
+            formats = [f for f in TIMESTAMP_FORMATS if f in cached[1]]
+
+    parsed = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+    pending = series.notna()
+    matched_formats = []
+
+    for fmt in formats:
+        if not pending.any():
+            break
+        attempt = pd.to_datetime(series[pending], format=fmt, errors="coerce")
+        attempt = attempt[attempt.notna()]
+        if attempt.empty:
+            continue
+        parsed.loc[attempt.index] = attempt
+        pending.loc[attempt.index] = False
+        matched_formats.append(fmt)
+
+    if source:
+        _DETECTED_FORMATS[source] = (fingerprint, matched_formats)
+
+    return parsed
+
+
+def read_csv_with_spark(path: str, since: Optional[pd.Timestamp] = None) -> "SparkDataFrame":
+    """
+    Read one CSV file, a directory or a glob straight into Spark:
+    - explicit schema (no inferSchema pass over the data)
+    - CATEGORICAL_COLS pruned at read time
+    - Date_Time parsed with coalesce(to_timestamp(...)) over all formats
+    - rows with unparseable time or missing target dropped on the executors
+    - with `since`, only rows with Date_Time from it on are kept
+    """
+    from pyspark.sql import functions as F
+    from pyspark.sql.types import DoubleType, LongType, StringType, StructField, StructType
+
+    spark = get_spark()
+
+    # Only the header line is read here
+    header = spark.read.option("header", "true").csv(path).columns
+    spark_types = {"long": LongType(), "double": DoubleType()}
+    schema = StructType([
+        StructField(col, spark_types.get(RAW_NUMERIC_COLS.get(col), StringType()), nullable=True)
+        for col in header
+    ])
+
+    sdf = (
+        spark.read
+        .option("header", "true")
+        .option("mode", "PERMISSIVE")
+        .schema(schema)
+        .csv(path)
+    )
+
+    keep = [
+        c for c in header
+        if c not in CATEGORICAL_COLS and RENAME_MAP.get(c, c) not in CATEGORICAL_COLS
+    ]
+    sdf = sdf.select(*[sdf[c].alias(RENAME_MAP.get(c, c)) for c in keep])
+
+    # Other declared date columns (e.g. service start) are parsed the same way
+    for col in [TIMESTAMP_COL] + water_schema.DATE_COLS:
+        if col in sdf.columns:
+            sdf = sdf.withColumn(
+                col,
+                F.coalesce(*[F.to_timestamp(F.col(col), fmt) for fmt in SPARK_TIMESTAMP_FORMATS]),
+            )
+    if TIMESTAMP_COL in sdf.columns:
+        sdf = sdf.dropna(subset=[TIMESTAMP_COL])
+        if since is not None:
+            sdf = sdf.filter(F.col(TIMESTAMP_COL) >= F.lit(pd.Timestamp(since).to_pydatetime()))
 
-    return series.apply(parse_one)
+    if TARGET_COL in sdf.columns:
+        sdf = sdf.dropna(subset=[TARGET_COL])
 
+    return sdf
 
-def preprocess_with_spark(pdf: pd.DataFrame) -> pd.DataFrame:
+
+def preprocess_with_spark(
+    pdf: Union[pd.DataFrame, str],
+    source: Optional[str] = None,
+    since: Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
     """
     1) Fix timestamp in Pandas using multiple formats
+       (`source` names the input file so its detected formats are reused)
     2) Push to Spark for big-data style cleaning
     3) Drop categorical columns + null target rows
+
+    If `pdf` is a path or glob instead of a DataFrame, the CSV is read and
+    cleaned natively by Spark (see read_csv_with_spark) and only the
+    cleaned result is brought back to the driver.
+
+    `since` keeps only rows with Date_Time from it on (incremental runs;
+    rows at exactly `since` may be new, see incremental.ingest).
     """
-    
+    if isinstance(pdf, str):
+        return _preprocess_csv_with_spark(pdf, since=since)
+
     # Rename target column if it exists as the old name
     if "Charging_Load_kW" in pdf.columns:
         pdf = pdf.rename(columns={"Charging_Load_kW": TARGET_COL})
 
+    timings = {}
+
     # 1) Handle timestamp in Pandas first
     if TIMESTAMP_COL in pdf.columns:
-        pdf[TIMESTAMP_COL] = _parse_timestamp_series(pdf[TIMESTAMP_COL])
-        pdf = pdf.dropna(subset=[TIMESTAMP_COL])
+        with profiling.stage("timestamp_parse", timings) as rec:
+            pdf[TIMESTAMP_COL] = _parse_timestamp_series(pdf[TIMESTAMP_COL], source=source)
+            pdf = pdf.dropna(subset=[TIMESTAMP_COL])
+            if since is not None:
+                pdf = pdf[pdf[TIMESTAMP_COL] >= pd.Timestamp(since)]
+            rec["rows"] = len(pdf)
+    # Other declared date columns, as in the CSV path
+    pdf = _parse_date_cols(pdf)
 
-    # 2) Now send clean-ish frame to Spark
-    spark = get_spark()
-    sdf = spark.createDataFrame(pdf)
+    # 2) Now send clean-ish frame to Spark (Arrow + explicit schema)
+    with profiling.stage("session_start", timings):
+        spark = get_spark()
+
+    with profiling.stage("to_spark", timings) as rec:
+        sdf = spark.createDataFrame(pdf, schema=_spark_schema(pdf))
+        rec["rows"] = len(pdf)
 
     # 3) Drop categorical columns
     drop_cols = [c for c in CATEGORICAL_COLS if c in sdf.columns]
@@ -100,86 +358,976 @@ def preprocess_with_spark(pdf: pd.DataFrame) -> pd.DataFrame:
     if TARGET_COL in sdf.columns:
         sdf = sdf.dropna(subset=[TARGET_COL])
 
-    cleaned = sdf.toPandas()
-    spark.stop()
+    with profiling.stage("to_pandas", timings) as rec:
+        cleaned = _compact(sdf.toPandas())
+        rec["rows"] = len(cleaned)
+
+    LAST_STAGE_TIMINGS.clear()
+    LAST_STAGE_TIMINGS.update(timings)
     return cleaned
 
 
-def train_model(df: pd.DataFrame) -> Tuple[RandomForestRegressor, Dict[str, float]]:
+def _parse_date_cols(pdf: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parse the other declared date columns (e.g. service start) with the
+    TIMESTAMP_FORMATS, as read_csv_with_spark does with their Spark
+    equivalents, so both paths derive the same features. Unparseable dates
+    become NaT; their rows are kept.
+    """
+    for col in water_schema.DATE_COLS:
+        if col in pdf.columns:
+            pdf[col] = _parse_timestamp_series(pdf[col])
+    return pdf
+
+
+def _compact(cleaned: pd.DataFrame) -> pd.DataFrame:
+    """
+    Re-apply the declared dtypes that don't survive Spark (categories,
+    downcast numerics) and record the memory saved.
+    """
+    before = water_schema.memory_mb(cleaned)
+    cleaned = water_schema.apply_schema(cleaned, parse_dates=False)
+    # Bill amounts keep full precision: they are the training target
+    cleaned = water_schema.downcast_numeric(cleaned, exclude=water_schema.CURRENCY_COLS + [TARGET_COL])
+    LAST_MEMORY_MB.clear()
+    LAST_MEMORY_MB.update(before=before, after=water_schema.memory_mb(cleaned))
+    return cleaned
+
+
+def _preprocess_csv_with_spark(path: str, since: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    timings = {}
+    with profiling.stage("session_start", timings):
+        get_spark()
+
+    with profiling.stage("spark_read_clean_to_pandas", timings) as rec:
+        sdf = read_csv_with_spark(path, since=since)
+        cleaned = _compact(sdf.toPandas())
+        rec["rows"] = len(cleaned)
+
+    LAST_STAGE_TIMINGS.clear()
+    LAST_STAGE_TIMINGS.update(timings)
+    return cleaned
+
+
+def _input_fingerprint(raw: Union[pd.DataFrame, str]) -> str:
+    """
+    Hash of the input (file size + mtime for paths, content hash for frames)
+    plus every setting that affects the cleaned output.
+    """
+    h = hashlib.sha256()
+    config = {
+        "version": PIPELINE_VERSION,
+        "categorical": CATEGORICAL_COLS,
+        "formats": TIMESTAMP_FORMATS,
+        "spark_formats": SPARK_TIMESTAMP_FORMATS,
+        "rename": RENAME_MAP,
+        "schema": water_schema.schema_config(),
+    }
+    h.update(json.dumps(config, sort_keys=True).encode("utf-8"))
+
+    if isinstance(raw, str):
+        for line in model_registry.file_stats(raw):
+            h.update(line.encode("utf-8"))
+    else:
+        h.update(",".join(map(str, raw.columns)).encode("utf-8"))
+        try:
+            row_hashes = pd.util.hash_pandas_object(raw, index=False)
+        except TypeError:
+            # Mixed-type object columns
+            row_hashes = pd.util.hash_pandas_object(raw.astype(str), index=False)
+        h.update(row_hashes.values.tobytes())
+
+    return h.hexdigest()[:24]
+
+
+def _evict_lru(entries: Dict[str, List[str]], keep: Optional[str] = None) -> None:
+    """
+    Keep the most recently used of `entries` (entry -> its files, aged by
+    the newest one) within CACHE_MAX_ENTRIES / CACHE_MAX_BYTES.
+    `keep` (the entry just written) is never evicted, even when it alone
+    is over the byte cap: its caller is about to return its path.
+    """
+    order = sorted(entries, key=lambda e: max(map(os.path.getmtime, entries[e])), reverse=True)
+    if keep in entries:
+        order = [keep] + [e for e in order if e != keep]
+
+    total = 0
+    for i, entry in enumerate(order):
+        total += sum(map(os.path.getsize, entries[entry]))
+        if i > 0 and (i >= CACHE_MAX_ENTRIES or total > CACHE_MAX_BYTES):
+            for path in entries[entry]:
+                os.remove(path)
+
+
+def _evict_cache(keep: Optional[str] = None) -> None:
+    """
+    _evict_lru over the Parquet entries of CACHE_DIR.
+    """
+    entries = {os.path.abspath(p): [p] for p in glob.glob(os.path.join(CACHE_DIR, "*.parquet"))}
+    _evict_lru(entries, keep=os.path.abspath(keep) if keep else None)
+
+
+def _cached_parquet(
+    name: str, key: str, build: Callable[[], pd.DataFrame]
+) -> pd.DataFrame:
+    """
+    Return the frame stored as CACHE_DIR/<name>-<key>.parquet, or build,
+    store and return it.
+    """
+    path = os.path.join(CACHE_DIR, f"{name}-{key}.parquet")
+
+    if os.path.exists(path):
+        with profiling.stage(f"{name}_cache_read", LAST_STAGE_TIMINGS) as rec:
+            frame = pd.read_parquet(path)
+            os.utime(path)  # mark as recently used
+            rec["rows"] = len(frame)
+        return frame
+
+    frame = build()
+
+    with profiling.stage(f"{name}_cache_write", LAST_STAGE_TIMINGS) as rec:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        _evict_cache(keep=path)
+        rec["rows"] = len(frame)
+
+    return frame
+
+
+def preprocess_cached(
+    raw: Union[pd.DataFrame, str], source: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    preprocess_with_spark with a Parquet cache in front of it:
+    a hit is a single Parquet read, a miss runs Spark and stores the result.
+    """
+    LAST_STAGE_TIMINGS.clear()
+    LAST_MEMORY_MB.clear()
+    return _cached_parquet(
+        "cleaned",
+        _input_fingerprint(raw),
+        lambda: preprocess_with_spark(raw, source=source),
+    )
+
+
+def featurize_cached(
+    raw: Union[pd.DataFrame, str], source: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Cleaned data plus the feature columns from features.add_features,
+    cached next to the cleaned frame so training and prediction reuse it.
+    On a hit neither cleaning nor featurizing runs.
+    """
+    LAST_STAGE_TIMINGS.clear()
+    LAST_MEMORY_MB.clear()
+    input_key = _input_fingerprint(raw)
+
+    def build() -> pd.DataFrame:
+        cleaned = _cached_parquet(
+            "cleaned", input_key, lambda: preprocess_with_spark(raw, source=source)
+        )
+        with profiling.stage("features", LAST_STAGE_TIMINGS) as rec:
+            featurized = features.add_features(cleaned)
+            rec["rows"] = len(featurized)
+        return featurized
+
+    return _cached_parquet("features", _features_key(input_key), build)
+
+
+def _features_key(input_key: str) -> str:
+    return f"{input_key}-f{features.FEATURES_VERSION}"
+
+
+def featurized_cache_path(
+    raw: Union[pd.DataFrame, str], source: Optional[str] = None, out_of_core: bool = False
+) -> str:
+    """
+    Path of the featurize_cached Parquet entry for `raw`, building it first
+    if needed (used by the out-of-core trainer and the MLlib engine, which
+    read the file themselves). With `out_of_core` and a CSV path, a missing
+    entry is built by featurize_with_spark, so the whole dataset is never
+    held in driver memory.
+    """
+    path = os.path.join(CACHE_DIR, f"features-{_features_key(_input_fingerprint(raw))}.parquet")
+    if os.path.exists(path):
+        os.utime(path)  # mark as recently used
+        return path
+    if out_of_core and isinstance(raw, str):
+        LAST_STAGE_TIMINGS.clear()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            featurize_with_spark(raw, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _evict_cache(keep=path)
+    else:
+        featurize_cached(raw, source=source)
+    return path
+
+
+def featurize_with_spark(path: str, output_path: str) -> int:
+    """
+    features.add_features for inputs larger than driver memory. Spark
+    cleans the CSV (read_csv_with_spark) and writes it to a scratch table
+    bucketed by account (features.ACCOUNT_KEYS), about
+    FEATURE_BUCKET_ROWS rows per bucket; the buckets are then featurized
+    one at a time and appended to a single Parquet file at `output_path`.
+    Every account sits in exactly one bucket, so lag features still see
+    its whole history. Category codes follow the sorted values of the
+    whole input, like the in-memory path. Returns the number of rows.
+    """
+    from pyspark.sql import functions as F
+
+    with profiling.stage("spark_clean_bucket", LAST_STAGE_TIMINGS) as rec:
+        sdf = read_csv_with_spark(path)
+        n_rows = rec["rows"] = sdf.count()
+        n_buckets = max(1, -(-n_rows // FEATURE_BUCKET_ROWS))
+
+        cat_cols = [c for c in water_schema.CATEGORY_COLS if c in sdf.columns]
+        vocab = {}
+        if cat_cols:
+            row = sdf.agg(*[F.array_sort(F.collect_set(c)).alias(c) for c in cat_cols]).first()
+            vocab = {c: list(row[c]) for c in cat_cols}
+
+        # Dates as wall-clock text, so no time zone applies between Spark and pandas
+        for col in [TIMESTAMP_COL] + water_schema.DATE_COLS:
+            if col in sdf.columns:
+                sdf = sdf.withColumn(col, F.date_format(col, _BUCKET_TS_SPARK_FORMAT))
+
+        keys = [c for c in features.ACCOUNT_KEYS if c in sdf.columns]
+        bucket = F.pmod(F.hash(*keys), F.lit(n_buckets)) if keys else F.lit(0)
+        scratch = f"{output_path}.buckets"
+        sdf.withColumn(_BUCKET_COL, bucket).write.mode("overwrite").partitionBy(_BUCKET_COL).parquet(scratch)
+
+    try:
+        with profiling.stage("features", LAST_STAGE_TIMINGS) as rec:
+            rec["rows"] = featurize_buckets(scratch, n_buckets, vocab, output_path)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return rec["rows"]
+
+
+def featurize_buckets(
+    bucket_dir: str, n_buckets: int, category_vocab: Dict[str, List[str]], output_path: str
+) -> int:
+    """
+    Second half of featurize_with_spark: read the cleaned rows of one
+    bucket (a <_BUCKET_COL>=<i> partition of `bucket_dir`) at a time, add
+    the features with `category_vocab` and append them to `output_path`.
+    Every bucket is written with the schema of the first one, widened to
+    the scratch table's own column types (a column can be all-null in one
+    bucket and not in another). Date columns arrive as text in
+    _BUCKET_TS_FORMAT.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    dataset = ds.dataset(bucket_dir, format="parquet", partitioning="hive")
+    date_cols = [TIMESTAMP_COL] + water_schema.DATE_COLS
+    raw_types = {f.name: f.type for f in dataset.schema if f.name != _BUCKET_COL}
+    columns = list(raw_types)
+    # Only non-date columns keep the scratch type; dates are parsed below
+    raw_types = {col: t for col, t in raw_types.items() if col not in date_cols}
+    writer = None
+    rows = 0
+    try:
+        for i in range(n_buckets):
+            table = dataset.to_table(columns=columns, filter=ds.field(_BUCKET_COL) == i)
+            if not table.num_rows:
+                continue
+            cleaned = water_schema.apply_schema(table.to_pandas(), parse_dates=False)
+            for col in date_cols:
+                if col in cleaned.columns:
+                    cleaned[col] = pd.to_datetime(cleaned[col], format=_BUCKET_TS_FORMAT)
+            # Every value is already in the vocabulary; the copy keeps it unchanged
+            vocab = {col: list(values) for col, values in category_vocab.items()}
+            featurized = data_lake.normalize_dtypes(features.add_features(cleaned, category_vocab=vocab))
+            if writer is None:
+                schema = pa.Schema.from_pandas(featurized, preserve_index=False)
+                schema = pa.schema([
+                    pa.field(f.name, raw_types.get(f.name, f.type)) for f in schema
+                ])
+                writer = pq.ParquetWriter(output_path, schema)
+            writer.write_table(pa.Table.from_pandas(featurized, schema=writer.schema, preserve_index=False))
+            rows += len(featurized)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def cleaned_cache_path(
+    raw: Union[pd.DataFrame, str], source: Optional[str] = None
+) -> str:
+    """
+    Path of the preprocess_cached Parquet entry for `raw` (cleaned rows,
+    no feature columns), building it first if needed.
+    """
+    path = os.path.join(CACHE_DIR, f"cleaned-{_input_fingerprint(raw)}.parquet")
+    if not os.path.exists(path):
+        preprocess_cached(raw, source=source)
+    return path
+
+
+# Hyperparameters of the default model; part of the registry key
+RF_PARAMS = {
+    "n_estimators": 200,
+    "random_state": 42,
+}
+HGB_PARAMS = {
+    "max_iter": 200,
+    "learning_rate": 0.1,
+    "random_state": 42,
+}
+TEST_SIZE = 0.2
+SPLIT_SEED = 42
+
+# Estimator backends selectable in train_model: (class import path,
+# hyperparameters, runtime-only kwargs); the class is imported on first use
+ESTIMATORS = {
+    "random_forest": ("sklearn.ensemble.RandomForestRegressor", RF_PARAMS, {"n_jobs": -1}),
+    "hist_gradient_boosting": ("sklearn.ensemble.HistGradientBoostingRegressor", HGB_PARAMS, {}),
+}
+DEFAULT_ESTIMATOR = "random_forest"
+
+# Where train_model fits: scikit-learn in driver memory, Spark MLlib across
+# partitions (spark_ml), or "auto": Spark from SPARK_ENGINE_MIN_ROWS rows
+ENGINES = ["sklearn", "spark", "auto"]
+SPARK_ENGINE_MIN_ROWS = 5_000_000
+
+
+def make_estimator(
+    name: str = DEFAULT_ESTIMATOR, params: Optional[Dict[str, Any]] = None
+) -> "RegressorMixin":
+    """
+    Unfitted regressor for one of the ESTIMATORS backends; `params`
+    overrides its default hyperparameters (e.g. the best tuning result).
+    """
+    if name not in ESTIMATORS:
+        raise ValueError(f"Unknown estimator '{name}', expected one of {sorted(ESTIMATORS)}")
+    cls_path, defaults, runtime = ESTIMATORS[name]
+    module, cls_name = cls_path.rsplit(".", 1)
+    cls = getattr(importlib.import_module(module), cls_name)
+    return cls(**dict(defaults, **(params or {})), **runtime)
+
+
+def resolve_engine(data: Union[pd.DataFrame, str, "SparkDataFrame"], engine: str = "auto") -> str:
+    """
+    'sklearn' or 'spark' for training on `data`. 'auto' goes by row count:
+    len() of a pandas frame, the Parquet footers of a path; a Spark
+    DataFrame always stays on Spark.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    if engine != "auto":
+        return engine
+    if isinstance(data, pd.DataFrame):
+        n_rows = len(data)
+    elif isinstance(data, str):
+        import pyarrow.dataset as ds
+
+        n_rows = ds.dataset(data, format="parquet").count_rows()
+    else:
+        return "spark"
+    return "spark" if n_rows >= SPARK_ENGINE_MIN_ROWS else "sklearn"
+
+
+def _registry_params(estimator: str, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return dict(
+        ESTIMATORS[estimator][1],
+        **(params or {}),
+        estimator=estimator,
+        test_size=TEST_SIZE,
+        split_seed=SPLIT_SEED,
+    )
+
+
+def training_registry_key(
+    df: pd.DataFrame, estimator: str = DEFAULT_ESTIMATOR, params: Optional[Dict[str, Any]] = None
+) -> str:
     """
-    Train RandomForest on numeric columns, return model + metrics.
+    Registry key train_model(df, estimator=..., params=...) stores its
+    scikit-learn model under.
     """
+    feature_cols = features.feature_columns(df)
+    fingerprint = model_registry.data_fingerprint(df, feature_cols + [TARGET_COL])
+    return model_registry.registry_key(fingerprint, _registry_params(estimator, params))
+
+
+def train_model(
+    df: Union[pd.DataFrame, str, "SparkDataFrame"],
+    force_retrain: bool = False,
+    estimator: str = DEFAULT_ESTIMATOR,
+    params: Optional[Dict[str, Any]] = None,
+    engine: str = "sklearn",
+) -> Tuple["RegressorMixin", Dict[str, float]]:
+    """
+    Train RandomForest (or another ESTIMATORS backend, e.g.
+    'hist_gradient_boosting') on the numeric columns (raw fields +
+    engineered features, see features.feature_columns), return model + metrics.
+
+    The model registry is checked first: if a model was already trained on
+    identical data with the same hyperparameters it is loaded instead.
+    `force_retrain=True` always fits a fresh model. `params` overrides the
+    estimator's default hyperparameters.
+
+    `engine` (see ENGINES / resolve_engine) 'spark' fits the MLlib
+    counterpart of `estimator` instead (spark_ml.train_spark_model): `df`
+    may then also be a Parquet path or a Spark DataFrame, and `params` are
+    MLlib parameters. A Parquet path is read into memory for 'sklearn'.
+    """
+    if resolve_engine(df, engine) == "spark":
+        from spark_ml import train_spark_model
+
+        return train_spark_model(df, force_retrain=force_retrain, estimator=estimator, params=params)
+    if isinstance(df, str):
+        df = pd.read_parquet(df)
+
+    from sklearn.model_selection import train_test_split
+
     if TARGET_COL not in df.columns:
         # Fallback if renaming didn't happen or column missing
         raise ValueError(f"Missing target column: {TARGET_COL}")
 
-    feature_cols = [
-        c for c in df.columns
-        if c != TARGET_COL and pd.api.types.is_numeric_dtype(df[c])
-    ]
+    feature_cols = features.feature_columns(df)
 
     if not feature_cols:
         raise ValueError("No numeric feature columns found to train on.")
 
+    model = make_estimator(estimator, params)
+    params = _registry_params(estimator, params)
+    fingerprint = model_registry.data_fingerprint(df, feature_cols + [TARGET_COL])
+    key = model_registry.registry_key(fingerprint, params)
+
+    entry = None if force_retrain else model_registry.load_compatible(key, feature_cols)
+    if entry is not None:
+        model, meta = entry
+        return model, meta["metrics"]
+
     X = df[feature_cols]
     y = df[TARGET_COL]
 
     X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
+        X, y, test_size=TEST_SIZE, random_state=SPLIT_SEED
     )
 
-    model = RandomForestRegressor(
-        n_estimators=200,
-        n_jobs=-1,
-        random_state=42
+    with profiling.stage("fit") as rec:
+        model.fit(X_train, y_train)
+        rec["rows"] = len(X_train)
+
+    with profiling.stage("evaluate") as rec:
+        y_pred = model.predict(X_test)
+        rec["rows"] = len(X_test)
+
+    metrics = model_registry.regression_metrics(y_test, y_pred)
+
+    # Category -> code mapping the model was fitted with, reapplied at predict time
+    model.category_vocab_ = features.extract_category_vocab(df)
+
+    model_registry.save_model(
+        key,
+        model,
+        {
+            "feature_cols": feature_cols,
+            "data_fingerprint": fingerprint,
+            "params": params,
+            "metrics": metrics,
+            "category_vocab": model.category_vocab_,
+            "n_rows": len(df),
+        },
+        latest_path=MODEL_PATH,
     )
-    model.fit(X_train, y_train)
+    return model, metrics
 
-    y_pred = model.predict(X_test)
 
-    # NOTE: no 'squared' kwarg here (for older sklearn compat)
-    mse = mean_squared_error(y_test, y_pred)
-    rmse = float(mse ** 0.5)
+def _model_feature_cols(model: "RegressorMixin", df: pd.DataFrame) -> List[str]:
+    """
+    Columns the model was fitted on (sklearn records them when fitting on a
+    DataFrame); falls back to recomputing them from the frame.
+    """
+    names = getattr(model, "feature_names_in_", None)
+    if names is not None:
+        return list(names)
+    return features.feature_columns(df)
 
-    metrics = {
-        "r2": float(r2_score(y_test, y_pred)),
-        "rmse": rmse,
-    }
 
-    os.makedirs(MODEL_DIR, exist_ok=True)
-    joblib.dump(model, MODEL_PATH)
+def model_inputs(
+    model: "RegressorMixin",
+    df: pd.DataFrame,
+    category_vocab: Optional[Dict[str, List[Optional[str]]]] = None,
+) -> pd.DataFrame:
+    """
+    The columns `model` predicts from, with the category codes recomputed
+    from the raw category columns under the vocabulary the model was
+    trained with (`category_vocab`, by default the model's own
+    category_vocab_), so a frame featurized on its own codes the same
+    value the same way.
+    """
+    X = df[_model_feature_cols(model, df)]
+    if category_vocab is None:
+        category_vocab = getattr(model, "category_vocab_", None)
+    if category_vocab:
+        codes = features.category_codes(df, category_vocab)
+        X = X.assign(**{col: values for col, values in codes.items() if col in X.columns})
+    return X
 
-    return model, metrics
+
+def predict_with_model(
+    model: "RegressorMixin",
+    df: pd.DataFrame,
+    inplace: bool = False,
+    category_vocab: Optional[Dict[str, List[Optional[str]]]] = None,
+) -> pd.DataFrame:
+    """
+    Add the Predicted_Bill_Amount column. With `inplace=True` the column is
+    added to `df` itself instead of to a copy of the whole frame.
+    `category_vocab` overrides the model's own (see model_inputs).
+    """
+    with profiling.stage("predict") as rec:
+        preds = model.predict(model_inputs(model, df, category_vocab))
+        rec["rows"] = len(df)
+    df2 = df if inplace else df.copy()
+    df2[features.PREDICTION_COL] = preds
+    return df2
 
 
-def predict_with_model(model: RandomForestRegressor, df: pd.DataFrame) -> pd.DataFrame:
-    feature_cols = [
-        c for c in df.columns
-        if c != TARGET_COL and pd.api.types.is_numeric_dtype(df[c])
+def score_with_spark(
+    model: "RegressorMixin",
+    data: Union[str, pd.DataFrame, "SparkDataFrame"],
+    output_path: str,
+    partition_by: Optional[List[str]] = None,
+    category_vocab: Optional[Dict[str, List[Optional[str]]]] = None,
+) -> str:
+    """
+    Batch scoring on Spark: the model is broadcast once to the executors and
+    applied to each partition's Arrow batches with mapInPandas; predictions
+    go straight to Parquet at `output_path`, never through the driver.
+    The output is laid out like a data_lake table: partitioned by year/month
+    of Date_Time (+ `partition_by` columns), rows sorted by Date_Time.
+
+    `data` may be a Parquet path (e.g. a featurize_cached entry), a pandas
+    frame or a Spark DataFrame that already holds the feature columns.
+    Category codes are recomputed with the model's vocabulary (or
+    `category_vocab`), as in predict_with_model.
+    """
+    from pyspark.sql.types import DoubleType, StructField, StructType
+
+    spark = get_spark()
+    if isinstance(data, str):
+        sdf = spark.read.parquet(data)
+    elif isinstance(data, pd.DataFrame):
+        sdf = spark.createDataFrame(data, schema=_spark_schema(data))
+    else:
+        sdf = data
+
+    feature_cols = getattr(model, "feature_names_in_", None)
+    if feature_cols is None:
+        raise ValueError("Model was not fitted on a DataFrame; feature columns unknown.")
+    feature_cols = list(feature_cols)
+    missing = [c for c in feature_cols if c not in sdf.columns]
+    if missing:
+        raise ValueError(f"Missing feature columns for scoring: {missing}")
+
+    from spark_ml import SparkRegressionModel
+
+    if category_vocab is None:
+        category_vocab = getattr(model, "category_vocab_", None)
+
+    if isinstance(model, SparkRegressionModel):
+        # Already a Spark pipeline: applied where the rows are, nothing to broadcast
+        sdf = _recode_with_spark(sdf, category_vocab or {}, feature_cols)
+        write_partitioned_with_spark(model.transform(sdf), output_path, partition_by)
+        return output_path
+
+    model_bc = spark.sparkContext.broadcast(model)
+    out_schema = StructType(
+        sdf.schema.fields + [StructField(features.PREDICTION_COL, DoubleType(), nullable=True)]
+    )
+
+    def score(batches):
+        batch_model = model_bc.value
+        for pdf in batches:
+            pdf[features.PREDICTION_COL] = batch_model.predict(model_inputs(batch_model, pdf, category_vocab))
+            yield pdf
+
+    write_partitioned_with_spark(sdf.mapInPandas(score, schema=out_schema), output_path, partition_by)
+    return output_path
+
+
+def _recode_with_spark(
+    sdf: "SparkDataFrame", category_vocab: Dict[str, List[Optional[str]]], feature_cols: List[str]
+) -> "SparkDataFrame":
+    """
+    features.category_codes on Spark: the code columns in `feature_cols`
+    recomputed from their raw category column with a literal map.
+    """
+    from pyspark.sql import functions as F
+
+    for col, vocab in category_vocab.items():
+        code_col = features.code_column(col)
+        if col not in sdf.columns or code_col not in feature_cols:
+            continue
+        pairs = [(value, code) for code, value in enumerate(vocab) if value is not None]
+        recoded = F.lit(-1)
+        if pairs:
+            mapping = F.create_map(*[F.lit(x) for pair in pairs for x in pair])
+            recoded = F.coalesce(mapping[F.col(col).cast("string")], recoded)
+        existing = F.coalesce(F.col(code_col), F.lit(-1)) if code_col in sdf.columns else F.lit(-1)
+        sdf = sdf.withColumn(
+            code_col, F.when(F.col(col).isNull(), existing).otherwise(recoded).cast("short")
+        )
+    return sdf
+
+
+def write_partitioned_with_spark(
+    sdf: "SparkDataFrame", output_path: str, partition_by: Optional[List[str]] = None
+) -> None:
+    """
+    Write `sdf` to Parquet in the data_lake layout: partitioned by
+    year/month of Date_Time (+ `partition_by` columns), rows sorted by
+    Date_Time within each file. Without Date_Time it is written flat.
+    """
+    from pyspark.sql import functions as F
+
+    writer_cols: List[str] = []
+    if TIMESTAMP_COL in sdf.columns:
+        writer_cols = data_lake.PARTITION_COLS + list(partition_by or [])
+        sdf = (
+            sdf
+            .withColumn("year", F.year(TIMESTAMP_COL))
+            .withColumn("month", F.month(TIMESTAMP_COL))
+            # One writer task per directory, rows in time order within it
+            .repartition(*writer_cols)
+            .sortWithinPartitions(*writer_cols, TIMESTAMP_COL)
+        )
+    writer = sdf.write.mode("overwrite")
+    if writer_cols:
+        writer = writer.partitionBy(*writer_cols)
+    writer.parquet(output_path)
+
+
+def build_cube_with_spark(predicted: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregate row-level predictions on Spark into the analytics cube, one
+    row per (Month, Dimension, Value):
+    - Dimension/Value = CUBE_ALL for the monthly totals, otherwise one of
+      CUBE_DIMENSIONS and its value (missing values as "Unknown")
+    - Bills, Actual_Total, Predicted_Total, Mean_Error, Mean_Abs_Error and
+      approximate Error_P<q> quantiles of (predicted - actual)
+    """
+    from pyspark.sql import functions as F
+
+    spark = get_spark()
+    dims = [c for c in CUBE_DIMENSIONS if c in predicted.columns]
+    pdf = predicted[[TIMESTAMP_COL, TARGET_COL, features.PREDICTION_COL] + dims]
+    pdf = pdf.astype({c: "string" for c in dims})
+
+    sdf = spark.createDataFrame(pdf, schema=_spark_schema(pdf)).select(
+        F.date_trunc("month", F.col(TIMESTAMP_COL)).alias("Month"),
+        F.col(TARGET_COL).alias("actual"),
+        F.col(features.PREDICTION_COL).alias("predicted"),
+        (F.col(features.PREDICTION_COL) - F.col(TARGET_COL)).alias("error"),
+        *[F.coalesce(F.col(c), F.lit("Unknown")).alias(c) for c in dims],
+    ).cache()
+
+    aggs = [
+        F.count(F.lit(1)).alias("Bills"),
+        F.sum("actual").alias("Actual_Total"),
+        F.sum("predicted").alias("Predicted_Total"),
+        F.avg("error").alias("Mean_Error"),
+        F.avg(F.abs("error")).alias("Mean_Abs_Error"),
+        F.percentile_approx("error", CUBE_QUANTILES).alias("quantiles"),
+    ]
+    parts = [
+        sdf.groupBy("Month").agg(*aggs)
+        .withColumn("Dimension", F.lit(CUBE_ALL))
+        .withColumn("Value", F.lit(CUBE_ALL))
     ]
+    for dim in dims:
+        parts.append(
+            sdf.groupBy("Month", F.col(dim).alias("Value")).agg(*aggs)
+            .withColumn("Dimension", F.lit(dim))
+        )
 
-    preds = model.predict(df[feature_cols])
-    df2 = df.copy()
-    df2["Predicted_Bill_Amount"] = preds
-    return df2
+    cube = reduce(lambda a, b: a.unionByName(b), parts).select(
+        "Month", "Dimension", "Value", "Bills", "Actual_Total", "Predicted_Total",
+        "Mean_Error", "Mean_Abs_Error",
+        *[F.col("quantiles")[i].alias(f"Error_P{int(q * 100)}") for i, q in enumerate(CUBE_QUANTILES)],
+    )
+    out = cube.toPandas()
+    sdf.unpersist()
+
+    out = out.sort_values(["Dimension", "Value", "Month"], ignore_index=True)
+    return out.astype({"Dimension": "category", "Value": "category", "Bills": "int64"})
+
+
+def analytics_cube_cached(
+    raw: Union[pd.DataFrame, str], predicted: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    build_cube_with_spark persisted in the Parquet cache next to the cleaned
+    and featurized entries for `raw`; keyed on the predictions too, so a
+    different model gets its own cube.
+    """
+    prediction_key = model_registry.data_fingerprint(predicted, [features.PREDICTION_COL])
+    key = f"{_features_key(_input_fingerprint(raw))}-{prediction_key}-c{CUBE_VERSION}"
+
+    def build() -> pd.DataFrame:
+        with profiling.stage("cube", LAST_STAGE_TIMINGS) as rec:
+            cube = build_cube_with_spark(predicted)
+            rec["rows"] = len(cube)
+        return cube
+
+    return _cached_parquet("cube", key, build)
 
 
-def run_full_pipeline_from_df(raw_df: pd.DataFrame):
+def run_full_pipeline_from_df(
+    raw_df: Union[pd.DataFrame, str],
+    source: Optional[str] = None,
+    use_cache: bool = True,
+    force_retrain: bool = False,
+    progress: Optional[Callable[[str], None]] = None,
+    estimator: str = DEFAULT_ESTIMATOR,
+    engine: str = "sklearn",
+    segment_by: Optional[str] = None,
+    segment_backend: str = "process",
+):
     """
     Entry point used by Streamlit:
-    - Pandas + Spark cleaning
-    - Train RF model
+    - Pandas + Spark cleaning (or native Spark CSV read if given a path)
+      and feature engineering, served from the Parquet cache when the
+      input hasn't changed
+    - Train RF model, or the `estimator` backend chosen
+      (or reuse the registered one for identical data)
     - Predict & return metrics
+
+    With `segment_by` (a column such as Borough) one smaller model is trained
+    per segment instead, concurrently on `segment_backend` ('process' or
+    'spark', see segment_models), and each row is predicted by its
+    segment's model; `engine` is then not used.
+
+    `progress`, if given, is called with the name of each stage as it starts.
     """
-    cleaned = preprocess_with_spark(raw_df)
-    model, metrics = train_model(cleaned)
-    predicted = predict_with_model(model, cleaned)
+    report = progress or (lambda stage: None)
+
+    report("cleaning")
+    with profiling.stage("cleaning") as rec:
+        if use_cache:
+            cleaned = featurize_cached(raw_df, source=source)
+        else:
+            cleaned = features.add_features(preprocess_with_spark(raw_df, source=source))
+        rec["rows"] = len(cleaned)
+
+    report("training")
+    with profiling.stage("training") as rec:
+        if segment_by:
+            from segment_models import train_segment_models
+
+            model, metrics = train_segment_models(
+                cleaned, segment_by, force_retrain=force_retrain, estimator=estimator, backend=segment_backend
+            )
+        else:
+            model, metrics = train_model(cleaned, force_retrain=force_retrain, estimator=estimator, engine=engine)
+        rec["rows"] = len(cleaned)
+
+    report("predicting")
+    with profiling.stage("predicting") as rec:
+        predicted = predict_with_model(model, cleaned, inplace=True)
+        rec["rows"] = len(predicted)
     return predicted, metrics
 
 
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Clean, featurize and train (or reuse) the water bill model.")
+    parser.add_argument("--data", default="dataset/Water_Consumption_And_Cost__2013_-_Feb_2023_.csv",
+                        help="CSV path or glob")
+    parser.add_argument("--estimator", default=DEFAULT_ESTIMATOR, choices=sorted(ESTIMATORS))
+    parser.add_argument("--force-retrain", action="store_true")
+    parser.add_argument("--engine", default="auto", choices=ENGINES,
+                        help=f"Train with scikit-learn or Spark MLlib; auto = Spark from {SPARK_ENGINE_MIN_ROWS:,} rows")
+    parser.add_argument("--spark-master", help="Spark master URL, e.g. local[*] (default: Spark's own)")
+    parser.add_argument("--score-output",
+                        help="Also batch-score on Spark and write predictions to this year/month partitioned Parquet path")
+    parser.add_argument("--lake", nargs="?", const=data_lake.LAKE_DIR,
+                        help=f"Write cleaned and predicted rows as partitioned Parquet tables under this directory "
+                             f"(default {data_lake.LAKE_DIR})")
+    parser.add_argument("--partition-by", nargs="+", default=[],
+                        help="(lake / score-output) also partition by these columns, e.g. Borough")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Train from a float32 memmap of the feature cache instead of in-memory frames")
+    parser.add_argument("--sample-size", type=int, help="(out-of-core) fit on a stratified sample of this many rows")
+    parser.add_argument("--shards", type=int, default=1, help="(out-of-core) fit on this many bootstrap shards")
+    parser.add_argument("--tune", action="store_true",
+                        help="Cross-validated hyperparameter search before the final fit")
+    parser.add_argument("--cv", default="kfold", choices=["kfold", "rolling"], help="(tune) CV scheme")
+    parser.add_argument("--folds", type=int, default=5, help="(tune) number of folds")
+    parser.add_argument("--search", default="grid", choices=["grid", "random"], help="(tune) search strategy")
+    parser.add_argument("--n-iter", type=int, default=10, help="(tune) candidates for random search")
+    parser.add_argument("--segment-by",
+                        help="Train one model per value of this column (e.g. Borough) and route predictions by it")
+    parser.add_argument("--segment-backend", default="process", choices=["process", "spark"],
+                        help="(segment-by) fit the segments in a local process pool or with Spark applyInPandas")
+    parser.add_argument("--workers", type=int, help="(tune / segment-by) process pool size")
+    parser.add_argument("--budget", type=float, help="(tune) wall-clock budget in seconds")
+    parser.add_argument("--incremental", choices=["warm_start", "retrain"],
+                        help="Only process rows past the stored Date_Time watermark, then update the model")
+    parser.add_argument("--profile-log", help="Append per-stage timings (JSON lines) to this file")
+    parser.add_argument("--profile-dir", help="Write a cProfile dump of the run to this directory")
+    args = parser.parse_args()
+
+    if args.profile_log or args.profile_dir:
+        profiling.configure(
+            log_path=args.profile_log or profiling.PROFILE_LOG,
+            profile_dir=args.profile_dir or profiling.PROFILE_DIR,
+        )
+    if args.spark_master:
+        get_spark(master=args.spark_master)
+    with profiling.run("cli") as records:
+        _run_cli(args)
+    if args.profile_log or args.profile_dir:
+        for rec in records:
+            rows = f"{rec['rows']:>12,}" if rec["rows"] is not None else " " * 12
+            print(f"{'  ' * rec['depth']}{rec['stage'].rsplit('/', 1)[-1]:<32} {rec['wall_s']:8.2f}s wall "
+                  f"{rec['cpu_s']:8.2f}s cpu {rows} rows")
+
+
+def _run_cli(args) -> None:
+    if args.incremental:
+        from incremental import run_incremental
+
+        new_rows, metrics = run_incremental(args.data, mode=args.incremental)
+        if not new_rows:
+            print("No rows past the watermark; nothing to do.")
+            return
+        print(f"Ingested {new_rows:,} new rows")
+        print(f"R²: {metrics['r2']:.4f}  RMSE: {metrics['rmse']:.4f}")
+        return
+
+    if args.tune:
+        from tuning import tune_and_train
+
+        model, metrics, search = tune_and_train(
+            args.data,
+            estimator=args.estimator,
+            force_retrain=args.force_retrain,
+            scheme=args.cv,
+            n_splits=args.folds,
+            search=args.search,
+            n_iter=args.n_iter,
+            max_workers=args.workers,
+            time_budget_s=args.budget,
+        )
+        best = search["best"]
+        print(f"Best of {len(search['results'])} candidates ({args.cv}, {best['folds']} folds): "
+              f"{best['params']}  CV RMSE {best['rmse']:.4f} ± {best['rmse_std']:.4f}"
+              + ("  [budget reached]" if search["timed_out"] else ""))
+        featurized = featurize_cached(args.data)
+    elif args.out_of_core:
+        from out_of_core import train_out_of_core
+
+        # Features are built bucket by bucket through Spark, never in memory
+        featurized = featurized_cache_path(args.data, out_of_core=True)
+        model, metrics = train_out_of_core(
+            featurized,
+            estimator=args.estimator,
+            sample_size=args.sample_size,
+            n_shards=args.shards,
+            force_retrain=args.force_retrain,
+        )
+        print(f"Peak RSS: {metrics['peak_rss_mb']:,.0f} MB")
+    elif args.segment_by:
+        from segment_models import train_segment_models
+
+        featurized = featurize_cached(args.data)
+        model, metrics = train_segment_models(
+            featurized,
+            args.segment_by,
+            force_retrain=args.force_retrain,
+            estimator=args.estimator,
+            backend=args.segment_backend,
+            max_workers=args.workers,
+        )
+        print(f"Segments: {metrics['segments']} models by {args.segment_by} (+ fallback)")
+    else:
+        engine = args.engine
+        if engine != "sklearn":
+            # Features built through Spark (featurize_with_spark): no rows are
+            # collected to the driver, and auto counts rows from the Parquet footers
+            featurized = featurized_cache_path(args.data, out_of_core=True)
+            engine = resolve_engine(featurized, engine)
+        # Spark trains straight from the Parquet feature cache; sklearn reads
+        # the same cache entry into memory
+        featurized = featurized if engine == "spark" else featurize_cached(args.data)
+        model, metrics = train_model(
+            featurized, force_retrain=args.force_retrain, estimator=args.estimator, engine=engine
+        )
+        print(f"Engine: {engine}")
+    print(f"R²: {metrics['r2']:.4f}  RMSE: {metrics['rmse']:.4f}")
+
+    if args.lake:
+        cleaned_dir = os.path.join(args.lake, os.path.basename(data_lake.CLEANED_DIR))
+        predicted_dir = os.path.join(args.lake, os.path.basename(data_lake.PREDICTED_DIR))
+        # lake/cleaned holds the cleaned rows without feature columns, as
+        # written by clean_water_data.py --lake
+        with profiling.stage("lake_write") as rec:
+            if isinstance(featurized, str):
+                # Out-of-core / Spark: Spark cleans the CSV again and writes both
+                # tables, so the rows never pass through the driver
+                write_partitioned_with_spark(read_csv_with_spark(args.data), cleaned_dir, args.partition_by)
+                score_with_spark(model, featurized, predicted_dir, partition_by=args.partition_by)
+            else:
+                cleaned_path = cleaned_cache_path(args.data)
+                data_lake.write_partitioned(pd.read_parquet(cleaned_path), cleaned_dir, partition_by=args.partition_by)
+                predicted = predict_with_model(model, featurized)
+                rec["rows"] = data_lake.write_partitioned(predicted, predicted_dir, partition_by=args.partition_by)
+        print(f"Cleaned and predicted rows written to {cleaned_dir} and {predicted_dir}")
+
+    if args.score_output:
+        # Spark reads the feature cache itself; the rows never pass through the driver
+        score_with_spark(
+            model, featurized_cache_path(args.data, out_of_core=True), args.score_output,
+            partition_by=args.partition_by,
+        )
+        print(f"Predictions written to {args.score_output}")
+
+
 # Expose constants for Streamlit
 __all__ = [
     "run_full_pipeline_from_df",
+    "get_spark",
+    "start_spark_warmup",
+    "read_csv_with_spark",
+    "preprocess_cached",
+    "featurize_cached",
+    "featurized_cache_path",
+    "cleaned_cache_path",
+    "build_cube_with_spark",
+    "analytics_cube_cached",
+    "make_estimator",
+    "training_registry_key",
+    "resolve_engine",
+    "score_with_spark",
+    "model_inputs",
+    "write_partitioned_with_spark",
+    "ESTIMATORS",
+    "ENGINES",
+    "stop_spark",
+    "LAST_STAGE_TIMINGS",
+    "LAST_MEMORY_MB",
     "TIMESTAMP_COL",
     "TARGET_COL",
+    "CUBE_ALL",
+    "CUBE_DIMENSIONS",
 ]
+
+
+if __name__ == "__main__":
+    main()
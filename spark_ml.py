@@ -0,0 +1,287 @@
+# spark_ml.py
+"""
+Spark MLlib training engine: the featurized rows stay in Spark, features
+are assembled with VectorAssembler and a RandomForestRegressor or
+GBTRegressor is fitted across partitions, so training is not bounded by
+driver memory. r2 / rmse come from RegressionEvaluator on a held-out split,
+like train_model's.
+
+Used by train_model(..., engine="spark"), or engine="auto" for inputs of
+spark_app.SPARK_ENGINE_MIN_ROWS rows or more. Models are saved as Spark pipelines
+under SPARK_MODEL_DIR and registered in model_registry through
+SparkRegressionModel, which also gives them a scikit-learn style predict().
+"""
+
+import glob
+import hashlib
+import importlib
+import json
+import os
+import shutil
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import features
+import model_registry
+import profiling
+import water_schema
+from spark_app import (
+    SPLIT_SEED,
+    TARGET_COL,
+    TEST_SIZE,
+    _spark_schema,
+    get_spark,
+)
+
+if TYPE_CHECKING:
+    from pyspark.ml import PipelineModel
+    from pyspark.sql import DataFrame as SparkDataFrame
+
+
+SPARK_MODEL_DIR = os.path.join("model", "spark")
+
+# train_model estimator name -> (MLlib class import path, default params).
+# Gradient boosting maps to GBTRegressor, MLlib's boosted trees.
+SPARK_ESTIMATORS = {
+    "random_forest": (
+        "pyspark.ml.regression.RandomForestRegressor",
+        {"numTrees": 200, "maxDepth": 12, "maxBins": 64, "seed": 42},
+    ),
+    "hist_gradient_boosting": (
+        "pyspark.ml.regression.GBTRegressor",
+        {"maxIter": 200, "stepSize": 0.1, "maxDepth": 5, "maxBins": 64, "seed": 42},
+    ),
+}
+
+FEATURES_VECTOR_COL = "features_vector"
+# Suffix of the median-imputed copies of the feature columns
+IMPUTED_SUFFIX = "__imputed"
+
+
+def _to_spark(data: Union[pd.DataFrame, str, "SparkDataFrame"]) -> "SparkDataFrame":
+    spark = get_spark()
+    if isinstance(data, str):
+        return spark.read.parquet(data)
+    if isinstance(data, pd.DataFrame):
+        return spark.createDataFrame(data, schema=_spark_schema(data))
+    return data
+
+
+def _fingerprint(data: Union[pd.DataFrame, str, "SparkDataFrame"], sdf: "SparkDataFrame", cols: List[str]) -> str:
+    """
+    Registry fingerprint without collecting the data: file sizes / mtimes
+    of a Parquet path, the content hash of a pandas frame, or for a Spark
+    DataFrame a row count and order-independent sum of row hashes computed
+    on the executors (its plan alone says nothing about the data read).
+    """
+    from pyspark.sql import functions as F
+
+    if isinstance(data, str):
+        return model_registry.path_fingerprint(data, cols)
+    if isinstance(data, pd.DataFrame):
+        return model_registry.data_fingerprint(data, cols)
+    row = sdf.select(
+        F.count(F.lit(1)).alias("rows"),
+        F.sum(F.xxhash64(*cols).cast("decimal(38,0)")).alias("hash"),
+    ).first()
+    payload = json.dumps({"columns": cols, "rows": row["rows"], "hash": str(row["hash"])})
+    return "spark-" + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def _category_vocab(sdf: "SparkDataFrame") -> Dict[str, List[Optional[str]]]:
+    """
+    features.extract_category_vocab on Spark: only one (code, value) row per
+    code comes back to the driver.
+    """
+    from pyspark.sql import functions as F
+
+    vocab = {}
+    for col in water_schema.CATEGORY_COLS:
+        code_col = features.code_column(col)
+        if col not in sdf.columns or code_col not in sdf.columns:
+            continue
+        rows = (
+            sdf.where(F.col(code_col) >= 0)
+            .groupBy(code_col)
+            .agg(F.first(F.col(col).cast("string"), ignorenulls=True).alias("value"))
+            .collect()
+        )
+        values = {int(row[code_col]): row["value"] for row in rows}
+        vocab[col] = [values.get(code) for code in range(max(values) + 1)] if values else []
+    return vocab
+
+
+def _as_double(sdf: "SparkDataFrame", cols: List[str]) -> "SparkDataFrame":
+    # Imputer and VectorAssembler want numeric doubles; other columns pass through
+    wanted = set(cols)
+    return sdf.select(*[sdf[c].cast("double").alias(c) if c in wanted else sdf[c] for c in sdf.columns])
+
+
+def build_pipeline(feature_cols: List[str], estimator: str, params: Dict[str, Any]):
+    """
+    Unfitted MLlib pipeline: median-impute the features (MLlib trees don't
+    take nulls), assemble them into one vector, fit the regressor.
+    """
+    from pyspark.ml import Pipeline
+    from pyspark.ml.feature import Imputer, VectorAssembler
+
+    cls_path, _ = SPARK_ESTIMATORS[estimator]
+    module, cls_name = cls_path.rsplit(".", 1)
+    regressor_cls = getattr(importlib.import_module(module), cls_name)
+
+    imputed = [f"{c}{IMPUTED_SUFFIX}" for c in feature_cols]
+    return Pipeline(stages=[
+        Imputer(inputCols=feature_cols, outputCols=imputed, strategy="median"),
+        VectorAssembler(inputCols=imputed, outputCol=FEATURES_VECTOR_COL),
+        regressor_cls(
+            featuresCol=FEATURES_VECTOR_COL,
+            labelCol=TARGET_COL,
+            predictionCol=features.PREDICTION_COL,
+            **params,
+        ),
+    ])
+
+
+class SparkRegressionModel:
+    """
+    A fitted MLlib pipeline saved at `path`, usable where train_model's
+    scikit-learn models are: feature_names_in_ and predict(X) on a pandas
+    frame (run through Spark), plus transform() for Spark DataFrames.
+    Pickles as its path only, so it can sit in model_registry.
+    """
+
+    def __init__(self, path: str, feature_cols: List[str], estimator: str):
+        self.path = path
+        self.feature_names_in_ = np.asarray(feature_cols, dtype=object)
+        self.estimator = estimator
+        self.category_vocab_: Dict[str, List[Optional[str]]] = {}
+        self._pipeline: Optional["PipelineModel"] = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_pipeline"] = None
+        return state
+
+    @property
+    def pipeline(self) -> "PipelineModel":
+        if self._pipeline is None:
+            from pyspark.ml import PipelineModel
+
+            get_spark()
+            self._pipeline = PipelineModel.load(self.path)
+        return self._pipeline
+
+    def transform(self, sdf: "SparkDataFrame") -> "SparkDataFrame":
+        """
+        `sdf` plus the Predicted_Bill_Amount column (helper columns dropped).
+        """
+        feature_cols = list(self.feature_names_in_)
+        out = self.pipeline.transform(_as_double(sdf, feature_cols))
+        helpers = [f"{c}{IMPUTED_SUFFIX}" for c in feature_cols] + [FEATURES_VECTOR_COL]
+        return out.drop(*helpers)
+
+    def predict(self, X: pd.DataFrame) -> np.ndarray:
+        # Every stage is row-wise, so rows come back in input order
+        sdf = _to_spark(X[list(self.feature_names_in_)])
+        preds = self.transform(sdf).select(features.PREDICTION_COL).toPandas()
+        return preds[features.PREDICTION_COL].to_numpy(dtype=np.float64)
+
+
+def _evict_orphans() -> None:
+    """
+    Remove saved pipelines whose registry entry has been evicted.
+    """
+    live = {meta["key"] for meta in model_registry.list_models()}
+    for path in glob.glob(os.path.join(SPARK_MODEL_DIR, "*")):
+        if os.path.basename(path) not in live:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def train_spark_model(
+    data: Union[pd.DataFrame, str, "SparkDataFrame"],
+    force_retrain: bool = False,
+    estimator: str = "random_forest",
+    params: Optional[Dict[str, Any]] = None,
+) -> Tuple[SparkRegressionModel, Dict[str, float]]:
+    """
+    train_model on Spark. `data` is a featurized pandas frame, a Parquet
+    path (e.g. featurized_cache_path) or a Spark DataFrame; of the rows,
+    only row counts and the metrics come back to the driver. `params` overrides
+    the MLlib hyperparameters of SPARK_ESTIMATORS. The registry is checked
+    first, as in train_model.
+    """
+    from pyspark.ml.evaluation import RegressionEvaluator
+
+    if estimator not in SPARK_ESTIMATORS:
+        raise ValueError(f"Unknown Spark estimator '{estimator}', expected one of {sorted(SPARK_ESTIMATORS)}")
+
+    sdf = _to_spark(data)
+    if TARGET_COL not in sdf.columns:
+        raise ValueError(f"Missing target column: {TARGET_COL}")
+    # Column selection works on the (empty) pandas view of the schema
+    feature_cols = features.feature_columns(sdf.limit(0).toPandas())
+    if not feature_cols:
+        raise ValueError("No numeric feature columns found to train on.")
+
+    params = dict(SPARK_ESTIMATORS[estimator][1], **(params or {}))
+    registry_params = dict(
+        params,
+        estimator=estimator,
+        engine="spark",
+        test_size=TEST_SIZE,
+        split_seed=SPLIT_SEED,
+    )
+    fingerprint = _fingerprint(data, sdf, feature_cols + [TARGET_COL])
+    key = model_registry.registry_key(fingerprint, registry_params)
+
+    entry = None if force_retrain else model_registry.load_compatible(key, feature_cols)
+    # The registry only holds a handle; the pipeline itself may have been evicted
+    if entry is not None and os.path.isdir(entry[0].path):
+        model, meta = entry
+        return model, meta["metrics"]
+
+    rows = _as_double(sdf.select(*feature_cols, TARGET_COL), feature_cols + [TARGET_COL])
+    rows = rows.dropna(subset=[TARGET_COL])
+    train, test = rows.randomSplit([1.0 - TEST_SIZE, TEST_SIZE], seed=SPLIT_SEED)
+    # Tree learners make one pass over the training rows per level
+    train = train.cache()
+
+    try:
+        with profiling.stage("fit") as rec:
+            n_train = rec["rows"] = train.count()
+            fitted = build_pipeline(feature_cols, estimator, params).fit(train)
+    finally:
+        train.unpersist()
+
+    with profiling.stage("evaluate") as rec:
+        predictions = fitted.transform(test).cache()
+        n_test = rec["rows"] = predictions.count()
+        evaluator = RegressionEvaluator(labelCol=TARGET_COL, predictionCol=features.PREDICTION_COL)
+        metrics = {
+            "r2": float(evaluator.evaluate(predictions, {evaluator.metricName: "r2"})),
+            "rmse": float(evaluator.evaluate(predictions, {evaluator.metricName: "rmse"})),
+        }
+        predictions.unpersist()
+
+    path = os.path.join(SPARK_MODEL_DIR, key)
+    fitted.write().overwrite().save(path)
+    model = SparkRegressionModel(path, feature_cols, estimator)
+    model._pipeline = fitted
+    model.category_vocab_ = _category_vocab(sdf)
+
+    model_registry.save_model(
+        key,
+        model,
+        {
+            "feature_cols": feature_cols,
+            "data_fingerprint": fingerprint,
+            "params": registry_params,
+            "metrics": metrics,
+            "category_vocab": model.category_vocab_,
+            "n_rows": n_train + n_test,
+        },
+    )
+    _evict_orphans()
+    return model, metrics
@@ -1,13 +1,131 @@
 # streamlit_app.py
 
 import io
-import matplotlib.pyplot as plt
+import os
+import threading
+import time
+import zipfile
 import pandas as pd
 import streamlit as st
-import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from fpdf import FPDF
-from spark_app import run_full_pipeline_from_df, TARGET_COL, TIMESTAMP_COL
+from charting import POINT_BUDGET, render_png
+import profiling
+from reports import MONTH_SEGMENT, generate_pdf_report, generate_segment_reports
+from spark_app import (
+    run_full_pipeline_from_df,
+    analytics_cube_cached,
+    start_spark_warmup,
+    CUBE_ALL,
+    DEFAULT_ESTIMATOR,
+    ESTIMATORS,
+    LAST_MEMORY_MB,
+    LAST_STAGE_TIMINGS,
+)
+
+DATA_PATH = "dataset/Water_Consumption_And_Cost__2013_-_Feb_2023_.csv"
+
+# Pipeline stages reported by run_full_pipeline_from_df, in order
+# (plus the analytics cube built afterwards)
+PIPELINE_STAGES = ["queued", "cleaning", "training", "predicting", "aggregating", "done"]
+# Finished pipeline results kept in memory (least recently used dropped first)
+MAX_JOBS = 4
+
+
+class PipelineRunner:
+    """
+    Runs the Spark + RandomForest pipeline on a background thread.
+    One instance is shared by every browser session (st.cache_resource), so
+    sessions asking for the same input wait on the same job instead of
+    starting their own, and the MAX_JOBS most recently used finished
+    results stay in memory for reruns.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline")
+        self._jobs = OrderedDict()
+
+    def get(self, key, path, force_retrain=False, estimator=DEFAULT_ESTIMATOR):
+        """
+        Return the job for `key`, starting it if there is none yet.
+        `force_retrain` replaces a finished job with a fresh retrain.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or (force_retrain and job["future"].done()):
+                job = {"stage": "queued", "started": time.time(), "timings": {}, "memory_mb": {}, "profile": []}
+                job["future"] = self._executor.submit(
+                    self._run, job, path, force_retrain, estimator
+                )
+                self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            self._evict()
+            return job
+
+    def _evict(self):
+        # Oldest finished jobs first; running ones are never dropped
+        finished = [k for k, j in self._jobs.items() if j["future"].done()]
+        for key in finished[:max(0, len(self._jobs) - MAX_JOBS)]:
+            del self._jobs[key]
+
+    def clear(self):
+        with self._lock:
+            self._jobs = OrderedDict((k, j) for k, j in self._jobs.items() if not j["future"].done())
+
+    @staticmethod
+    def _run(job, path, force_retrain, estimator):
+        def progress(stage):
+            job["stage"] = stage
+
+        with profiling.run("pipeline") as records:
+            predicted, metrics = run_full_pipeline_from_df(
+                path, force_retrain=force_retrain, progress=progress, estimator=estimator
+            )
+            progress("aggregating")
+            with profiling.stage("aggregating") as rec:
+                cube = analytics_cube_cached(path, predicted)
+                rec["rows"] = len(cube)
+        job["profile"] = records
+        job["timings"] = dict(LAST_STAGE_TIMINGS)
+        job["memory_mb"] = dict(LAST_MEMORY_MB)
+        job["stage"] = "done"
+        return predicted, metrics, cube
+
+
+@st.cache_resource
+def get_pipeline_runner():
+    return PipelineRunner()
+
+
+@st.cache_resource
+def warm_up_spark():
+    """
+    Start the Spark session in the background, once per server, so the
+    page renders (and cached results show) while the JVM starts.
+    """
+    return start_spark_warmup()
+
+
+def dataset_key(path):
+    """
+    Cache key for a dataset: changes whenever the file is modified.
+    """
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def render_chart_png(kind, key, _df, max_points=POINT_BUDGET):
+    """
+    Render one chart to PNG bytes. Cached per (chart kind, pipeline run,
+    point budget), so reruns and other sessions reuse the image instead of
+    re-plotting.
+    """
+    return render_png(kind, _df, max_points)
+
+
 def inject_css():
     # Hardcoded Dark Theme Colors
     bg = "#000000"          # Pure black
@@ -201,99 +319,39 @@ def inject_css():
         unsafe_allow_html=True,
     )
 
-def generate_pdf_report(df, metrics, charts):
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 10, "Water Bill Prediction Report", ln=True, align="C")
-
-    pdf.ln(4)
-    pdf.set_font("Arial", "", 11)
-    pdf.multi_cell(
-        0,
-        6,
-        "This report summarizes Spark preprocessing and RandomForest predictions "
-        "for Water Bill amounts based on the uploaded dataset.",
+def stage_breakdown(records):
+    """
+    profiling records as a table, nested stages indented under their parent.
+    """
+    if not records:
+        return pd.DataFrame()
+    df = pd.DataFrame(records)
+    return pd.DataFrame({
+        "Stage": ["\u2003" * d + name.rsplit("/", 1)[-1] for d, name in zip(df["depth"], df["stage"])],
+        "Depth": df["depth"],
+        "Wall (s)": df["wall_s"].round(3),
+        "CPU (s)": df["cpu_s"].round(3),
+        "Peak RSS (MB)": df["peak_rss_mb"].round(1),
+        "RSS growth (MB)": df["rss_growth_mb"].round(1),
+        "Rows": df["rows"].astype("Int64"),
+    })
+
+def cube_segment_table(cube, dimension):
+    """
+    One row per value of `dimension`, summed over all months. Quantiles
+    don't add up across months, so only the additive measures are shown.
+    """
+    rows = cube[cube["Dimension"] == dimension]
+    table = rows.groupby("Value", observed=True).agg(
+        Bills=("Bills", "sum"),
+        Actual_Total=("Actual_Total", "sum"),
+        Predicted_Total=("Predicted_Total", "sum"),
     )
-
-    pdf.ln(4)
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 8, "Model Performance", ln=True)
-
-    pdf.set_font("Arial", "", 11)
-    pdf.cell(0, 6, f"R² Score: {metrics['r2']:.4f}", ln=True)
-    pdf.cell(0, 6, f"RMSE: {metrics['rmse']:.4f}", ln=True)
-
-    pdf.ln(4)
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 8, "Dataset Overview", ln=True)
-
-    pdf.set_font("Arial", "", 11)
-    pdf.cell(0, 6, f"Rows: {len(df)}", ln=True)
-    pdf.cell(0, 6, f"Columns: {len(df.columns)}", ln=True)
-    import matplotlib.pyplot as plt
-    import tempfile
-    for title, fig in charts.items():
-        pdf.add_page()
-        pdf.set_font("Arial", "B", 13)
-        pdf.cell(0, 8, title, ln=True)
-
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-            fig.savefig(tmp.name, bbox_inches="tight")
-            pdf.image(tmp.name, x=10, y=28, w=190)
-        plt.close(fig)
-    pdf_bytes = pdf.output(dest="S").encode("latin-1")
-    return pdf_bytes
-
-def plot_time_series(df):
-    if TIMESTAMP_COL not in df.columns or TARGET_COL not in df.columns:
-        return None
-    df2 = df.copy()
-    df2[TIMESTAMP_COL] = pd.to_datetime(df2[TIMESTAMP_COL])
-    df2 = df2.sort_values(TIMESTAMP_COL)
-
-    fig, ax = plt.subplots(figsize=(8, 3))
-    ax.plot(df2[TIMESTAMP_COL], df2[TARGET_COL], label="Actual Bill", linewidth=1.2)
-    if "Predicted_Bill_Amount" in df2.columns:
-        ax.plot(
-            df2[TIMESTAMP_COL],
-            df2["Predicted_Bill_Amount"],
-            linestyle="--",
-            label="Predicted Bill",
-            linewidth=1.1,
-        )
-    ax.set_title("Actual vs Predicted Bill Over Time")
-    ax.set_xlabel("Time")
-    ax.set_ylabel("Amount")
-    ax.legend()
-    plt.xticks(rotation=25)
-    plt.tight_layout()
-    return fig
-
-def plot_actual_vs_pred_scatter(df):
-    if "Predicted_Bill_Amount" not in df.columns or TARGET_COL not in df.columns:
-        return None
-    fig, ax = plt.subplots(figsize=(4.5, 3.2))
-    ax.scatter(df[TARGET_COL], df["Predicted_Bill_Amount"], alpha=0.4)
-    ax.set_title("Actual vs Predicted (Scatter)")
-    ax.set_xlabel("Actual Bill")
-    ax.set_ylabel("Predicted Bill")
-    plt.tight_layout()
-    return fig
-
-def plot_error_hist(df):
-    if "Predicted_Bill_Amount" not in df.columns or TARGET_COL not in df.columns:
-        return None
-    errors = df["Predicted_Bill_Amount"] - df[TARGET_COL]
-    fig, ax = plt.subplots(figsize=(4.5, 3.2))
-    ax.hist(errors, bins=40)
-    ax.set_title("Prediction Error Distribution")
-    ax.set_xlabel("Error (Predicted - Actual)")
-    ax.set_ylabel("Frequency")
-    plt.tight_layout()
-    return fig
+    # Bill-weighted means of the monthly means
+    for col in ["Mean_Error", "Mean_Abs_Error"]:
+        weighted = (rows[col] * rows["Bills"]).groupby(rows["Value"], observed=True).sum()
+        table[col] = weighted / table["Bills"]
+    return table.sort_values("Bills", ascending=False).reset_index()
 
 def main():
     # Force simple dark theme
@@ -423,25 +481,13 @@ def main():
         unsafe_allow_html=True,
     )
 
-    # Load local dataset directly
-    df = None
-    try:
-        df = pd.read_csv("dataset/Water_Consumption_And_Cost__2013_-_Feb_2023_.csv")
-        
-        # Rename columns to match Water Bill terminology immediately
-        rename_map = {
-            "Service End Date": "Date_Time",
-            "Current Charges": "Water_Bill_Amount",
-            "Charging_Load_kW": "Water_Bill_Amount"
-        }
-        df = df.rename(columns=rename_map)
-        
-        st.success("Loaded local dataset: `dataset/Water_Consumption_And_Cost__2013_-_Feb_2023_.csv`")
-        st.success("Loaded local dataset: `dataset/Water_Consumption_And_Cost__2013_-_Feb_2023_.csv`")
-        # st.dataframe(df.head(), use_container_width=True) # Hidden as per request
-    except Exception as e:
-        st.error(f"Failed to load local dataset: {e}")
+    # Spark reads the CSV itself (explicit schema, pruned columns),
+    # so the raw file never has to sit in driver memory as a pandas frame
+    if not os.path.exists(DATA_PATH):
+        st.error(f"Failed to load local dataset: {DATA_PATH} not found")
         return
+    st.success(f"Using local dataset: `{DATA_PATH}`")
+    warm_up_spark()
 
     # ---------- RUN PIPELINE ----------
     st.markdown(
@@ -457,14 +503,55 @@ def main():
         unsafe_allow_html=True,
     )
 
-    with st.spinner("Running Spark preprocessing and training RandomForest model…"):
-        try:
-            predicted_df, metrics = run_full_pipeline_from_df(df)
-        except Exception as e:
-            st.error(f"Pipeline failed: {e}")
-            return
+    runner = get_pipeline_runner()
+    estimator = st.selectbox(
+        "Model",
+        list(ESTIMATORS),
+        index=list(ESTIMATORS).index(DEFAULT_ESTIMATOR),
+        format_func=lambda name: name.replace("_", " ").title(),
+    )
+    key = f"{dataset_key(DATA_PATH)}|{estimator}"
+
+    col_retrain, col_clear = st.columns(2)
+    with col_retrain:
+        force_retrain = st.button("Retrain model (ignore the saved model)")
+    with col_clear:
+        if st.button("Clear cached results"):
+            runner.clear()
+            render_chart_png.clear()
+
+    job = runner.get(key, DATA_PATH, force_retrain=force_retrain, estimator=estimator)
+
+    # Page stays interactive while the job runs; poll until it finishes
+    if not job["future"].done():
+        stage = job["stage"]
+        step = PIPELINE_STAGES.index(stage) if stage in PIPELINE_STAGES else 0
+        st.progress(
+            step / (len(PIPELINE_STAGES) - 1),
+            text=f"Running Spark + RandomForest pipeline: {stage}… "
+                 f"({time.time() - job['started']:.0f}s elapsed)",
+        )
+        time.sleep(1.0)
+        st.rerun()
+
+    try:
+        predicted_df, metrics, cube = job["future"].result()
+    except Exception as e:
+        st.error(f"Pipeline failed: {e}")
+        runner.clear()
+        return
 
     st.success("Pipeline completed successfully ✅")
+    if job["timings"]:
+        st.caption(
+            "Spark stages — "
+            + " · ".join(f"{name}: {secs:.2f}s" for name, secs in job["timings"].items())
+        )
+    if job["memory_mb"]:
+        st.caption(
+            f"Cleaned data in memory — {job['memory_mb']['before']:,.1f} MB untyped → "
+            f"{job['memory_mb']['after']:,.1f} MB with water_schema dtypes"
+        )
 
     # ---------- METRICS + DATA SUMMARY ----------
     rows, cols = predicted_df.shape
@@ -521,34 +608,124 @@ def main():
         unsafe_allow_html=True,
     )
 
+    max_points = st.select_slider(
+        "Chart point budget",
+        options=[500, 1000, 2000, 5000, 10000],
+        value=POINT_BUDGET,
+        help="Points drawn per series; larger scatters are shown as a density plot.",
+    )
+    # Breakdown views read the pre-aggregated cube, not the row-level frame
+    dimensions = [CUBE_ALL] + [d for d in cube["Dimension"].cat.categories if d != CUBE_ALL]
+    col_dim, col_value = st.columns(2)
+    with col_dim:
+        dimension = st.selectbox("Break down by", dimensions)
+    segment_table = None
+    value = CUBE_ALL
+    if dimension != CUBE_ALL:
+        segment_table = cube_segment_table(cube, dimension)
+        with col_value:
+            value = st.selectbox(dimension, segment_table["Value"].tolist())
+    cube_rows = cube[(cube["Dimension"] == dimension) & (cube["Value"] == value)]
+
+    # {page title: PNG} as shown here, reused by the PDF report
     charts = {}
 
-    # TIME SERIES
-    fig_ts = plot_time_series(predicted_df)
-    if fig_ts:
-        st.markdown('<div class="ev-chart-card">', unsafe_allow_html=True)
-        st.pyplot(fig_ts)  # FIXED
-        st.markdown("</div>", unsafe_allow_html=True)
-        charts["Actual vs Predicted Bill Over Time"] = fig_ts
-
-    # SCATTER
-    fig_scatter = plot_actual_vs_pred_scatter(predicted_df)
-    if fig_scatter:
-        st.markdown('<div class="ev-chart-card" style="margin-top:1rem;">', unsafe_allow_html=True)
-        st.pyplot(fig_scatter)  # FIXED
-        st.markdown("</div>", unsafe_allow_html=True)
-        charts["Actual vs Predicted Scatter"] = fig_scatter
-
-    # ERROR HIST
-    fig_err = plot_error_hist(predicted_df)
-    if fig_err:
-        st.markdown('<div class="ev-chart-card" style="margin-top:1rem;">', unsafe_allow_html=True)
-        st.pyplot(fig_err)  # FIXED
-        st.markdown("</div>", unsafe_allow_html=True)
-        charts["Prediction Error Distribution"] = fig_err
-
-
-    # Export section removed as per request
+    chart_specs = [
+        ("cube_time_series", "Actual vs Predicted Bill Over Time"
+         + ("" if dimension == CUBE_ALL else f" ({dimension}: {value})"), "", cube_rows, f"{dimension}={value}"),
+        ("scatter", "Actual vs Predicted Scatter", ' style="margin-top:1rem;"', predicted_df, ""),
+        ("error_hist", "Prediction Error Distribution", ' style="margin-top:1rem;"', predicted_df, ""),
+    ]
+    with profiling.run("render") as render_profile:
+        for kind, title, card_style, data, view in chart_specs:
+            with profiling.stage(f"chart_{kind}") as rec:
+                png = render_chart_png(kind, f"{key}|{job['started']}|{view}", data, max_points)
+                rec["rows"] = len(data)
+            if png:
+                st.markdown(f'<div class="ev-chart-card"{card_style}>', unsafe_allow_html=True)
+                st.image(png, use_container_width=True)
+                st.markdown("</div>", unsafe_allow_html=True)
+                charts[title] = png
+
+    if segment_table is not None:
+        st.markdown(f"**{dimension} breakdown** ({len(segment_table):,} values)")
+        st.dataframe(segment_table, use_container_width=True)
+
+    # ---------- EXPORT ----------
+    st.markdown(
+        """
+        <div class="ev-card" style="margin-top:1.8rem; margin-bottom:1.2rem;">
+        <div class="ev-section-title">5. Export Report</div>
+        <div class="ev-section-caption">
+            PDF with the metrics and charts above, or one PDF per segment (borough, month, ...) in a zip.
+        </div>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+
+    col_report, col_batch = st.columns(2)
+    with col_report:
+        if st.button("Build PDF report"):
+            with st.spinner("Building report…"), profiling.stage("pdf_report"):
+                st.session_state["report_pdf"] = (
+                    key,
+                    # The PNGs rendered above, so the PDF shows the same views
+                    generate_pdf_report(predicted_df, metrics, charts=charts),
+                )
+        if st.session_state.get("report_pdf", (None,))[0] == key:
+            st.download_button(
+                "Download PDF report",
+                st.session_state["report_pdf"][1],
+                file_name=f"water_bill_report_{datetime.now():%Y%m%d_%H%M}.pdf",
+                mime="application/pdf",
+            )
+
+    with col_batch:
+        segment_by = st.selectbox(
+            "Per-segment reports by",
+            [MONTH_SEGMENT] + [d for d in dimensions if d != CUBE_ALL],
+        )
+        if st.button("Build segment reports"):
+            with st.spinner(f"Rendering one report per {segment_by}…"), profiling.stage("segment_reports"):
+                paths = generate_segment_reports(
+                    predicted_df, segment_by, output_dir=os.path.join("reports", segment_by),
+                    max_points=max_points,
+                )
+                buf = io.BytesIO()
+                with zipfile.ZipFile(buf, "w") as zf:
+                    for path in paths:
+                        zf.write(path, arcname=os.path.basename(path))
+                st.session_state["segment_reports"] = (key, segment_by, len(paths), buf.getvalue())
+        saved = st.session_state.get("segment_reports")
+        if saved and saved[0] == key:
+            st.download_button(
+                f"Download {saved[2]} reports by {saved[1]} (zip)",
+                saved[3],
+                file_name=f"water_bill_reports_by_{saved[1]}.zip",
+                mime="application/zip",
+            )
+
+
+    # ---------- STAGE BREAKDOWN ----------
+    st.markdown(
+        """
+        <div class="ev-card" style="margin-top:1.8rem; margin-bottom:1.2rem;">
+        <div class="ev-section-title">6. Stage Breakdown</div>
+        <div class="ev-section-caption">
+            Wall time, CPU time, peak memory and rows per stage of the pipeline run and of this page render.
+        </div>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+    profile = stage_breakdown(job["profile"] + render_profile)
+    if profile.empty:
+        st.caption("No stage timings recorded for this run.")
+    else:
+        top = profile[profile["Depth"] == 1]
+        st.bar_chart(top.set_index("Stage")["Wall (s)"], horizontal=True)
+        st.dataframe(profile.drop(columns="Depth"), use_container_width=True, hide_index=True)
 
 
 if __name__ == "__main__":
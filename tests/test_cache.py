@@ -0,0 +1,26 @@
+import os
+
+import pandas as pd
+
+import spark_app
+
+
+def test_entry_over_the_byte_cap_survives_its_own_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(spark_app, "CACHE_DIR", str(tmp_path))
+    # Every entry is over the cap on its own
+    monkeypatch.setattr(spark_app, "CACHE_MAX_BYTES", 1)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return pd.DataFrame({"x": range(100)})
+
+    spark_app._cached_parquet("features", "old", build)
+    spark_app._cached_parquet("features", "new", build)
+    assert os.path.exists(tmp_path / "features-new.parquet")
+    # Older entries still make room for it
+    assert not os.path.exists(tmp_path / "features-old.parquet")
+
+    # Second call is a cache hit, not a rebuild
+    spark_app._cached_parquet("features", "new", build)
+    assert len(builds) == 2
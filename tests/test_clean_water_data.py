@@ -0,0 +1,45 @@
+import pandas as pd
+
+import clean_water_data
+import water_schema
+from benchmarks.synthetic_data import generate_water_frame
+
+
+def _write_fixture(path):
+    df = generate_water_frame(3_000, seed=7)
+    # Real meter numbers are alphanumeric
+    df["Meter Number"] = "K" + df["Meter Number"].astype(str)
+    df.to_csv(path, index=False)
+
+
+def test_streaming_matches_in_memory(tmp_path):
+    raw = tmp_path / "raw.csv"
+    _write_fixture(raw)
+
+    clean_water_data.clean_in_memory(str(raw), str(tmp_path / "memory.parquet"))
+    clean_water_data.clean_streaming(str(raw), str(tmp_path / "stream.parquet"), chunksize=700)
+
+    memory = pd.read_parquet(tmp_path / "memory.parquet")
+    stream = pd.read_parquet(tmp_path / "stream.parquet")
+
+    assert memory.dtypes.to_dict() == stream.dtypes.to_dict()
+    pd.testing.assert_frame_equal(memory, stream)
+    assert pd.api.types.is_datetime64_any_dtype(stream["Service Start Date"])
+    assert stream["Meter Number"].notna().all()
+    assert stream["Meter Number"].str.startswith("K").all()
+
+
+def test_cleaned_output_keeps_the_schema_dtypes(tmp_path):
+    raw = tmp_path / "raw.csv"
+    _write_fixture(raw)
+
+    cleaned = clean_water_data.clean_in_memory(str(raw), str(tmp_path / "memory.parquet"))
+    stream = pd.read_parquet(tmp_path / "memory.parquet")
+    for df in (cleaned, stream):
+        assert isinstance(df["Borough"].dtype, pd.CategoricalDtype)
+        assert str(df["EDP"].dtype) == "Int32"
+        assert str(df["# days"].dtype) == "float32"
+        assert str(df["Water&Sewer Charges"].dtype) == "float64"
+
+    # Still as compact as the typed read, not widened back to strings / float64
+    assert water_schema.memory_mb(cleaned) <= 1.2 * water_schema.memory_mb(water_schema.read_water_csv(str(raw)))
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+import features
+
+
+def _featurized(boroughs):
+    df = pd.DataFrame({
+        "Date_Time": pd.date_range("2020-01-01", periods=len(boroughs), freq="MS"),
+        "Borough": pd.Series(boroughs, dtype="category"),
+        "Water_Bill_Amount": np.arange(len(boroughs), dtype=float),
+    })
+    return features.add_features(df)
+
+
+def test_category_codes_follow_the_training_vocabulary():
+    train = _featurized(["BRONX", "QUEENS", None, "BROOKLYN"])
+    vocab = features.extract_category_vocab(train)
+    assert vocab == {"Borough": ["BRONX", "BROOKLYN", "QUEENS"]}
+
+    # Coded on its own, QUEENS would be 0 here
+    new = _featurized(["QUEENS", "STATEN ISLAND", None])
+    codes = features.category_codes(new, vocab)
+    assert codes["Borough_Code"].tolist() == [2, -1, -1]
+
+    # The training frame keeps its own codes
+    assert features.category_codes(train, vocab)["Borough_Code"].tolist() == train["Borough_Code"].tolist()
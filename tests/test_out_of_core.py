@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import out_of_core
+import spark_app
+import tuning
+
+
+def _featurized_parquet(path, n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    consumption = rng.uniform(0, 100, n)
+    # Missing readings, as in the real Consumption (HCF) column
+    consumption[::9] = np.nan
+    pd.DataFrame({
+        "Consumption (HCF)": consumption,
+        "Billing_Period_Days": rng.integers(28, 32, n).astype(float),
+        "Water_Bill_Amount": np.nan_to_num(consumption) * 3.5 + rng.normal(0, 1, n),
+    }).to_parquet(path, index=False)
+
+
+def test_default_fit_works_on_memmaps_with_nans(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _featurized_parquet("features.parquet")
+
+    # No sample / shards: the forest is fitted on the memmap itself
+    model, metrics = out_of_core.train_out_of_core(
+        "features.parquet", estimator="random_forest", work_dir="memmap"
+    )
+    assert metrics["r2"] > 0.5
+    assert list(model.feature_names_in_) == ["Consumption (HCF)", "Billing_Period_Days"]
+    # Published as the latest model like the other trainers' models
+    assert os.path.exists(spark_app.MODEL_PATH)
+
+    # Reused memmaps are still writable by the fit
+    X, _ = out_of_core.parquet_to_memmap("features.parquet", list(model.feature_names_in_), work_dir="memmap")
+    assert X.flags.writeable
+    out_of_core.train_out_of_core(
+        "features.parquet", estimator="random_forest", work_dir="memmap", force_retrain=True
+    )
+
+
+def test_memmaps_are_evicted_like_the_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(spark_app, "CACHE_MAX_ENTRIES", 1)
+    cols = ["Consumption (HCF)", "Billing_Period_Days"]
+    _featurized_parquet("old.parquet")
+    _featurized_parquet("new.parquet", seed=1)
+
+    out_of_core.parquet_to_memmap("old.parquet", cols, work_dir="memmap")
+    tuning.write_fold_blocks("old.parquet", 300, "kfold", 3, work_dir="memmap")
+    out_of_core.parquet_to_memmap("new.parquet", cols, work_dir="memmap")
+    tuning.write_fold_blocks("new.parquet", 300, "kfold", 3, work_dir="memmap")
+
+    # The old arrays and their fold blocks go together
+    assert sorted(os.listdir("memmap")) == ["new.X.f32", "new.kfold3.blocks.npy", "new.y.f32"]
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from benchmarks.bench_timestamp_parse import _legacy_parse_timestamp_series, make_dates
+from spark_app import _parse_timestamp_series
+
+
+def test_matches_the_per_row_parser():
+    dates = make_dates(5_000, seed=3)
+    expected = _legacy_parse_timestamp_series(dates)
+    parsed = _parse_timestamp_series(dates, source="test-legacy")
+    assert expected.isna().equals(parsed.isna())
+    assert (pd.to_datetime(expected[expected.notna()]) == parsed[parsed.notna()]).all()
+    # Second call on the same column goes through the format cache
+    assert _parse_timestamp_series(dates, source="test-legacy").equals(parsed)
+
+
+def test_day_month_order_does_not_depend_on_earlier_files():
+    _parse_timestamp_series(pd.Series(["25/12/2019 08:00"] * 10), source="test-day-month")
+    parsed = _parse_timestamp_series(
+        pd.Series(["03/04/2020 10:00", "25/12/2019 08:00"]), source="test-day-month"
+    )
+    assert parsed.tolist() == [pd.Timestamp("2020-03-04 10:00"), pd.Timestamp("2019-12-25 08:00")]
+
+
+def test_frame_path_parses_the_date_columns_like_the_csv_path():
+    from benchmarks.synthetic_data import generate_water_frame
+    from spark_app import _parse_date_cols
+
+    df = generate_water_frame(500, seed=5)
+    raw = df["Service Start Date"].copy()
+    parsed = _parse_date_cols(df)["Service Start Date"]
+    assert pd.api.types.is_datetime64_any_dtype(parsed)
+    assert parsed.notna().sum() == raw.notna().sum()
+    assert (parsed[raw.notna()] == pd.to_datetime(raw[raw.notna()], format="%m/%d/%Y")).all()
@@ -0,0 +1,36 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import tuning
+
+
+def test_time_budget_returns_the_finished_folds_on_time(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 100, 2_000)
+    pd.DataFrame({
+        "Date_Time": pd.date_range("2015-01-01", periods=len(x), freq="D"),
+        "Consumption (HCF)": x,
+        "Water_Bill_Amount": x * 3.5 + rng.normal(0, 1, len(x)),
+    }).to_parquet("features.parquet", index=False)
+    # One quick candidate and one that can't finish within the budget
+    monkeypatch.setitem(tuning.PARAM_GRIDS, "hist_gradient_boosting", {
+        "max_iter": [10, 1_000_000],
+        "early_stopping": [False],
+    })
+
+    budget = 8.0
+    start = time.monotonic()
+    search = tuning.cross_validate_search(
+        "features.parquet", estimator="hist_gradient_boosting", n_splits=2,
+        max_workers=2, time_budget_s=budget,
+    )
+    elapsed = time.monotonic() - start
+
+    assert search["timed_out"]
+    assert search["best_params"]["max_iter"] == 10
+    assert search["best"]["folds"] == 2
+    # Workers are stopped at the deadline, not waited on
+    assert elapsed < budget + 3
@@ -0,0 +1,247 @@
+# tuning.py
+
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.base import RegressorMixin
+
+import model_registry
+from out_of_core import MEMMAP_DIR, _evict_memmaps, _parquet_feature_cols, parquet_to_memmap
+from process_pools import spawn_pool
+from spark_app import (
+    DEFAULT_ESTIMATOR,
+    SPLIT_SEED,
+    TIMESTAMP_COL,
+    featurize_cached,
+    featurized_cache_path,
+    make_estimator,
+    train_model,
+)
+
+
+# Hyperparameter search space per estimator backend
+PARAM_GRIDS: Dict[str, Dict[str, List[Any]]] = {
+    "random_forest": {
+        "n_estimators": [100, 200],
+        "max_depth": [None, 20],
+        "min_samples_leaf": [1, 5],
+        "max_features": [1.0, 0.5],
+    },
+    "hist_gradient_boosting": {
+        "learning_rate": [0.05, 0.1],
+        "max_iter": [200, 400],
+        "max_leaf_nodes": [31, 63],
+        "l2_regularization": [0.0, 1.0],
+    },
+}
+
+CV_SCHEMES = ["kfold", "rolling"]
+
+
+def candidate_params(
+    estimator: str, search: str = "grid", n_iter: int = 10, seed: int = SPLIT_SEED
+) -> List[Dict[str, Any]]:
+    """
+    Every combination of PARAM_GRIDS[estimator] ('grid'), or `n_iter` of
+    them drawn at random without replacement ('random').
+    """
+    grid = PARAM_GRIDS[estimator]
+    names = sorted(grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+    if search == "random" and n_iter < len(combos):
+        rng = np.random.default_rng(seed)
+        combos = [combos[i] for i in sorted(rng.choice(len(combos), size=n_iter, replace=False))]
+    elif search not in ("grid", "random"):
+        raise ValueError(f"Unknown search '{search}', expected 'grid' or 'random'")
+    return combos
+
+
+def write_fold_blocks(
+    parquet_path: str, n_rows: int, scheme: str, n_splits: int, work_dir: str = MEMMAP_DIR
+) -> str:
+    """
+    Write one block id per row to an .npy file that the workers memory-map:
+    - 'kfold': rows shuffled into n_splits blocks; fold i tests block i
+    - 'rolling': rows ordered by Date_Time into n_splits + 1 blocks;
+      fold i trains on blocks 0..i and tests on block i + 1
+    """
+    if scheme not in CV_SCHEMES:
+        raise ValueError(f"Unknown CV scheme '{scheme}', expected one of {CV_SCHEMES}")
+
+    if scheme == "kfold":
+        rng = np.random.default_rng(SPLIT_SEED)
+        order = rng.permutation(n_rows)
+        n_blocks = n_splits
+    else:
+        ts = pq.read_table(parquet_path, columns=[TIMESTAMP_COL]).column(0)
+        order = np.argsort(ts.to_numpy().astype("datetime64[ns]"), kind="stable")
+        n_blocks = n_splits + 1
+
+    blocks = np.empty(n_rows, dtype=np.int16)
+    blocks[order] = np.arange(n_rows) * n_blocks // n_rows
+
+    base = os.path.splitext(os.path.basename(parquet_path))[0]
+    path = os.path.join(work_dir, f"{base}.{scheme}{n_splits}.blocks.npy")
+    np.save(path, blocks)
+    # Counted with the memmaps of the same file
+    _evict_memmaps(work_dir, keep=base)
+    return path
+
+
+def _fold_indices(blocks: np.ndarray, scheme: str, fold: int) -> Tuple[np.ndarray, np.ndarray]:
+    if scheme == "kfold":
+        return np.flatnonzero(blocks != fold), np.flatnonzero(blocks == fold)
+    return np.flatnonzero(blocks <= fold), np.flatnonzero(blocks == fold + 1)
+
+
+def _evaluate_fold(
+    x_path: str,
+    y_path: str,
+    shape: Tuple[int, int],
+    blocks_path: str,
+    scheme: str,
+    fold: int,
+    estimator: str,
+    params: Dict[str, Any],
+    feature_cols: List[str],
+) -> Dict[str, float]:
+    """
+    Worker: fit one candidate on one fold. Data is memory-mapped from the
+    shared files, only paths and parameters are pickled.
+    """
+    X = np.memmap(x_path, dtype=np.float32, mode="r", shape=shape)
+    y = np.memmap(y_path, dtype=np.float32, mode="r", shape=(shape[0],))
+    blocks = np.load(blocks_path, mmap_mode="r")
+    train_idx, test_idx = _fold_indices(blocks, scheme, fold)
+
+    model = make_estimator(estimator, params)
+    if "n_jobs" in model.get_params():
+        # Parallelism comes from the process pool
+        model.set_params(n_jobs=1)
+
+    start = time.perf_counter()
+    model.fit(pd.DataFrame(X[train_idx], columns=feature_cols), y[train_idx])
+    fit_s = time.perf_counter() - start
+
+    y_test = np.asarray(y[test_idx])
+    y_pred = model.predict(pd.DataFrame(X[test_idx], columns=feature_cols))
+
+    return dict(model_registry.regression_metrics(y_test, y_pred), fit_s=fit_s)
+
+
+def cross_validate_search(
+    parquet_path: str,
+    estimator: str = DEFAULT_ESTIMATOR,
+    scheme: str = "kfold",
+    n_splits: int = 5,
+    search: str = "grid",
+    n_iter: int = 10,
+    max_workers: Optional[int] = None,
+    time_budget_s: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Score every candidate from candidate_params with K-fold or rolling-origin
+    CV, spreading (candidate, fold) fits over a process pool. Workers read
+    the featurized data from shared float32 memmaps instead of pickled copies.
+
+    With `time_budget_s`, once the budget runs out queued work is cancelled
+    and the workers still fitting are terminated, so the search returns on
+    time with the folds finished so far. Only candidates with the most
+    finished folds (normally all of them) are ranked.
+
+    Returns the best params (lowest mean RMSE) and a per-candidate table.
+    """
+    feature_cols = _parquet_feature_cols(parquet_path)
+    X, y = parquet_to_memmap(parquet_path, feature_cols)
+    shape = X.shape
+    blocks_path = write_fold_blocks(parquet_path, shape[0], scheme, n_splits)
+
+    candidates = candidate_params(estimator, search=search, n_iter=n_iter)
+    scores: Dict[int, List[Dict[str, float]]] = {i: [] for i in range(len(candidates))}
+
+    deadline = time.monotonic() + time_budget_s if time_budget_s else None
+    timed_out = False
+
+    pool = spawn_pool(max_workers)
+    try:
+        # Candidate-major order, so early candidates finish all their folds first
+        pending = {
+            pool.submit(
+                _evaluate_fold,
+                X.filename, y.filename, shape, blocks_path, scheme, fold,
+                estimator, params, feature_cols,
+            ): i
+            for i, params in enumerate(candidates)
+            for fold in range(n_splits)
+        }
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                timed_out = True
+                break
+            for future in done:
+                scores[pending.pop(future)].append(future.result())
+    finally:
+        if timed_out:
+            # Waiting for running fits would overrun the budget; stop them instead
+            for process in list((pool._processes or {}).values()):
+                process.terminate()
+        pool.shutdown(wait=not timed_out, cancel_futures=True)
+
+    table = []
+    for i, params in enumerate(candidates):
+        folds = scores[i]
+        if not folds:
+            continue
+        table.append({
+            "params": params,
+            "folds": len(folds),
+            "r2": float(np.mean([f["r2"] for f in folds])),
+            "rmse": float(np.mean([f["rmse"] for f in folds])),
+            "rmse_std": float(np.std([f["rmse"] for f in folds])),
+            "fit_s": float(np.mean([f["fit_s"] for f in folds])),
+        })
+    if not table:
+        raise TimeoutError("Time budget ran out before any fold finished.")
+
+    most_folds = max(row["folds"] for row in table)
+    eligible = [row for row in table if row["folds"] == most_folds]
+    best = min(eligible, key=lambda row: row["rmse"])
+
+    return {
+        "estimator": estimator,
+        "scheme": scheme,
+        "n_splits": n_splits,
+        "best_params": best["params"],
+        "best": best,
+        "results": sorted(table, key=lambda row: row["rmse"]),
+        "timed_out": timed_out,
+    }
+
+
+def tune_and_train(
+    raw: Union[pd.DataFrame, str],
+    estimator: str = DEFAULT_ESTIMATOR,
+    force_retrain: bool = False,
+    **search_kwargs,
+) -> Tuple[RegressorMixin, Dict[str, float], Dict[str, Any]]:
+    """
+    Run cross_validate_search on the featurized data, then train and
+    persist the final model with the winning hyperparameters through
+    train_model (so it lands in the model registry like any other model).
+    """
+    search = cross_validate_search(featurized_cache_path(raw), estimator=estimator, **search_kwargs)
+    model, metrics = train_model(
+        featurize_cached(raw),
+        force_retrain=force_retrain,
+        estimator=estimator,
+        params=search["best_params"],
+    )
+    return model, metrics, search
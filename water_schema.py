@@ -0,0 +1,160 @@
+# water_schema.py
+
+from typing import Dict, Iterator, List, Optional, Union
+
+import pandas as pd
+
+
+TIMESTAMP_COL = "Date_Time"
+# Bill amount the model predicts ("Current Charges" in the raw extract)
+TARGET_COL = "Water_Bill_Amount"
+
+# Low-cardinality text fields of the water extract -> pandas 'category'
+CATEGORY_COLS = [
+    "Development Name",
+    "Borough",
+    "Account Name",
+    "Location",
+    "Meter AMR",
+    "Meter Scope",
+    "RC Code",
+    "Funding Source",
+    "AMP #",
+    "Vendor Name",
+    "Revenue Month",
+    "Estimated",
+    "Rate Class",
+    "Bill Analyzed",
+]
+
+# Text identifiers: kept as strings, never coerced to numbers (meter
+# numbers such as "K13060723" would otherwise become NaN)
+TEXT_COLS = [
+    "Meter Number",
+]
+
+# Numeric fields -> coerced, then downcast to the smallest 'integer' / 'float' type
+# (except CURRENCY_COLS)
+NUMERIC_COLS: Dict[str, str] = {
+    "TDS #": "integer",
+    "EDP": "integer",
+    "UMIS BILL ID": "integer",
+    "# days": "float",
+    "Consumption (HCF)": "float",
+    "Water&Sewer Charges": "float",
+    "Other Charges": "float",
+    "Current Charges": "float",
+    "Charging_Load_kW": "float",
+}
+
+# Money amounts: coerced but kept float64, since float32 drops cents on
+# bills in the thousands
+CURRENCY_COLS = [
+    "Water&Sewer Charges",
+    "Other Charges",
+    "Current Charges",
+]
+
+# Cleaned output (clean_water_data) of the declared non-currency numerics:
+# one dtype per kind in every chunk, unlike apply_schema's downcasts, which
+# depend on the values (the integer fields are ids well within int32)
+CLEANED_NUMERIC_DTYPES = {
+    "integer": "Int32",
+    "float": "float32",
+}
+
+# Date fields, parsed with DATE_FORMAT first and inferred for the rest
+DATE_COLS = [
+    "Service Start Date",
+    "Service End Date",
+]
+DATE_FORMAT = "%m/%d/%Y"
+
+
+def memory_mb(df: pd.DataFrame) -> float:
+    """
+    Resident size of a frame in MB, including Python string objects.
+    """
+    return float(df.memory_usage(deep=True).sum()) / 1024 ** 2
+
+
+def downcast_numeric(df: pd.DataFrame, exclude: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Downcast every numeric column to the smallest type that still holds its
+    values (pandas only goes float64 -> float32 when they round-trip within
+    float tolerance, and ints only to a type wide enough for the range).
+    Float columns in `exclude` (e.g. CURRENCY_COLS and the target) are
+    left as they are.
+    """
+    exclude = set(exclude or [])
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_bool_dtype(s) or not pd.api.types.is_numeric_dtype(s):
+            continue
+        kind = "integer" if pd.api.types.is_integer_dtype(s) else "float"
+        if kind == "float" and col in exclude:
+            continue
+        df[col] = pd.to_numeric(s, downcast=kind)
+    return df
+
+
+def _parse_dates(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    parsed = pd.to_datetime(s, format=DATE_FORMAT, errors="coerce")
+    retry = parsed.isna() & s.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(s[retry], format="mixed", errors="coerce")
+    return parsed
+
+
+def apply_schema(df: pd.DataFrame, parse_dates: bool = True) -> pd.DataFrame:
+    """
+    Give an already loaded frame the declared types: categories for the
+    text fields, strings for the identifiers, coerced + downcast numerics,
+    and parsed dates.
+    Columns that aren't declared are left as they are.
+    """
+    for col in df.columns:
+        if col in CATEGORY_COLS and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+        elif col in TEXT_COLS:
+            df[col] = df[col].astype("string")
+        elif col in NUMERIC_COLS:
+            downcast = None if col in CURRENCY_COLS else NUMERIC_COLS[col]
+            df[col] = pd.to_numeric(df[col], errors="coerce", downcast=downcast)
+        elif parse_dates and col in DATE_COLS:
+            df[col] = _parse_dates(df[col])
+    return df
+
+
+def read_water_csv(
+    path: str, parse_dates: bool = True, **kwargs
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    pd.read_csv with the declared schema. Text fields are read straight into
+    'category' (identifiers into 'string'); numerics and dates are converted right after. Accepts the
+    usual read_csv arguments, including `chunksize` (yields typed chunks).
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    dtype = {c: "category" for c in CATEGORY_COLS if c in header}
+    dtype.update({c: "string" for c in TEXT_COLS if c in header})
+    dtype.update(kwargs.pop("dtype", {}) or {})
+
+    reader = pd.read_csv(path, dtype=dtype, **kwargs)
+    if kwargs.get("chunksize"):
+        return (apply_schema(chunk, parse_dates=parse_dates) for chunk in reader)
+    return apply_schema(reader, parse_dates=parse_dates)
+
+
+def schema_config() -> Dict[str, List[str]]:
+    """
+    The declared schema as plain data (used in cache fingerprints).
+    """
+    return {
+        "category": CATEGORY_COLS,
+        "text": TEXT_COLS,
+        "numeric": [f"{c}:{k}" for c, k in NUMERIC_COLS.items()],
+        "currency": CURRENCY_COLS,
+        "dates": DATE_COLS + [DATE_FORMAT],
+    }